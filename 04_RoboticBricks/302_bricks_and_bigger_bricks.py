@@ -1,9 +1,18 @@
 import compas_rrc as rrc
-from compas.data import json_load
+from compas.data import json_load, json_dump
 import math
+import time
+from collections import deque
 
 from compas.geometry import Frame, Point, Vector
 
+from brick_wall import Brick, BigBrick, BrickCollection
+from brick_index import validate_wall, is_valid, print_validation
+from build_planner import plan_home_returns, count_home_moves, count_baseline_home_moves
+from build_sequence import sequence_bricks, print_report
+import frame_file
+import abb_simulator
+
 
 
 
@@ -21,109 +30,251 @@ SAFE_EXT_AXES = [-1590.0]
 io_open = "doUnitR32ValveB1"
 io_close = "doUnitR32ValveA1"
 
+# Execution mode: True queues instructions and only waits at sync points,
+# False waits for every instruction to finish (send_and_wait)
+PIPELINED = True
+MAX_IN_FLIGHT = 10
+
+# Dry run without ROS and controller: execution times are simulated (abb_simulator.py)
+SIMULATE = False
+# TCP frame at HOME_CONFIG in wobj0 for the simulation, moves from and to home are only timed by their
+# joint values without it
+SIMULATED_HOME_FRAME = None
+
+# Motion profiles: speed (mm/s) and zone per segment type
+#   transit:  joint moves through the home configuration
+#   approach: moves to the safe frame above a pick/place frame
+#   contact:  final move onto the pick/place frame, the gripper actuates here so it stays FINE
+#   retract:  move back up to the safe frame after the gripper actuated
+MOTION_PROFILES = {
+    # Stops at every target, as before the profiles were introduced. Baseline for cycle times.
+    "fine": {
+        "transit": {"speed": 500, "zone": rrc.Zone.FINE},
+        "approach": {"speed": 500, "zone": rrc.Zone.FINE},
+        "contact": {"speed": 50, "zone": rrc.Zone.FINE},
+        "retract": {"speed": 500, "zone": rrc.Zone.FINE},
+    },
+    "Brick": {
+        "transit": {"speed": 500, "zone": rrc.Zone.Z100},
+        "approach": {"speed": 500, "zone": rrc.Zone.Z20},
+        "contact": {"speed": 50, "zone": rrc.Zone.FINE},
+        "retract": {"speed": 500, "zone": rrc.Zone.Z20},
+    },
+    # Heavier and larger: tighter zones so the brick does not swing when cutting corners
+    "BigBrick": {
+        "transit": {"speed": 500, "zone": rrc.Zone.Z50},
+        "approach": {"speed": 500, "zone": rrc.Zone.Z10},
+        "contact": {"speed": 50, "zone": rrc.Zone.FINE},
+        "retract": {"speed": 500, "zone": rrc.Zone.Z10},
+    },
+}
+# Brick type of the exported wall, "brick_type" in the data file takes precedence
+BRICK_TYPE = "BigBrick"
+# Set to "fine" to measure the baseline
+MOTION_PROFILE = None
+BRICK_CLASSES = {"Brick": Brick, "BigBrick": BigBrick}
+
+# Reorder the bricks so every brick is placed after the bricks it rests on, False keeps the file order.
+# Bricks that already come after their supports keep their place in the file order.
+SEQUENCE_BRICKS = False
+# Check the wall for overlapping and floating bricks and blocked approaches before building, stop if it fails
+VALIDATE_WALL = True
+
+# Transfers between the safe pick and safe place frames go straight, without returning home,
+# unless they cross one of these boxes ((min x, y, z), (max x, y, z) in wobj0, mm).
+# Needs the frame of the work object of the build in WOBJ_FRAMES, otherwise (or with False) every transfer goes through home.
+DIRECT_TRANSFERS = True
+FORBIDDEN_REGIONS = [
+    ((-500.0, -500.0, -1000.0), (500.0, 500.0, 3000.0)),  # robot base column
+]
+# Distance transfers keep from the forbidden regions (gripper with brick)
+TRANSFER_CLEARANCE = 150.0
+# Work objects in wobj0 coordinates, add the pallets as measured on the controller.
+WOBJ_FRAMES = {
+    "wobj0": Frame.worldXY(),
+}
+
 ############## Functions
+class Executor:
+    """Sends instructions either one by one (send_and_wait) or pipelined with a bounded number in flight."""
+
+    def __init__(self, abb, pipelined=PIPELINED, max_in_flight=MAX_IN_FLIGHT):
+        self.abb = abb
+        self.pipelined = pipelined
+        self.max_in_flight = max_in_flight
+        self.in_flight = deque()
+        self.sync_times = []
+        # Simulated clients keep their own time
+        self.clock = getattr(abb, "clock", time.perf_counter)
+
+    @property
+    def mode(self):
+        return "pipelined" if self.pipelined else "synchronous"
+
+    def send(self, instruction):
+        if not self.pipelined:
+            return self.abb.send_and_wait(instruction)
+        # Ask for feedback so every queued instruction has a future to wait on
+        instruction.feedback_level = rrc.FeedbackLevel.DONE
+        self.in_flight.append(self.abb.send(instruction))
+        while len(self.in_flight) > self.max_in_flight:
+            self.in_flight.popleft().result()
+
+    def sync(self, mark=True):
+        # Wait until everything sent so far has been executed
+        while self.in_flight:
+            self.in_flight.popleft().result()
+        if mark:
+            self.sync_times.append(self.clock())
+
+
+def report_cycle_times(robot, results_directory, label):
+    # Per-brick cycle time = time between consecutive gripper closes
+    times = robot.sync_times
+    cycles = [t1 - t0 for t0, t1 in zip(times[:-1], times[1:])]
+    if not cycles:
+        return
+    stats = {
+        "label": label,
+        "bricks": len(times),
+        "mean": sum(cycles) / len(cycles),
+        "min": min(cycles),
+        "max": max(cycles),
+        "cycles": cycles,
+    }
+    json_dump(stats, results_directory / ("cycle_times_%s.json" % label))
+
+    # Compare with the last run of every other mode / motion profile
+    print("Per-brick cycle times:")
+    for result_file in sorted(results_directory.glob("cycle_times_*.json")):
+        other = json_load(result_file)
+        print("  %-28s mean %6.2f s (min %.2f s, max %.2f s, %d bricks)%s" % (
+            other["label"], other["mean"], other["min"], other["max"], other["bricks"],
+            "  <- this run" if other["label"] == label else ""))
+
+
+def motion(segment):
+    # Speed and zone for a segment type in the active motion profile
+    return MOTION_PROFILES[MOTION_PROFILE or BRICK_TYPE][segment]
+
+
+def transfer_motion(direct):
+    # Direct transfers were checked for collisions on a straight line, so they have to move linearly
+    return rrc.Motion.LINEAR if direct else rrc.Motion.JOINT
+
+
 def get_safe_frame(frame, offset=300.0):
     pick_frame = Frame(frame.point, frame.xaxis, frame.yaxis)
     safety_frame = pick_frame.translated(Vector(0, 0, offset))
     return safety_frame
 
 
-def pick_a_brick():
+def pick_a_brick(home_before=True, direct=False, home_after=True):
+    # home_before: start with a move to home
+    # direct: the robot comes straight from a safe place frame, approach on a straight line
+    # home_after: return home after picking
     # Set work object
-    abb.send_and_wait(rrc.SetWorkObject("wobj0"))
+    robot.send(rrc.SetWorkObject("wobj0"))
     # Ensure gripper is open
-    abb.send_and_wait(rrc.PrintText("Opening gripper to ensure it's open"))
-    open_gripper(abb)
+    robot.send(rrc.PrintText("Opening gripper to ensure it's open"))
+    open_gripper(robot)
     safe_pick_frame = get_safe_frame(PICK_FRAME, offset=300.0)
     # Go to home position
-    abb.send_and_wait(rrc.PrintText("Moving to home configuration"))
-    abb.send_and_wait(
-        rrc.MoveToJoints(
-            HOME_CONFIG, ext_axes=SAFE_EXT_AXES, speed=500, zone=rrc.Zone.FINE
+    if home_before:
+        robot.send(rrc.PrintText("Moving to home configuration"))
+        robot.send(
+            rrc.MoveToJoints(
+                HOME_CONFIG, ext_axes=SAFE_EXT_AXES, **motion("transit")
+            )
         )
-    )
     # Move to safe pick frame
     # Write message
-    abb.send_and_wait(rrc.PrintText("Moving to safe pick frame"))
+    robot.send(rrc.PrintText("Moving to safe pick frame"))
     print(safe_pick_frame)
-    abb.send_and_wait(
+    robot.send(
         rrc.MoveToRobtarget(
-            safe_pick_frame, ext_axes=SAFE_EXT_AXES, speed=500, zone=rrc.Zone.FINE
+            safe_pick_frame, ext_axes=SAFE_EXT_AXES, motion_type=transfer_motion(direct), **motion("approach")
         )
     )
     # Move to pick frame
-    abb.send_and_wait(rrc.PrintText("Moving to pick frame"))
-    abb.send_and_wait(
+    robot.send(rrc.PrintText("Moving to pick frame"))
+    robot.send(
         rrc.MoveToRobtarget(
-            PICK_FRAME, ext_axes=SAFE_EXT_AXES, speed=50, zone=rrc.Zone.FINE
+            PICK_FRAME, ext_axes=SAFE_EXT_AXES, **motion("contact")
         )
     )
     # Close gripper
-    abb.send_and_wait(rrc.PrintText("Closing gripper to pick brick"))
-    close_gripper(abb)
+    robot.send(rrc.PrintText("Closing gripper to pick brick"))
+    close_gripper(robot)
     # Move back to safe pick frame
-    abb.send_and_wait(rrc.PrintText("Moving back to safe pick frame"))
-    abb.send_and_wait(
+    robot.send(rrc.PrintText("Moving back to safe pick frame"))
+    robot.send(
         rrc.MoveToRobtarget(
-            safe_pick_frame, ext_axes=SAFE_EXT_AXES, speed=500, zone=rrc.Zone.FINE
+            safe_pick_frame, ext_axes=SAFE_EXT_AXES, **motion("retract")
         )
     )
     # Move to home position
-    abb.send_and_wait(rrc.PrintText("Returning to home position"))
-    abb.send_and_wait(
-        rrc.MoveToJoints(
-            HOME_CONFIG, ext_axes=SAFE_EXT_AXES, speed=500, zone=rrc.Zone.FINE
+    if home_after:
+        robot.send(rrc.PrintText("Returning to home position"))
+        robot.send(
+            rrc.MoveToJoints(
+                HOME_CONFIG, ext_axes=SAFE_EXT_AXES, **motion("transit")
+            )
         )
-    )
 
 
-def place_a_brick(frame, ext_axes, wobj="w_pallet0"):
+def place_a_brick(frame, ext_axes, wobj="w_pallet0", direct=False, home_after=True):
+    # direct: the robot comes straight from the safe pick frame, approach on a straight line
+    # home_after: return home after placing
     # Set work object
-    abb.send_and_wait(rrc.SetWorkObject(wobj))
+    robot.send(rrc.SetWorkObject(wobj))
     print("Placing brick at frame:", frame)
     # Move to safe place frame
     safe_place_frame = get_safe_frame(frame, offset=300.0)
     # Move to safe place frame
-    abb.send_and_wait(rrc.PrintText("Moving to safe place frame"))
-    abb.send_and_wait(
+    robot.send(rrc.PrintText("Moving to safe place frame"))
+    robot.send(
         rrc.MoveToRobtarget(
-            safe_place_frame, ext_axes=ext_axes, speed=500, zone=rrc.Zone.FINE
+            safe_place_frame, ext_axes=ext_axes, motion_type=transfer_motion(direct), **motion("approach")
         )
     )
     # Move to place frame
-    abb.send_and_wait(rrc.PrintText("Moving to place frame"))
-    abb.send_and_wait(
-        rrc.MoveToRobtarget(frame, ext_axes=ext_axes, speed=50, zone=rrc.Zone.FINE)
+    robot.send(rrc.PrintText("Moving to place frame"))
+    robot.send(
+        rrc.MoveToRobtarget(frame, ext_axes=ext_axes, **motion("contact"))
     )
     # Open gripper
-    abb.send_and_wait(rrc.PrintText("Opening gripper to release brick"))
-    open_gripper(abb)
+    robot.send(rrc.PrintText("Opening gripper to release brick"))
+    open_gripper(robot)
     # Move back to safe place frame
-    abb.send_and_wait(rrc.PrintText("Moving back to safe place frame"))
-    abb.send_and_wait(
+    robot.send(rrc.PrintText("Moving back to safe place frame"))
+    robot.send(
         rrc.MoveToRobtarget(
-            safe_place_frame, ext_axes=ext_axes, speed=500, zone=rrc.Zone.FINE
+            safe_place_frame, ext_axes=ext_axes, **motion("retract")
         )
     )
     # Move to home position
-    abb.send_and_wait(rrc.PrintText("Returning to home position"))
-    abb.send_and_wait(
-        rrc.MoveToJoints(
-            HOME_CONFIG, ext_axes=ext_axes, speed=500, zone=rrc.Zone.FINE
+    if home_after:
+        robot.send(rrc.PrintText("Returning to home position"))
+        robot.send(
+            rrc.MoveToJoints(
+                HOME_CONFIG, ext_axes=ext_axes, **motion("transit")
+            )
         )
-    )
 
 
-def open_gripper(abb):
-    abb.send_and_wait(rrc.SetDigital(io_close, 0))  # Close gripper to ensure it's closed
-    abb.send_and_wait(rrc.SetDigital(io_open, 1))  # Open gripper to ensure it's open
-    abb.send_and_wait(rrc.WaitTime(0.5))  # Wait for gripper
+def open_gripper(robot):
+    robot.send(rrc.SetDigital(io_close, 0))  # Close gripper to ensure it's closed
+    robot.send(rrc.SetDigital(io_open, 1))  # Open gripper to ensure it's open
+    robot.send(rrc.WaitTime(0.5))  # Wait for gripper
 
 
-def close_gripper(abb):
-    abb.send_and_wait(rrc.SetDigital(io_open, 0))  # Close gripper to ensure it's closed
-    abb.send_and_wait(rrc.SetDigital(io_close, 1))  # Close gripper to pick brick
-    abb.send_and_wait(rrc.WaitTime(0.5))  # Wait for gripper
+def close_gripper(robot):
+    robot.send(rrc.SetDigital(io_open, 0))  # Close gripper to ensure it's closed
+    robot.send(rrc.SetDigital(io_close, 1))  # Close gripper to pick brick
+    robot.send(rrc.WaitTime(0.5))  # Wait for gripper
+    # Sync point: the brick has to be held before the robot moves on
+    robot.sync()
 
 
 def fine_adjust_z(frame, adjustment):
@@ -146,38 +297,90 @@ def get_external_axes_for_wobj(wobj):
 
 
 def load_brick_frames(filename):
-    data = json_load(filename)
-    return data
+    # out_brickframes.json, or the compact file written by frame_file.py (its frames are memory mapped)
+    return frame_file.load_brick_frames(filename)
 
 ############ Main Script
 # Import JSON file
 from pathlib import Path
 
 current_directory = Path(__file__).resolve().parent / "data"
-data_file = current_directory / "out_brickframes.json"
+# Convert with: python frame_file.py data/out_brickframes.json data/out_brickframes.bin
+data_file = current_directory / "out_brickframes.bin"
+if not data_file.exists():
+    data_file = current_directory / "out_brickframes.json"
 
-data = json_load(data_file)
+data = load_brick_frames(data_file)
 
 try:
-    ros = rrc.RosClient()
+    ros = abb_simulator.SimulatedRosClient() if SIMULATE else rrc.RosClient()
     ros.run()
 
     # robot 12 to move tool and external axes 1
-    abb = rrc.AbbClient(ros, "/rob1")
-    abb.send_and_wait(rrc.SetTool("t_BrickGripper"))
-    abb.send_and_wait(rrc.SetAcceleration(100, 50))
-    abb.send_and_wait(rrc.PrintText(("Starting ABB Robot")))
+    if SIMULATE:
+        abb = abb_simulator.SimulatedAbbClient(
+            ros,
+            "/rob1",
+            wobj_frames=WOBJ_FRAMES,
+            configurations={tuple(HOME_CONFIG): SIMULATED_HOME_FRAME} if SIMULATED_HOME_FRAME else None,
+            cycle_io=(io_close, 1),
+        )
+    else:
+        abb = rrc.AbbClient(ros, "/rob1")
+    robot = Executor(abb)
+    print("Execution mode:", robot.mode)
+    robot.send(rrc.SetTool("t_BrickGripper"))
+    robot.send(rrc.SetAcceleration(100, 50))
+    robot.send(rrc.PrintText(("Starting ABB Robot")))
 
-    abb.send_and_wait(rrc.SetWorkObject("wobj0"))
+    robot.send(rrc.SetWorkObject("wobj0"))
 
     wobj = data["wobj"]
     brick_frames = data["frames"]
+    BRICK_TYPE = data.get("brick_type", BRICK_TYPE)
+    print("Motion profile:", MOTION_PROFILE or BRICK_TYPE)
     ext_axes = get_external_axes_for_wobj(wobj)
 
-    for frame in brick_frames:
-        frame = fine_adjust_z(frame, adjustment=3.0)
-        pick_a_brick()
-        place_a_brick(frame, ext_axes, wobj=wobj)
+    if SEQUENCE_BRICKS:
+        order, report = sequence_bricks(brick_frames, brick_cls=BRICK_CLASSES[BRICK_TYPE])
+        print_report(report)
+        brick_frames = [brick_frames[i] for i in order]
+
+    if VALIDATE_WALL:
+        validation = validate_wall(BrickCollection.from_pick_frames(brick_frames, BRICK_CLASSES[BRICK_TYPE]), offset=300.0)
+        print_validation(validation)
+        if not is_valid(validation):
+            raise ValueError("The wall did not pass the validation, fix it or set VALIDATE_WALL = False")
+
+    brick_frames = [fine_adjust_z(frame, adjustment=3.0) for frame in brick_frames]
+    if DIRECT_TRANSFERS:
+        if wobj not in WOBJ_FRAMES:
+            print("Work object %s is not in WOBJ_FRAMES, all transfers go through home" % wobj)
+        plan = plan_home_returns(
+            PICK_FRAME,
+            brick_frames,
+            WOBJ_FRAMES.get(wobj),
+            FORBIDDEN_REGIONS,
+            offset=300.0,
+            clearance=TRANSFER_CLEARANCE,
+            same_ext_axes=ext_axes == SAFE_EXT_AXES,
+        )
+    else:
+        plan = [(True, True)] * len(brick_frames)
+    print("Moves to home: %d instead of %d" % (count_home_moves(plan), count_baseline_home_moves(len(plan))))
+
+    home_before = True
+    direct_from_place = False
+    for frame, (home_after_pick, home_after_place) in zip(brick_frames, plan):
+        pick_a_brick(home_before=home_before, direct=direct_from_place, home_after=home_after_pick)
+        place_a_brick(frame, ext_axes, wobj=wobj, direct=not home_after_pick, home_after=home_after_place)
+        home_before = False
+        direct_from_place = not home_after_place
+    robot.sync(mark=False)
+    label = "%s_%s" % (robot.mode, MOTION_PROFILE or BRICK_TYPE)
+    report_cycle_times(robot, current_directory, "simulated_" + label if SIMULATE else label)
+    if SIMULATE:
+        abb.print_report()
 
 
 except Exception as e:
@@ -0,0 +1,322 @@
+import math
+
+import numpy as np
+from compas.geometry import Frame, Transformation
+
+# Offline stand-in for compas_rrc's RosClient and AbbClient.
+# Instructions are not sent anywhere, their execution time is simulated instead:
+#   moves:      trapezoidal velocity profiles with the speed of the instruction and the acceleration of
+#               SetAcceleration, with an extra ramp time per acceleration phase for the jerk limit.
+#               Fly-by zones cut the corner: the robot passes the zone at a corner speed limited by the speeds
+#               of both moves, the corner angle and the zone radius, instead of stopping.
+#   WaitTime:   the robot stops at the last target and waits.
+#   other:      SetDigital, PrintText, SetTool, ... take io_time or no time and don't stop the robot.
+# Instructions are read from their instruction name and float/string values, compas_rrc itself is not needed.
+
+# Defaults for a mid-size ABB arm on a track
+MAX_ACCELERATION = 4000.0  # mm/s2 TCP acceleration at SetAcceleration(100, ...)
+MAX_JERK = 40000.0  # mm/s3 at ramp 100 %
+MAX_JOINT_SPEED = 120.0  # deg/s of the slowest joint
+MAX_JOINT_ACCELERATION = 400.0  # deg/s2 at SetAcceleration(100, ...)
+MAX_REORIENTATION_SPEED = 500.0  # deg/s, the v_ori of RAPID speeddata
+MAX_EXTERNAL_SPEED = 1000.0  # mm/s of the track
+
+# Corners sharper than this angle (degrees) are taken as stop points
+MAX_CORNER_ANGLE = 170.0
+
+
+def profile_time(distance, speed, acceleration, v_in=0.0, v_out=0.0, ramp_time=0.0):
+    """
+    Time to travel a distance with a trapezoidal velocity profile.
+
+    speed: cruise speed
+    v_in, v_out: speed at the start and end, lowered if the distance is too short to reach them
+    ramp_time: added for every acceleration or deceleration phase (jerk limit)
+    """
+    if distance <= 0.0:
+        return 0.0
+    v_in, v_out = min(v_in, speed), min(v_out, speed)
+    # Too short to change from v_in to v_out: constant acceleration all the way
+    reachable = math.sqrt(v_in ** 2 + 2 * acceleration * distance)
+    if v_out > reachable:
+        return 2 * distance / (v_in + reachable) + ramp_time
+    reachable = math.sqrt(v_out ** 2 + 2 * acceleration * distance)
+    if v_in > reachable:
+        return 2 * distance / (v_out + reachable) + ramp_time
+
+    d_acc = (speed ** 2 - v_in ** 2) / (2 * acceleration)
+    d_dec = (speed ** 2 - v_out ** 2) / (2 * acceleration)
+    if d_acc + d_dec <= distance:
+        peak, cruise = speed, (distance - d_acc - d_dec) / speed
+    else:
+        peak, cruise = math.sqrt((2 * acceleration * distance + v_in ** 2 + v_out ** 2) / 2), 0.0
+    ramps = ramp_time * ((peak > v_in) + (peak > v_out))
+    return (peak - v_in) / acceleration + (peak - v_out) / acceleration + cruise + ramps
+
+
+class SimulatedRosClient:
+    """Stand-in for rrc.RosClient, nothing to connect to."""
+
+    def __init__(self, *args, **kwargs):
+        self.is_connected = False
+
+    def run(self, timeout=None):
+        self.is_connected = True
+
+    def close(self):
+        self.is_connected = False
+
+    def terminate(self):
+        self.close()
+
+
+class SimulatedFuture:
+    """Stand-in for rrc.FutureResult, result() advances the simulation up to its instruction."""
+
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+
+    @property
+    def done(self):
+        return self.index < len(self.client.timeline)
+
+    def result(self, timeout=None):
+        self.client._advance(self.index)
+        return self.client.timeline[self.index]["end"]
+
+
+class SimulatedAbbClient:
+    """
+    Stand-in for rrc.AbbClient that simulates execution times.
+
+    ros, namespace: as for rrc.AbbClient, not used
+    wobj_frames: work object frames in wobj0 by name, targets in other work objects are taken as wobj0 coordinates
+    configurations: TCP frames in wobj0 of known joint configurations {tuple(joints): frame},
+        moves from a configuration that isn't known are timed from their joint and external axis values only
+    cycle_io: (io name, value) of the SetDigital that starts a new cycle, e.g. closing the gripper
+    latency: round trip time of one send_and_wait, the robot stands still meanwhile
+    io_time: time of one SetDigital
+    """
+
+    def __init__(self, ros=None, namespace="/rob1", wobj_frames=None, configurations=None, cycle_io=None,
+                 latency=0.0, io_time=0.0, max_acceleration=MAX_ACCELERATION, max_jerk=MAX_JERK,
+                 max_joint_speed=MAX_JOINT_SPEED, max_joint_acceleration=MAX_JOINT_ACCELERATION,
+                 max_reorientation_speed=MAX_REORIENTATION_SPEED, max_external_speed=MAX_EXTERNAL_SPEED):
+        self.ros = ros
+        self.namespace = namespace
+        self.wobj_frames = {"wobj0": Frame.worldXY()}
+        self.wobj_frames.update(wobj_frames or {})
+        self.configurations = {tuple(np.round(joints, 3)): frame for joints, frame in (configurations or {}).items()}
+        self.cycle_io = cycle_io
+        self.latency = latency
+        self.io_time = io_time
+        self.max_acceleration = max_acceleration
+        self.max_jerk = max_jerk
+        self.max_joint_speed = max_joint_speed
+        self.max_joint_acceleration = max_joint_acceleration
+        self.max_reorientation_speed = max_reorientation_speed
+        self.max_external_speed = max_external_speed
+
+        # Controller state
+        self.acceleration = 100.0
+        self.ramp = 100.0
+        self.wobj = "wobj0"
+        self.tool = None
+        self.joints = None
+        self.point = None
+        self.quaternion = None
+        self.ext_axes = None
+        self.io = {}
+        self.speed = 0.0  # TCP speed when the previous move ended
+        self.zone_radius = 0.0  # zone the previous move ended in
+
+        # Sent instructions, timed ones move from pending to the timeline
+        self.pending = []
+        self.timeline = []
+        self.time = 0.0
+        self.unknown_starts = 0
+        self.messages = []
+        self.warnings = set()
+
+    # ---- AbbClient interface
+    def send(self, instruction):
+        self.pending.append(instruction)
+        if getattr(instruction, "feedback_level", 0) > 0:
+            return SimulatedFuture(self, len(self.timeline) + len(self.pending) - 1)
+        return None
+
+    def send_and_wait(self, instruction, timeout=None):
+        # Nothing else is queued while waiting: the robot stops, and waits for the round trip
+        future = SimulatedFuture(self, len(self.timeline) + len(self.pending))
+        self.pending.append(instruction)
+        result = future.result(timeout)
+        self.time += self.latency
+        return result
+
+    def ensure_protocol_version(self):
+        pass
+
+    def clock(self):
+        # Simulated time at which everything sent so far has been executed
+        self._advance(len(self.timeline) + len(self.pending) - 1)
+        return self.time
+
+    # ---- Simulation
+    def _advance(self, index):
+        # Time the pending instructions up to index, a move is timed once the instruction after it is known
+        while len(self.timeline) <= index and self.pending:
+            instruction = self.pending.pop(0)
+            self.timeline.append(self._execute(instruction, self._next_move()))
+
+    def _next_move(self):
+        # The move the current one blends into, None if the robot stops after it
+        for instruction in self.pending:
+            name = _get_name(instruction)
+            if name in ("MoveToJoints", "MoveTo"):
+                return instruction
+            if name in ("WaitTime", "Stop"):
+                return None
+        # Nothing queued after it: the robot stops, unless more is sent before it gets there
+        return None
+
+    def _execute(self, instruction, next_move):
+        name = _get_name(instruction)
+        start = self.time
+        kind = "other"
+        values, strings = list(instruction.float_values), list(instruction.string_values)
+        if name in ("MoveToJoints", "MoveTo"):
+            kind = "move"
+            self.time += self._move(name, values, strings, next_move)
+        elif name == "WaitTime":
+            kind = "wait"
+            self.speed = 0.0
+            self.time += values[0]
+        elif name == "SetDigital":
+            kind = "io"
+            self.io[strings[0]] = values[0]
+            self.time += self.io_time
+        elif name == "SetAcceleration":
+            self.acceleration, self.ramp = values[0], values[1]
+        elif name == "SetWorkObject":
+            self.wobj = strings[0]
+            if self.wobj not in self.wobj_frames:
+                self.warnings.add("Unknown work object %s, taken as wobj0" % self.wobj)
+        elif name == "SetTool":
+            self.tool = strings[0]
+        elif name == "PrintText":
+            self.messages.append(strings[0])
+        return {"instruction": name, "kind": kind, "start": start, "end": self.time, "values": values, "strings": strings}
+
+    def _get_target(self, name, values, strings):
+        # Joints, point and quaternion in wobj0, external axes, speed and zone of a move instruction
+        if name == "MoveToJoints":
+            joints, ext_axes, speed, zone = values[0:6], values[6:12], values[12], values[13]
+            frame = self.configurations.get(tuple(np.round(joints, 3)))
+            point = quaternion = None
+            if frame is not None:
+                point, quaternion = np.array(list(frame.point)), np.array(list(frame.quaternion))
+            return joints, point, quaternion, ext_axes, speed, zone
+        point, quaternion, ext_axes, speed, zone = values[0:3], values[3:7], values[7:13], values[13], values[14]
+        if strings and strings[0].startswith("Frame"):
+            ext_axes = self.ext_axes  # MoveToFrame leaves the external axes where they are
+        wobj = self.wobj_frames.get(self.wobj, self.wobj_frames["wobj0"])
+        frame = Frame.from_quaternion(quaternion, point).transformed(Transformation.from_frame(wobj))
+        return None, np.array(list(frame.point)), np.array(list(frame.quaternion)), ext_axes, speed, zone
+
+    def _move(self, name, values, strings, next_move):
+        joints, point, quaternion, ext_axes, speed, zone = self._get_target(name, values, strings)
+        acceleration = self.max_acceleration * self.acceleration / 100.0
+        ramp_time = acceleration / (self.max_jerk * max(self.ramp, 1.0) / 100.0)
+
+        # Speed through the zone at the end of this move
+        v_out = 0.0
+        radius = 0.0
+        if zone > 0 and next_move is not None:
+            next_joints, next_point, _, _, next_speed, _ = self._get_target(
+                _get_name(next_move), list(next_move.float_values), list(next_move.string_values))
+            factor = 1.0
+            if point is not None and next_point is not None and self.point is not None:
+                a, b = point - self.point, next_point - point
+                if np.linalg.norm(a) > 0 and np.linalg.norm(b) > 0:
+                    angle = math.degrees(math.acos(np.clip(np.dot(a, b) / np.linalg.norm(a) / np.linalg.norm(b), -1, 1)))
+                    factor = 0.0 if angle > MAX_CORNER_ANGLE else math.cos(math.radians(angle) / 2)
+            radius = zone
+            v_out = min(speed, next_speed, math.sqrt(acceleration * zone)) * factor
+
+        durations = []
+        known = False
+        if point is not None and self.point is not None:
+            known = True
+            distance = float(np.linalg.norm(point - self.point))
+            # The zones cut the path at both ends, at most half of it each
+            cut_in = min(self.zone_radius, distance / 2) if self.speed > 0 else 0.0
+            cut_out = min(radius, distance / 2) if v_out > 0 else 0.0
+            linear = profile_time(distance - cut_in - cut_out, speed, acceleration, self.speed, v_out, ramp_time)
+            corner = cut_out / v_out if v_out > 0 else 0.0
+            durations.append(linear + corner)
+            if self.quaternion is not None:
+                angle = 2 * math.degrees(math.acos(min(1.0, abs(float(np.dot(quaternion, self.quaternion))))))
+                durations.append(angle / self.max_reorientation_speed)
+        if joints is not None and self.joints is not None:
+            known = True
+            delta = float(np.max(np.abs(np.subtract(joints, self.joints))))
+            joint_acceleration = self.max_joint_acceleration * self.acceleration / 100.0
+            durations.append(profile_time(delta, self.max_joint_speed, joint_acceleration))
+        if ext_axes is not None and self.ext_axes is not None:
+            delta = float(np.max(np.abs(np.subtract(ext_axes, self.ext_axes))))
+            durations.append(profile_time(delta, min(speed, self.max_external_speed), acceleration, ramp_time=ramp_time))
+
+        if not known:
+            self.unknown_starts += 1
+        self.joints = joints
+        self.point, self.quaternion = point, quaternion
+        if ext_axes is not None:
+            self.ext_axes = ext_axes
+        self.speed, self.zone_radius = v_out, radius
+        return max(durations) if durations else 0.0
+
+    # ---- Results
+    def get_cycles(self):
+        """
+        Splits the timeline into cycles at every cycle_io SetDigital.
+
+        Returns a list of dicts with the start, total time and the time spent on moves, waits and io per cycle.
+        """
+        self.clock()
+        cycles = []
+        current = None
+        for entry in self.timeline:
+            starts_cycle = (self.cycle_io is not None and entry["instruction"] == "SetDigital"
+                            and (entry["strings"][0], entry["values"][0]) == tuple(self.cycle_io))
+            if current is None or starts_cycle:
+                current = {"start": entry["start"], "total": 0.0, "move": 0.0, "wait": 0.0, "io": 0.0, "other": 0.0,
+                           "moves": 0}
+                cycles.append(current)
+            duration = entry["end"] - entry["start"]
+            current[entry["kind"]] += duration
+            current["total"] += duration
+            current["moves"] += entry["kind"] == "move"
+        # Idle time between instructions (latency) belongs to the cycle it happens in
+        for cycle, following in zip(cycles[:-1], cycles[1:]):
+            cycle["total"] = following["start"] - cycle["start"]
+        if cycles:
+            cycles[-1]["total"] = self.time - cycles[-1]["start"]
+        return cycles
+
+    def print_report(self):
+        cycles = self.get_cycles()
+        print("Simulated %d instructions in %.1f s%s" % (
+            len(self.timeline), self.time,
+            ", %d moves from an unknown position" % self.unknown_starts if self.unknown_starts else ""))
+        for warning in sorted(self.warnings):
+            print("  " + warning)
+        print("%6s %9s %9s %9s %9s %6s" % ("cycle", "total [s]", "move [s]", "wait [s]", "io [s]", "moves"))
+        for index, cycle in enumerate(cycles):
+            print("%6d %9.2f %9.2f %9.2f %9.2f %6d" % (
+                index, cycle["total"], cycle["move"], cycle["wait"], cycle["io"], cycle["moves"]))
+
+
+def _get_name(instruction):
+    # "r_RRC_MoveToJoints" -> "MoveToJoints"
+    return instruction.instruction.rsplit("_", 1)[-1]
@@ -0,0 +1,238 @@
+import itertools
+
+import numpy as np
+
+from brick_wall import BrickCollection
+
+# Spatial index over the bricks of a wall and the checks run on a wall before it is built:
+#   overlaps:   bricks that intersect each other
+#   supports:   bricks that float, with neither the ground nor another brick under them
+#   approaches: bricks whose vertical approach from the safe frame passes through a brick placed before
+# Candidates come from axis-aligned boxes in a uniform grid, they are confirmed with oriented boxes.
+
+
+def obbs_overlap(centers_a, axes_a, half_a, centers_b, axes_b, half_b, tolerance=0.0):
+    """
+    Separating axis test for pairs of oriented boxes.
+
+    centers: (M, 3) box centers
+    axes: (M, 3, 3) unit box axes, one per row
+    half: (M, 3) half extents along the axes
+    tolerance: boxes that penetrate less than this only touch
+    Returns an (M,) boolean array.
+    """
+    R = np.einsum("mik,mjk->mij", axes_a, axes_b)
+    absR = np.abs(R) + 1e-9
+    t = np.einsum("mik,mk->mi", axes_a, centers_b - centers_a)
+
+    # Face axes of A, then of B
+    separated = np.any(np.abs(t) > half_a + np.einsum("mij,mj->mi", absR, half_b) - tolerance, axis=1)
+    separated |= np.any(
+        np.abs(np.einsum("mji,mj->mi", R, t)) > np.einsum("mji,mj->mi", absR, half_a) + half_b - tolerance, axis=1
+    )
+    # Edge axes A_i x B_j, the tolerance is scaled with their length so parallel edges don't separate
+    for i in range(3):
+        i1, i2 = (i + 1) % 3, (i + 2) % 3
+        for j in range(3):
+            j1, j2 = (j + 1) % 3, (j + 2) % 3
+            ra = half_a[:, i1] * absR[:, i2, j] + half_a[:, i2] * absR[:, i1, j]
+            rb = half_b[:, j1] * absR[:, i, j2] + half_b[:, j2] * absR[:, i, j1]
+            distance = np.abs(t[:, i2] * R[:, i1, j] - t[:, i1] * R[:, i2, j])
+            length = np.sqrt(np.maximum(0.0, 1.0 - R[:, i, j] ** 2))
+            separated |= distance > ra + rb - tolerance * length
+    return ~separated
+
+
+def get_aabbs(centers, axes, half):
+    # Axis-aligned bounds (N, 3) min and max of oriented boxes
+    extent = np.einsum("nij,ni->nj", np.abs(axes), half)
+    return centers - extent, centers + extent
+
+
+class BrickIndex:
+    """Uniform grid over the axis-aligned bounds of the bricks of a BrickCollection."""
+
+    def __init__(self, bricks, cell_size=None):
+        self.bricks = bricks
+        self.centers = bricks.points.copy()
+        self.axes = np.stack([bricks.xaxes, bricks.yaxes, bricks.zaxes], axis=1)
+        self.half = bricks.dimensions / 2.0
+        self.aabb_min, self.aabb_max = get_aabbs(self.centers, self.axes, self.half)
+
+        # With cells at least as large as a brick, every brick is in at most 2 x 2 x 2 cells
+        if cell_size is None:
+            cell_size = (self.aabb_max - self.aabb_min).max() if len(bricks) else 1.0
+        self.cell_size = float(cell_size)
+        self.origin = self.aabb_min.min(axis=0) if len(bricks) else np.zeros(3)
+        lo, hi = self._get_cells(self.aabb_min), self._get_cells(self.aabb_max)
+        self.shape = hi.max(axis=0) + 1 if len(bricks) else np.ones(3, dtype=int)
+
+        # Sorted (cell key, brick) pairs, looked up with searchsorted
+        keys, indices = [], []
+        for offset in itertools.product((0, 1), repeat=3):
+            cells = lo + offset
+            inside = np.all(cells <= hi, axis=1)
+            keys.append(self._get_keys(cells[inside]))
+            indices.append(np.flatnonzero(inside))
+        keys, indices = np.concatenate(keys), np.concatenate(indices)
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.indices = keys[order], indices[order]
+
+    def __len__(self):
+        return len(self.centers)
+
+    def _get_cells(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(int)
+
+    def _get_keys(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def query(self, box_min, box_max):
+        """
+        Bricks whose axis-aligned bounds overlap the given boxes.
+
+        box_min, box_max: (M, 3) bounds of the query boxes
+        Returns (queries, bricks): two arrays of indices, one pair per overlap.
+        """
+        box_min = np.asarray(box_min, dtype=float).reshape(-1, 3)
+        box_max = np.asarray(box_max, dtype=float).reshape(-1, 3)
+        lo = np.maximum(self._get_cells(box_min), 0)
+        hi = np.minimum(self._get_cells(box_max), self.shape - 1)
+        span = hi - lo + 1
+        queries, bricks = [], []
+        if len(box_min) == 0 or len(self) == 0 or np.any(span <= 0, axis=1).all():
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        for offset in itertools.product(*[range(n) for n in span.max(axis=0)]):
+            cells = lo + offset
+            valid = np.all(cells <= hi, axis=1)
+            query = np.flatnonzero(valid)
+            keys = self._get_keys(cells[valid])
+            start = np.searchsorted(self.keys, keys, side="left")
+            count = np.searchsorted(self.keys, keys, side="right") - start
+            # Expand the (start, count) ranges into one entry per brick in the cell
+            query = np.repeat(query, count)
+            position = np.repeat(start - np.cumsum(count) + count, count) + np.arange(count.sum())
+            queries.append(query)
+            bricks.append(self.indices[position])
+        queries, bricks = np.concatenate(queries), np.concatenate(bricks)
+        # A brick in several cells of a query is found several times
+        pairs = np.unique(queries.astype(np.int64) * len(self) + bricks)
+        queries, bricks = pairs // len(self), pairs % len(self)
+        hit = np.all((self.aabb_min[bricks] <= box_max[queries]) & (self.aabb_max[bricks] >= box_min[queries]), axis=1)
+        return queries[hit], bricks[hit]
+
+    def query_boxes(self, centers, axes, half, tolerance=0.0):
+        # Bricks overlapping oriented boxes, (queries, bricks) as in query
+        box_min, box_max = get_aabbs(centers, axes, half)
+        queries, bricks = self.query(box_min, box_max)
+        hit = obbs_overlap(centers[queries], axes[queries], half[queries],
+                           self.centers[bricks], self.axes[bricks], self.half[bricks], tolerance)
+        return queries[hit], bricks[hit]
+
+    def _get_vertical(self):
+        # Index and upward sign of the brick axis closest to world z (bricks lying flat: their z axis)
+        k = np.argmax(np.abs(self.axes[:, :, 2]), axis=1)
+        up = self.axes[np.arange(len(self)), k]
+        return k, up * np.sign(up[:, 2:3])
+
+    def find_overlaps(self, tolerance=0.5):
+        # Pairs (i, j), i < j, of bricks penetrating each other more than tolerance
+        queries, bricks = self.query_boxes(self.centers, self.axes, self.half, tolerance)
+        pairs = np.stack([queries, bricks], axis=1)
+        return pairs[pairs[:, 0] < pairs[:, 1]]
+
+    def find_unsupported(self, ground=None, tolerance=0.5, min_overlap=1.0):
+        """
+        Bricks that are neither on the ground nor on another brick.
+
+        ground: height of the ground, the lowest brick bottom if None
+        tolerance: allowed gap under a brick
+        min_overlap: bricks have to overlap by at least this in plan to carry each other
+        """
+        if len(self) == 0:
+            return np.zeros(0, dtype=int)
+        if ground is None:
+            ground = self.aabb_min[:, 2].min()
+        k, up = self._get_vertical()
+        rows = np.arange(len(self))
+        # Thin probe along the bottom face, shrunk in plan so bricks only touching at an edge don't count
+        probe_half = np.maximum(self.half - min_overlap / 2.0, tolerance)
+        probe_half[rows, k] = tolerance
+        probe_centers = self.centers - up * self.half[rows, k][:, None]
+        queries, bricks = self.query_boxes(probe_centers, self.axes, probe_half)
+        supported = np.zeros(len(self), dtype=bool)
+        supported[queries[queries != bricks]] = True
+        supported |= self.aabb_min[:, 2] <= ground + tolerance
+        return np.flatnonzero(~supported)
+
+    def find_blocked_approaches(self, order=None, offset=300.0, clearance=0.0, tolerance=0.5):
+        """
+        Bricks whose approach passes through a brick placed before them.
+
+        The approach is the brick moving straight down from offset above its place, as from the safe frame,
+        grown by clearance on the sides for the gripper.
+        order: build order as brick indices, the order of the collection if None
+        Returns pairs (brick, blocking brick).
+        """
+        n = len(self)
+        position = np.arange(n)
+        if order is not None:
+            position[np.asarray(order, dtype=int)] = np.arange(n)
+        k, up = self._get_vertical()
+        rows = np.arange(n)
+        sweep_half = self.half + clearance
+        sweep_half[rows, k] = self.half[rows, k] + offset / 2.0
+        sweep_centers = self.centers + up * (offset / 2.0)
+        queries, bricks = self.query_boxes(sweep_centers, self.axes, sweep_half, tolerance)
+        blocked = (queries != bricks) & (position[bricks] < position[queries])
+        return np.stack([queries[blocked], bricks[blocked]], axis=1)
+
+
+def validate_wall(bricks, order=None, offset=300.0, clearance=0.0, tolerance=0.5, ground=None):
+    """
+    Runs all checks on a wall.
+
+    bricks: BrickCollection, or a list of Bricks of the same type
+    Returns a dict with the overlapping pairs, the unsupported bricks and the blocked approaches.
+    """
+    if not isinstance(bricks, BrickCollection):
+        bricks = BrickCollection.from_bricks(bricks)
+    index = BrickIndex(bricks)
+    return {
+        "bricks": len(index),
+        "overlaps": index.find_overlaps(tolerance).tolist(),
+        "unsupported": index.find_unsupported(ground, tolerance).tolist(),
+        "blocked_approaches": index.find_blocked_approaches(order, offset, clearance, tolerance).tolist(),
+    }
+
+
+def is_valid(report):
+    return not (report["overlaps"] or report["unsupported"] or report["blocked_approaches"])
+
+
+def print_validation(report, limit=10):
+    print("%d bricks: %d overlapping pairs, %d unsupported, %d blocked approaches" % (
+        report["bricks"], len(report["overlaps"]), len(report["unsupported"]), len(report["blocked_approaches"])))
+    for name in ("overlaps", "unsupported", "blocked_approaches"):
+        if report[name]:
+            print("  %s: %s%s" % (name, report[name][:limit], " ..." if len(report[name]) > limit else ""))
+
+
+if __name__ == "__main__":
+    import time
+    from brick_wall import BigBrick, generate_wall
+
+    for length in (24000.0, 240000.0):
+        wall = generate_wall(np.linspace([0, 0, 0], [length, 0, 0], 100), 40, BigBrick, gap=2.0, z_offset=BigBrick.HEIGHT / 2)
+        start = time.perf_counter()
+        report = validate_wall(wall)
+        print("--- validated in %.2f s" % (time.perf_counter() - start))
+        print_validation(report)
+
+    # Broken wall: a brick pushed into its neighbour, a floating brick, and the top course built first
+    wall = generate_wall(np.linspace([0, 0, 0], [2400, 0, 0], 100), 4, BigBrick, gap=2.0, z_offset=BigBrick.HEIGHT / 2)
+    wall.points[1, 0] -= 50.0
+    wall.points[-1, 2] += 20.0
+    order = np.argsort(-wall.points[:, 2], kind="stable")
+    print("--- broken wall")
+    print_validation(validate_wall(wall, order=order))
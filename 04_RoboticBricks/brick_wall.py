@@ -1,54 +1,300 @@
-
 import math
+import numpy as np
 from compas.geometry import Frame
 from compas.geometry import Box
+from compas.geometry import Line
+from compas.geometry import Polyline
+from compas.datastructures import Mesh
 
 # There's a data type called Brick
 # that has attributes: length, width, height and a point
 # and also has a rotate behavior that accepts degrees of rotation
 class Brick:
+    # Fixed attributes instead of a __dict__ per brick, walls have tens of thousands of bricks
+    __slots__ = ("length", "width", "height", "frame", "_pick_cache")
+
     # Class attribute for default brick dimensions
     LENGTH = 32.02
     WIDTH = 15.2
     HEIGHT = 9.94
+    # Side of the brick frame the pick frame is on, along world z: 1 above, -1 below
+    PICK_SIDE = 1
 
     def __init__(self, frame=None):
-        self.length = Brick.LENGTH
-        self.width = Brick.WIDTH
-        self.height = Brick.HEIGHT
+        self.length = self.LENGTH
+        self.width = self.WIDTH
+        self.height = self.HEIGHT
         self.frame = frame
+        self._pick_cache = None
 
     def __str__(self):
         return f"Brick of {self.length}cm x {self.width}cm x {self.height}cm (frame: {self.frame})"
 
     def draw(self):
-        box = Box(self.length, self.width, self.height)
-        box.frame = self.frame.copy()
-        return box
+        # A new Box on every call, changing it does not change the brick (Box copies the frame it is given)
+        return Box(self.length, self.width, self.height, frame=self.frame)
 
     def rotate(self, rotation_in_degrees):
         self.frame.rotate(math.radians(rotation_in_degrees), (0, 0, 1), self.frame.point)
 
     def get_pick_frame(self):
-        pick_frame = self.frame.copy()
-        pick_frame.point.z += self.height / 2
-
-        if pick_frame.zaxis.z > 0:
-            pick_frame.xaxis = -pick_frame.xaxis
-        return pick_frame
+        # Cached on the frame values and height, so rotating or moving the frame recomputes it.
+        # A new Frame on every call, changing it does not change the brick
+        frame = self.frame
+        key = (tuple(frame.point), tuple(frame.xaxis), tuple(frame.yaxis), self.height)
+        if self._pick_cache is None or self._pick_cache[0] != key:
+            pick_frame = frame.translated((0, 0, self.PICK_SIDE * self.height / 2))
+            if pick_frame.zaxis.z > 0:
+                pick_frame.xaxis = -pick_frame.xaxis
+            self._pick_cache = (key, list(pick_frame.point), list(pick_frame.xaxis), list(pick_frame.yaxis))
+        return Frame(*self._pick_cache[1:])
 
 class BigBrick(Brick):
+    __slots__ = ()
+
     LENGTH = 240.0
     WIDTH = 115.0
     HEIGHT = 52.0
-    def __init__(self, frame=None):
-        super().__init__(frame)
-        self.length = BigBrick.LENGTH
-        self.width = BigBrick.WIDTH
-        self.height = BigBrick.HEIGHT
-    
-    def get_pick_frame(self):
-        pick_frame = self.frame.translated((0, 0, -self.height / 2))
-        if pick_frame.zaxis.z > 0:
-            pick_frame.xaxis = -pick_frame.xaxis
-        return pick_frame
+    PICK_SIDE = -1
+
+
+# Corners of a unit box around its frame and the faces between them, in the same order as compas Box
+BOX_CORNERS = np.array([
+    [-1, -1, -1], [-1, 1, -1], [1, 1, -1], [1, -1, -1],
+    [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1],
+], dtype=float) / 2.0
+BOX_FACES = np.array([[0, 1, 2, 3], [0, 3, 5, 4], [3, 2, 6, 5], [2, 1, 7, 6], [1, 0, 4, 7], [4, 5, 6, 7]])
+
+
+# A collection of bricks stored as arrays instead of one Brick object per brick:
+# frame origins, x and y axes and dimensions (length, width, height) of N bricks.
+# Transformations work on all bricks at once, Brick objects are only created when asked for.
+class BrickCollection:
+    def __init__(self, points, xaxes, yaxes, brick_cls=Brick, dimensions=None):
+        self.brick_cls = brick_cls
+        self.points = np.array(points, dtype=float).reshape(-1, 3)
+        self.xaxes = _unitize(np.array(xaxes, dtype=float).reshape(-1, 3))
+        # Same as compas Frame: the y axis is made perpendicular to the x axis
+        yaxes = np.array(yaxes, dtype=float).reshape(-1, 3)
+        zaxes = _unitize(np.cross(self.xaxes, yaxes))
+        self.yaxes = np.cross(zaxes, self.xaxes)
+        if dimensions is None:
+            dimensions = [brick_cls.LENGTH, brick_cls.WIDTH, brick_cls.HEIGHT]
+        self.dimensions = np.array(np.broadcast_to(np.asarray(dimensions, dtype=float), self.points.shape))
+
+    @classmethod
+    def from_frames(cls, frames, brick_cls=Brick):
+        # Frames stored as arrays (frame_file.FrameArray) are used as they are
+        if hasattr(frames, "points") and hasattr(frames, "xaxes"):
+            return cls(frames.points, frames.xaxes, frames.yaxes, brick_cls)
+        points = [list(frame.point) for frame in frames]
+        xaxes = [list(frame.xaxis) for frame in frames]
+        yaxes = [list(frame.yaxis) for frame in frames]
+        return cls(points, xaxes, yaxes, brick_cls)
+
+    @classmethod
+    def from_pick_frames(cls, frames, brick_cls=Brick):
+        # Bricks from their pick frames, as exported for the robot. The x axis of a flipped pick frame stays
+        # flipped, which describes the same box.
+        collection = cls.from_frames(frames, brick_cls)
+        collection.points[:, 2] -= brick_cls.PICK_SIDE * collection.dimensions[:, 2] / 2
+        return collection
+
+    @classmethod
+    def from_bricks(cls, bricks):
+        # All bricks have to be of the same type, the type of the first brick is used
+        bricks = list(bricks)
+        collection = cls.from_frames([brick.frame for brick in bricks], type(bricks[0]) if bricks else Brick)
+        collection.dimensions = np.array([[brick.length, brick.width, brick.height] for brick in bricks], dtype=float).reshape(-1, 3)
+        return collection
+
+    def __len__(self):
+        return len(self.points)
+
+    def __str__(self):
+        return f"BrickCollection of {len(self)} {self.brick_cls.__name__}s"
+
+    def __getitem__(self, index):
+        # One Brick for an integer, a smaller collection for a slice or an array of indices
+        if isinstance(index, (int, np.integer)):
+            return self.get_brick(index)
+        return BrickCollection(self.points[index], self.xaxes[index], self.yaxes[index], self.brick_cls, self.dimensions[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_brick(index)
+
+    @property
+    def zaxes(self):
+        return np.cross(self.xaxes, self.yaxes)
+
+    def get_frame(self, index):
+        return Frame(self.points[index].tolist(), self.xaxes[index].tolist(), self.yaxes[index].tolist())
+
+    def get_brick(self, index):
+        # A new Brick with a copy of the frame, changing it does not change the collection
+        brick = self.brick_cls(self.get_frame(index))
+        brick.length, brick.width, brick.height = self.dimensions[index].tolist()
+        return brick
+
+    def get_frames(self):
+        return [self.get_frame(index) for index in range(len(self))]
+
+    def translate(self, vector):
+        # vector: one (3,) translation for all bricks or (N, 3), one per brick
+        self.points += np.asarray(vector, dtype=float)
+
+    def rotate(self, rotation_in_degrees):
+        # Rotates every brick around the world z axis through its frame point, like Brick.rotate
+        # rotation_in_degrees: one angle for all bricks or (N,), one per brick
+        angle = np.radians(np.asarray(rotation_in_degrees, dtype=float))
+        cos, sin = np.cos(angle), np.sin(angle)
+        for axes in (self.xaxes, self.yaxes):
+            x, y = axes[:, 0].copy(), axes[:, 1].copy()
+            axes[:, 0] = cos * x - sin * y
+            axes[:, 1] = sin * x + cos * y
+
+    def transform(self, transformation):
+        # Transforms all bricks with a compas Transformation (or a 4x4 matrix)
+        matrix = np.asarray(getattr(transformation, "matrix", transformation), dtype=float)
+        self.points = self.points @ matrix[:3, :3].T + matrix[:3, 3]
+        self.xaxes = _unitize(self.xaxes @ matrix[:3, :3].T)
+        self.yaxes = _unitize(self.yaxes @ matrix[:3, :3].T)
+
+    def get_pick_frames(self, as_frames=False):
+        """
+        Pick frames of all bricks, like Brick.get_pick_frame.
+
+        Returns (points, xaxes, yaxes) arrays, or a list of Frames if as_frames is True.
+        """
+        points = self.points.copy()
+        points[:, 2] += self.brick_cls.PICK_SIDE * self.dimensions[:, 2] / 2
+        # Frames pointing up get their x axis flipped, which flips the z axis
+        flip = self.zaxes[:, 2] > 0
+        xaxes = np.where(flip[:, None], -self.xaxes, self.xaxes)
+        if as_frames:
+            return [Frame(*frame) for frame in zip(points.tolist(), xaxes.tolist(), self.yaxes.tolist())]
+        return points, xaxes, self.yaxes.copy()
+
+    def get_corners(self):
+        # Corners (N, 8, 3) of all bricks, in the order of compas Box vertices
+        local = BOX_CORNERS[None, :, :] * self.dimensions[:, None, :]
+        axes = np.stack([self.xaxes, self.yaxes, self.zaxes], axis=1)
+        return self.points[:, None, :] + local @ axes
+
+    def draw(self):
+        # One Box per brick, like Brick.draw
+        return [self.get_brick(index).draw() for index in range(len(self))]
+
+    def draw_mesh(self):
+        # All bricks as one mesh, much lighter than one Box per brick for large walls
+        vertices = self.get_corners().reshape(-1, 3)
+        faces = (BOX_FACES[None, :, :] + 8 * np.arange(len(self))[:, None, None]).reshape(-1, 4)
+        return Mesh.from_vertices_and_faces(vertices.tolist(), faces.tolist())
+
+
+# Wall layouts along a curve, like the brick wall components of the Grasshopper files:
+#   stack:    every course on the same divisions
+#   running:  the curve is divided twice as fine as the bricks, even courses on even divisions, odd courses on odd ones
+#   flemish:  stretchers and headers alternate in every course, headers are centered over the stretchers below
+BONDS = ("stack", "running", "flemish")
+
+
+def generate_wall(curve_samples, layers, brick_cls=Brick, gap=0.0, bond="running", z_offset=0.0, resolution=1000):
+    """
+    Lays out a wall along a curve, all courses at once.
+
+    curve_samples: (M, 3) points along the curve, a compas Polyline, or a compas curve (divided into resolution points)
+    layers: number of courses
+    brick_cls: Brick or BigBrick
+    gap: gap between the bricks along the curve
+    bond: one of BONDS
+    z_offset: added to the height of every brick, the 301 wall is lifted by brick_cls.HEIGHT / 2
+    Returns a BrickCollection, course by course and along the curve within a course.
+    """
+    if bond not in BONDS:
+        raise ValueError("Unknown bond %r, use one of %s" % (bond, ", ".join(BONDS)))
+    points = _sample_curve(curve_samples, resolution)
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    total = cumulative[-1]
+
+    length, width, height = brick_cls.LENGTH, brick_cls.WIDTH, brick_cls.HEIGHT
+    if bond == "flemish":
+        # A stretcher and a header take length + width + 2 gaps, their centers are half of that apart
+        step = (length + width + 2 * gap) / 2
+        count = int(total / step)
+    else:
+        count = int(total / (length + gap)) * 2
+        step = total / count if count else 0.0
+    divisions = np.arange(count + 1)
+    centers, tangents = _evaluate_curve(points, cumulative, divisions * step)
+    normals = _unitize(np.cross(tangents, [0.0, 0.0, 1.0]))
+
+    # (layers, divisions): which division holds a brick in every course, and which bricks are headers
+    rows = np.arange(layers)[:, None]
+    if bond == "stack":
+        used = np.broadcast_to(divisions % 2 == 0, (layers, len(divisions)))
+    elif bond == "running":
+        used = (divisions + rows) % 2 == 0
+    else:
+        used = np.ones((layers, len(divisions)), dtype=bool)
+    headers = (bond == "flemish") & ((divisions + rows) % 2 == 1)
+
+    row, column = np.nonzero(used)
+    header = headers[row, column]
+    brick_points = centers[column] + np.stack([np.zeros_like(row), np.zeros_like(row), row * height + z_offset], axis=1)
+    # Headers are turned by 90 degrees: the x axis goes across the wall
+    xaxes = np.where(header[:, None], normals[column], tangents[column])
+    yaxes = np.where(header[:, None], -tangents[column], normals[column])
+    return BrickCollection(brick_points, xaxes, yaxes, brick_cls)
+
+
+def _sample_curve(curve, resolution):
+    if isinstance(curve, Polyline):
+        return np.array([list(point) for point in curve.points], dtype=float)
+    if isinstance(curve, Line):
+        return np.array([list(curve.start), list(curve.end)], dtype=float)
+    if hasattr(curve, "point_at"):
+        # Evenly spaced parameters, most compas curves (Circle, Ellipse, ...) don't implement divide_by_count.
+        # The wall is laid out by length along the samples, so they don't have to be evenly spaced.
+        start, end = getattr(curve, "domain", (0.0, 1.0))
+        return np.array([list(curve.point_at(t)) for t in np.linspace(start, end, resolution).tolist()], dtype=float)
+    return np.asarray(curve, dtype=float).reshape(-1, 3)
+
+
+def _evaluate_curve(points, cumulative, distances):
+    # Points and unit tangents at distances along a polyline, tangents from central differences
+    total = cumulative[-1]
+    h = min(1.0, total / 1000.0)
+    along = [np.interp(distances, cumulative, points[:, k]) for k in range(3)]
+    ahead = [np.interp(np.minimum(distances + h, total), cumulative, points[:, k]) for k in range(3)]
+    behind = [np.interp(np.maximum(distances - h, 0.0), cumulative, points[:, k]) for k in range(3)]
+    return np.stack(along, axis=1), _unitize(np.stack(ahead, axis=1) - np.stack(behind, axis=1))
+
+
+def _unitize(vectors):
+    length = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(length > 0, length, 1.0)
+
+
+if __name__ == "__main__":
+    # Memory and draw time of a 50k brick wall
+    import time
+    import tracemalloc
+
+    frames = [Frame([i * BigBrick.LENGTH, 0, 0], [1, 0, 0], [0, 1, 0]) for i in range(50000)]
+    tracemalloc.start()
+    bricks = [BigBrick(frame) for frame in frames]
+    print("%d bricks: %.0f bytes per brick (without its frame)" % (len(bricks), tracemalloc.get_traced_memory()[0] / len(bricks)))
+    tracemalloc.stop()
+    # The first pass computes the pick frames, the second one hits the cache, rotating invalidates it again
+    for label, rotate in (("first draw", False), ("redraw", False), ("redraw after rotating", True)):
+        if rotate:
+            for brick in bricks:
+                brick.rotate(90)
+        start = time.perf_counter()
+        boxes = [brick.draw() for brick in bricks]
+        middle = time.perf_counter()
+        pick_frames = [brick.get_pick_frame() for brick in bricks]
+        print("%s: boxes %.3f s, pick frames %.3f s" % (label, middle - start, time.perf_counter() - middle))
@@ -0,0 +1,104 @@
+import numpy as np
+from compas.geometry import Frame
+from compas.geometry import Transformation
+
+# Plans the transfers between picking and placing bricks.
+# A build is a chain of safe frames: safe pick -> safe place 1 -> safe pick -> safe place 2 -> ...
+# Every transfer between two safe frames either goes straight at safe height
+# or, when the straight line crosses a forbidden region, through the home configuration.
+
+
+def to_world(frame, wobj_frame):
+    # Express a frame given in a work object in wobj0 (robot base) coordinates
+    if wobj_frame is None:
+        return None
+    return frame.transformed(Transformation.from_frame(wobj_frame))
+
+
+def segments_cross_boxes(starts, ends, boxes, clearance=0.0):
+    """
+    Vectorized slab test: which straight segments pass through any of the axis-aligned boxes.
+
+    starts, ends: (N, 3) arrays of segment end points
+    boxes: list of (min_xyz, max_xyz) tuples
+    clearance: distance the segments have to keep from the boxes
+    Returns an (N,) boolean array.
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 3)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 3)
+    direction = ends - starts
+    crossing = np.zeros(len(starts), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse = 1.0 / direction
+        for box_min, box_max in boxes:
+            box_min = np.asarray(box_min, dtype=float) - clearance
+            box_max = np.asarray(box_max, dtype=float) + clearance
+            t0 = (box_min - starts) * inverse
+            t1 = (box_max - starts) * inverse
+            t_near = np.minimum(t0, t1)
+            t_far = np.maximum(t0, t1)
+            # segments parallel to a slab are inside it for all t, or for none
+            parallel = direction == 0
+            inside = (starts >= box_min) & (starts <= box_max)
+            t_near = np.where(parallel, np.where(inside, -np.inf, np.inf), t_near)
+            t_far = np.where(parallel, np.where(inside, np.inf, -np.inf), t_far)
+            enter = np.max(t_near, axis=1)
+            leave = np.min(t_far, axis=1)
+            crossing |= (enter <= leave) & (leave >= 0) & (enter <= 1)
+    return crossing
+
+
+def plan_home_returns(pick_frame, place_frames, wobj_frame, forbidden_regions,
+                      offset=300.0, clearance=0.0, same_ext_axes=True):
+    """
+    Decides for every brick whether the robot has to go through home after picking and after placing.
+
+    pick_frame: pick frame in wobj0
+    place_frames: place frames in the work object of the build
+    wobj_frame: frame of that work object in wobj0, None if unknown (then every transfer goes home)
+    forbidden_regions: list of (min_xyz, max_xyz) boxes in wobj0 that transfers must not cross
+    offset: height of the safe frames above pick and place frames
+    clearance: distance transfers keep from the forbidden regions (gripper and brick size)
+    same_ext_axes: False if the external axes move between pick and place,
+        then the base moves during the transfer and every transfer goes home
+    Returns a list of (home_after_pick, home_after_place) tuples, one per brick.
+    The last brick always returns home.
+    """
+    n = len(place_frames)
+    if n == 0:
+        return []
+    if wobj_frame is None or not same_ext_axes:
+        return [(True, True)] * n
+
+    safe_pick = pick_frame.translated([0, 0, offset]).point
+    safe_places = np.array([to_world(frame.translated([0, 0, offset]), wobj_frame).point for frame in place_frames])
+    safe_picks = np.repeat([list(safe_pick)], n, axis=0)
+
+    # safe pick -> safe place i, and safe place i -> safe pick
+    home_after_pick = segments_cross_boxes(safe_picks, safe_places, forbidden_regions, clearance)
+    home_after_place = segments_cross_boxes(safe_places, safe_picks, forbidden_regions, clearance)
+    home_after_place[-1] = True
+    return list(zip(home_after_pick.tolist(), home_after_place.tolist()))
+
+
+def count_home_moves(plan):
+    # Number of moves to the home configuration for a plan (plus the initial one)
+    return 1 + sum(int(after_pick) + int(after_place) for after_pick, after_place in plan)
+
+
+def count_baseline_home_moves(bricks):
+    # Number of moves to the home configuration of the original brick loop:
+    # before picking, after picking and after placing every brick
+    return 3 * bricks
+
+
+if __name__ == "__main__":
+    # Example: a base column in the middle, bricks on either side of it
+    pick = Frame([-1258.6, -890.3, -107.8], [-1, 0, 0], [0, 1, 0])
+    base_column = ((-500.0, -500.0, -1000.0), (500.0, 500.0, 3000.0))
+    wobj = Frame([-1000.0, 500.0, 0.0], [1, 0, 0], [0, 1, 0])
+    places = [Frame([x, y, 0.0], [1, 0, 0], [0, 1, 0]) for x in (-200.0, 1800.0) for y in (0.0, 200.0)]
+    plan = plan_home_returns(pick, places, wobj, [base_column], clearance=100.0)
+    for frame, (after_pick, after_place) in zip(places, plan):
+        print(frame.point, "home after pick:", after_pick, "home after place:", after_place)
+    print("home moves: %d instead of %d" % (count_home_moves(plan), count_baseline_home_moves(len(places))))
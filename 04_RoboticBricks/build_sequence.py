@@ -0,0 +1,212 @@
+import math
+import heapq
+
+import numpy as np
+
+from brick_wall import Brick
+
+# Orders the bricks of a build.
+# A brick can only be placed once the bricks it rests on (overlapping footprint, one course below) are placed.
+# Within that constraint the file order is kept. The order does not change the travel: every brick is
+# picked at the same pick frame, so each one costs the same pick -> place -> pick transfer in any order.
+
+
+def frames_to_arrays(frames):
+    # Points (N, 3) and in-plane x axes (N, 2) of a list of frames, or of frames stored as arrays (frame_file.FrameArray)
+    if hasattr(frames, "points") and hasattr(frames, "xaxes"):
+        points = np.array(frames.points, dtype=float)
+        xaxes = np.array(frames.xaxes[:, :2], dtype=float)
+    else:
+        points = np.array([list(frame.point) for frame in frames], dtype=float).reshape(-1, 3)
+        xaxes = np.array([[frame.xaxis.x, frame.xaxis.y] for frame in frames], dtype=float).reshape(-1, 2)
+    norm = np.linalg.norm(xaxes, axis=1)
+    xaxes /= np.where(norm > 0, norm, 1.0)[:, None]
+    return points, xaxes
+
+
+def get_courses(z, height, tolerance=0.25):
+    """
+    Course index of every brick, counted from the lowest brick.
+
+    z: (N,) heights of the brick frames
+    height: brick height
+    tolerance: allowed deviation from a multiple of the brick height, as a fraction of it
+    """
+    z = np.asarray(z, dtype=float)
+    if len(z) == 0:
+        return np.zeros(0, dtype=int)
+    level = (z - z.min()) / height
+    courses = np.rint(level).astype(int)
+    off = np.abs(level - courses) > tolerance
+    if off.any():
+        raise ValueError("Brick %d is not on a course (z = %.1f)" % (np.argmax(off), z[np.argmax(off)]))
+    return courses
+
+
+def get_footprints(points, xaxes, length, width):
+    # Corners (N, 4, 2) of the brick footprints in plan
+    x = xaxes * (length / 2.0)
+    y = np.stack([-xaxes[:, 1], xaxes[:, 0]], axis=1) * (width / 2.0)
+    center = points[:, :2]
+    return np.stack([center - x - y, center + x - y, center + x + y, center - x + y], axis=1)
+
+
+def footprints_overlap(a, b, min_overlap=1.0):
+    """
+    Separating axis test for pairs of rectangles.
+
+    a, b: (M, 4, 2) corners of the rectangles to compare pairwise
+    min_overlap: rectangles that overlap less than this along any axis only touch
+    Returns an (M,) boolean array.
+    """
+    overlap = np.ones(len(a), dtype=bool)
+    for corners in (a, b):
+        for edge in (corners[:, 1] - corners[:, 0], corners[:, 3] - corners[:, 0]):
+            axis = edge / np.linalg.norm(edge, axis=1)[:, None]
+            pa = np.einsum("mkj,mj->mk", a, axis)
+            pb = np.einsum("mkj,mj->mk", b, axis)
+            depth = np.minimum(pa.max(axis=1), pb.max(axis=1)) - np.maximum(pa.min(axis=1), pb.min(axis=1))
+            overlap &= depth > min_overlap
+    return overlap
+
+
+class GridIndex:
+    """Uniform grid over the plan (x, y) positions of points, for neighbour queries."""
+
+    def __init__(self, points, cell_size, indices=None):
+        # indices: the points to index initially, all of them if None
+        self.points = np.asarray(points, dtype=float)
+        self.cell_size = float(cell_size)
+        self.cells = {}
+        if indices is None:
+            indices = range(len(self.points))
+        for index in indices:
+            self.add(index)
+
+    def get_keys(self, points):
+        return np.floor(np.asarray(points, dtype=float)[..., :2] / self.cell_size).astype(int)
+
+    def add(self, index):
+        key = tuple(self.get_keys(self.points[index]).tolist())
+        self.cells.setdefault(key, set()).add(int(index))
+
+    def remove(self, index):
+        key = tuple(self.get_keys(self.points[index]).tolist())
+        cell = self.cells[key]
+        cell.discard(index)
+        if not cell:
+            del self.cells[key]
+
+    def neighbours(self, point, rings=1):
+        # Indices in the cell of the point and the surrounding rings of cells
+        i, j = self.get_keys(point).tolist()
+        found = []
+        for di in range(-rings, rings + 1):
+            for dj in range(-rings, rings + 1):
+                found.extend(self.cells.get((i + di, j + dj), ()))
+        return found
+
+
+def get_supports(frames, length=Brick.LENGTH, width=Brick.WIDTH, height=Brick.HEIGHT, min_overlap=1.0):
+    """
+    The bricks every brick rests on: bricks in the course below with an overlapping footprint.
+
+    Returns a list with an array of brick indices per brick.
+    """
+    points, xaxes = frames_to_arrays(frames)
+    n = len(points)
+    courses = get_courses(points[:, 2], height)
+    footprints = get_footprints(points, xaxes, length, width)
+    supports = [np.zeros(0, dtype=int) for _ in range(n)]
+    if n == 0:
+        return supports
+
+    # Bricks whose centers are more than one brick diagonal apart can't overlap
+    cell_size = math.hypot(length, width)
+    for course in range(1, courses.max() + 1):
+        below = np.flatnonzero(courses == course - 1)
+        above = np.flatnonzero(courses == course)
+        if len(below) == 0 or len(above) == 0:
+            continue
+        grid = GridIndex(points[below], cell_size)
+        pairs = [(i, below[k]) for i in above for k in grid.neighbours(points[i])]
+        if not pairs:
+            continue
+        pairs = np.array(pairs)
+        overlap = footprints_overlap(footprints[pairs[:, 0]], footprints[pairs[:, 1]], min_overlap)
+        for i, j in pairs[overlap]:
+            supports[i] = np.append(supports[i], j)
+    return supports
+
+
+def count_precedence_violations(order, supports):
+    # Number of bricks placed before one of the bricks they rest on
+    position = np.empty(len(order), dtype=int)
+    position[np.asarray(order, dtype=int)] = np.arange(len(order))
+    return sum(int(len(s) > 0 and position[s].max() > position[i]) for i, s in enumerate(supports))
+
+
+def sequence_bricks(frames, brick_cls=Brick, min_overlap=1.0):
+    """
+    Orders the bricks so that every brick is placed after the bricks it rests on, keeping the file order
+    otherwise: a brick only moves if it comes before one of its supports.
+
+    frames: place frames in the work object of the build
+    brick_cls: Brick or BigBrick, for the dimensions used to find which bricks rest on which
+    Returns (order, report): a list of brick indices and a dict with the number of bricks placed before
+    their supports in the file order and the number of bricks that moved.
+    """
+    n = len(frames)
+    supports = get_supports(frames, brick_cls.LENGTH, brick_cls.WIDTH, brick_cls.HEIGHT, min_overlap)
+
+    # Number of unplaced supports per brick, and the bricks resting on each brick
+    waiting = np.array([len(s) for s in supports], dtype=int)
+    resting = [[] for _ in range(n)]
+    for i, s in enumerate(supports):
+        for j in s:
+            resting[j].append(i)
+
+    # Always place the placeable brick that comes first in the file
+    placeable = np.flatnonzero(waiting == 0).tolist()
+    heapq.heapify(placeable)
+    order = []
+    while placeable:
+        index = heapq.heappop(placeable)
+        order.append(index)
+        for i in resting[index]:
+            waiting[i] -= 1
+            if waiting[i] == 0:
+                heapq.heappush(placeable, i)
+    if len(order) != n:
+        raise ValueError("Bricks rest on each other in a loop, no valid order")
+
+    report = {
+        "bricks": n,
+        "precedence_violations_before": count_precedence_violations(list(range(n)), supports),
+        "moved": int(np.count_nonzero(np.asarray(order, dtype=int) != np.arange(n))),
+    }
+    return order, report
+
+
+def print_report(report):
+    print("%d bricks, %d placed before the bricks they rest on in the file order, %d moved" % (
+        report["bricks"], report["precedence_violations_before"], report["moved"]))
+
+
+if __name__ == "__main__":
+    import time
+    from compas.geometry import Frame
+    from brick_wall import BigBrick
+
+    # Running bond wall, 100 bricks per course, shuffled
+    for courses in (10, 100):
+        frames = []
+        for course in range(courses):
+            shift = (course % 2) * BigBrick.LENGTH / 2
+            for k in range(100):
+                frames.append(Frame([k * BigBrick.LENGTH + shift, 0, course * BigBrick.HEIGHT], [1, 0, 0], [0, 1, 0]))
+        frames = [frames[i] for i in np.random.default_rng(0).permutation(len(frames))]
+        start = time.perf_counter()
+        order, report = sequence_bricks(frames, brick_cls=BigBrick)
+        print("--- sequenced in %.2f s" % (time.perf_counter() - start))
+        print_report(report)
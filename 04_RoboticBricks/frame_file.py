@@ -0,0 +1,186 @@
+import os
+import json
+
+import numpy as np
+from compas.geometry import Frame
+
+# Compact file format for brick frames, instead of out_brickframes.json:
+#   magic b"BRKF", header length (uint32, little endian), JSON header padded with spaces to 64 byte alignment,
+#   then one record per frame: point, x axis and y axis as 9 float64.
+# The header carries the work object and anything else of the JSON export ("wobj", "brick_type", ...).
+# About 72 bytes per frame instead of ~300 in JSON, and the frames can be memory mapped or read while the file streams in.
+
+MAGIC = b"BRKF"
+ALIGNMENT = 64
+RECORD_DTYPE = np.dtype("<f8")
+RECORD_SIZE = 9
+
+
+class FrameArray:
+    """Frames stored as (N, 9) rows of point, x axis and y axis, Frames are only made when accessed."""
+
+    def __init__(self, records):
+        self.records = records
+
+    @classmethod
+    def from_frames(cls, frames):
+        records = np.array([list(frame.point) + list(frame.xaxis) + list(frame.yaxis) for frame in frames], dtype=float)
+        return cls(records.reshape(-1, RECORD_SIZE))
+
+    @property
+    def points(self):
+        return self.records[:, 0:3]
+
+    @property
+    def xaxes(self):
+        return self.records[:, 3:6]
+
+    @property
+    def yaxes(self):
+        return self.records[:, 6:9]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        # One Frame for an integer, a smaller FrameArray for a slice, a list or array of indices or a boolean mask
+        if isinstance(index, slice):
+            return FrameArray(self.records[index])
+        index = np.asarray(index)
+        if index.size == 0:
+            index = index.astype(int)
+        if index.ndim > 1:
+            raise IndexError("FrameArray only takes one dimensional indices")
+        if index.ndim == 1:
+            return FrameArray(self.records[index])
+        if index.dtype.kind not in "iu":
+            raise IndexError("FrameArray indices must be integers, slices or arrays of them, not %r" % index.item())
+        row = self.records[index.item()].tolist()
+        return Frame(row[0:3], row[3:6], row[6:9])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def dump_frames(data, filename):
+    """
+    Writes brick frames in the compact format.
+
+    data: dict as exported to JSON, with "frames" (Frames or a FrameArray) and other keys such as "wobj"
+    """
+    frames = data["frames"]
+    if not isinstance(frames, FrameArray):
+        frames = FrameArray.from_frames(frames)
+    header = {key: value for key, value in data.items() if key != "frames"}
+    header["count"] = len(frames)
+    with open(filename, "wb") as f:
+        f.write(_pack_header(header))
+        f.write(np.ascontiguousarray(frames.records, dtype=RECORD_DTYPE).tobytes())
+
+
+def _pack_header(header):
+    text = json.dumps(header).encode("utf-8")
+    size = len(MAGIC) + 4 + len(text)
+    text += b" " * (-size % ALIGNMENT)
+    return MAGIC + np.uint32(len(text)).astype("<u4").tobytes() + text
+
+
+def _read_header(f):
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Not a brick frame file")
+    length = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+    return json.loads(f.read(length).decode("utf-8")), len(MAGIC) + 4 + length
+
+
+def load_frames(filename, mmap=True):
+    """
+    Reads a file written by dump_frames.
+
+    mmap: map the frames from the file instead of reading them, nothing is read until a frame is accessed
+    Returns a dict like the JSON export, "frames" is a FrameArray.
+    """
+    with open(filename, "rb") as f:
+        header, offset = _read_header(f)
+    count = header.pop("count")
+    available = (os.path.getsize(filename) - offset) // (RECORD_SIZE * RECORD_DTYPE.itemsize)
+    if available < count:
+        raise EOFError("Brick frame file ended after %d of %d frames" % (available, count))
+    if mmap and count:
+        records = np.memmap(filename, dtype=RECORD_DTYPE, mode="r", offset=offset, shape=(count, RECORD_SIZE))
+    else:
+        records = np.fromfile(filename, dtype=RECORD_DTYPE, count=count * RECORD_SIZE, offset=offset)
+        records = records.reshape(count, RECORD_SIZE)
+    header["frames"] = FrameArray(records)
+    return header
+
+
+def iter_frames(filename, chunk_size=256):
+    """
+    Yields the frames of a file written by dump_frames one by one, reading chunk_size frames at a time.
+
+    Returns the header (without "frames") when done, as the value of StopIteration.
+    """
+    with open(filename, "rb") as f:
+        header, _ = _read_header(f)
+        count = remaining = header.pop("count")
+        record_bytes = RECORD_SIZE * RECORD_DTYPE.itemsize
+        while remaining:
+            data = f.read(min(chunk_size, remaining) * record_bytes)
+            read = len(data) // record_bytes
+            if not data or len(data) % record_bytes:
+                raise EOFError("Brick frame file ended after %d of %d frames%s" % (
+                    count - remaining + read, count, ", in the middle of a frame" if data else ""))
+            for frame in FrameArray(np.frombuffer(data, dtype=RECORD_DTYPE).reshape(-1, RECORD_SIZE)):
+                yield frame
+            remaining -= read
+    return header
+
+
+def read_header(filename):
+    # The header of a file written by dump_frames, with "count"
+    with open(filename, "rb") as f:
+        return _read_header(f)[0]
+
+
+def load_brick_frames(filename, mmap=True):
+    # Loads out_brickframes.json or its compact version, depending on the extension
+    if str(filename).endswith(".json"):
+        from compas.data import json_load
+
+        return json_load(filename)
+    return load_frames(filename, mmap)
+
+
+if __name__ == "__main__":
+    # Size and load time of the JSON export and the compact file for 100k frames
+    import os
+    import sys
+    import tempfile
+    import time
+    from compas.data import json_dump, json_load
+
+    if len(sys.argv) == 3:
+        # Convert: python frame_file.py data/out_brickframes.json data/out_brickframes.bin
+        dump_frames(json_load(sys.argv[1]), sys.argv[2])
+        sys.exit()
+
+    rng = np.random.default_rng(0)
+    frames = [Frame(rng.uniform(-2000, 2000, 3).tolist(), rng.normal(size=3).tolist(), rng.normal(size=3).tolist())
+              for _ in range(100000)]
+    data = {"wobj": "w_pallet0", "frames": frames}
+    directory = tempfile.mkdtemp()
+    json_file, bin_file = os.path.join(directory, "frames.json"), os.path.join(directory, "frames.bin")
+    json_dump(data, json_file)
+    dump_frames(data, bin_file)
+
+    for name, load in (("json", lambda: json_load(json_file)["frames"][0]),
+                       ("mmap", lambda: load_frames(bin_file)["frames"][0]),
+                       ("read", lambda: load_frames(bin_file, mmap=False)["frames"][0]),
+                       ("iterate", lambda: next(iter_frames(bin_file)))):
+        start = time.perf_counter()
+        load()
+        print("%8s: first frame after %.4f s" % (name, time.perf_counter() - start))
+    print("json: %.0f bytes per frame, compact: %.0f bytes per frame" % (
+        os.path.getsize(json_file) / len(frames), os.path.getsize(bin_file) / len(frames)))
@@ -0,0 +1,356 @@
+"""
+This module contains small benchmarks for the script generation and communication helpers.
+Run from this folder, e.g.:
+    python benchmarks.py move_l_many
+"""
+
+import sys
+import math
+import time
+import random
+
+import numpy as np
+import compas.geometry as cg
+import simple_comm
+import simple_ur_script
+import utils
+import ur_kinematics
+import ur_emulator
+import cycle_time
+import path_simplify
+
+
+def _timeit(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _random_frames(n, seed=0):
+    random.seed(seed)
+    frames = []
+    for _ in range(n):
+        point = [random.uniform(-500, 500) for _ in range(3)]
+        xaxis = [random.gauss(0, 1) for _ in range(3)]
+        yaxis = [random.gauss(0, 1) for _ in range(3)]
+        frames.append(cg.Frame(point, xaxis, yaxis))
+    return frames
+
+
+def bench_move_l_many(sizes=(1000, 10000, 100000)):
+    """
+    Compares per-frame move_l_blend calls against one move_l_many call
+    """
+    print("%10s %12s %12s %9s" % ("frames", "scalar [s]", "batch [s]", "speedup"))
+    for n in sizes:
+        frames = _random_frames(n)
+        t_scalar, scalar = _timeit(lambda: "".join([simple_ur_script.move_l_blend(f, 1.0, 0.1, 5) for f in frames]))
+        t_batch, batch = _timeit(simple_ur_script.move_l_many, frames, 1.0, 0.1, 5)
+        assert scalar == batch
+        print("%10d %12.4f %12.4f %8.1fx" % (n, t_scalar, t_batch, t_scalar / t_batch))
+
+
+def _concatenate_script_quadratic(list_ur_commands):
+    # Previous implementation of simple_comm.concatenate_script, kept for comparison
+    ur_script = "\ndef my_script():\n"
+    combined_script = ""
+    for ur_cmd in list_ur_commands:
+        combined_script += ur_cmd
+    for l in combined_script.split("\n"):
+        ur_script += "\t" + l + "\n"
+    ur_script += "end\n"
+    ur_script += "\nmy_script()\n"
+    return ur_script
+
+
+def bench_concatenate_script(sizes=(1000, 10000, 50000)):
+    """
+    Compares the string += assembly against ScriptBuilder for one giant string of movel lines
+    """
+    print("%10s %12s %12s %9s" % ("lines", "+= [s]", "builder [s]", "speedup"))
+    for n in sizes:
+        script = simple_ur_script.move_l_many(_random_frames(n), 1.0, 0.1, 5)
+        t_old, old = _timeit(_concatenate_script_quadratic, script)
+        t_new, new = _timeit(simple_comm.concatenate_script, script)
+        assert old == new
+        print("%10d %12.4f %12.4f %8.1fx" % (n, t_old, t_new, t_old / t_new))
+
+
+def bench_pose_cache(n_bricks=5000):
+    """
+    Pick-and-place pattern: the same safe pick and pick frames for every brick, one new place frame per brick
+    """
+    pick = cg.Frame([-1258.6, -890.3, -107.8], [-1.0, -0.016, 0.003], [-0.016, 1.0, -0.011])
+    safe_pick = pick.translated([0, 0, 300])
+    places = _random_frames(n_bricks)
+
+    def program():
+        script = []
+        for place in places:
+            for frame in (safe_pick, pick, safe_pick, place.translated([0, 0, 300]), place):
+                script.append(simple_ur_script.move_l(frame, 1.0, 0.1))
+        return "".join(script)
+
+    simple_ur_script.POSE_CACHE.maxsize = 0
+    simple_ur_script.POSE_CACHE.clear()
+    t_off, off = _timeit(program)
+    simple_ur_script.POSE_CACHE.maxsize = 4096
+    simple_ur_script.POSE_CACHE.clear()
+    t_on, on = _timeit(program)
+    assert off == on
+    print("%d bricks: no cache %.3f s, cache %.3f s (%.1fx), %s" % (
+        n_bricks, t_off, t_on, t_off / t_on, simple_ur_script.POSE_CACHE.info()))
+
+
+def _matrix_to_axis_angle_euclideanspace(m):
+    # Previous implementation of utils.matrix_to_axis_angle, kept for comparison
+
+    epsilon = 0.01
+    epsilon2 = 0.01
+
+    # Access matrix elements using array indexing
+    if (math.fabs(m[0,1] - m[1,0]) < epsilon) & (math.fabs(m[0,2] - m[2,0]) < epsilon) & (math.fabs(m[1,2] - m[2,1]) < epsilon):
+    #singularity found
+    #first check for identity matrix which must have +1 for all terms
+    #in leading diagonal and zero in other terms
+        if (math.fabs(m[0,1] + m[1,0]) < epsilon2) & (math.fabs(m[0,2] + m[2,0]) < epsilon2) & (math.fabs(m[1,2] + m[2,1]) < epsilon2) & (math.fabs(m[0,0] + m[1,1] + m[2,2] - 3) < epsilon2):
+            #this singularity is identity matrix so angle = 0   make zero angle, arbitrary axis
+            angle = 0
+            x = 1
+            y = z = 0
+        else:
+            # otherwise this singularity is angle = 180
+            angle = math.pi;
+            xx = (m[0,0] + 1) / 2
+            yy = (m[1,1] + 1) / 2
+            zz = (m[2,2] + 1) / 2
+            xy = (m[0,1] + m[1,0]) / 4
+            xz = (m[0,2] + m[2,0]) / 4
+            yz = (m[1,2] + m[2,1]) / 4
+            if ((xx > yy) & (xx > zz)):
+                # m[0,0] is the largest diagonal term
+                if (xx < epsilon):
+                    x = 0
+                    y = z = 0.7071
+                else:
+                    x = math.sqrt(xx)
+                    y = xy / x
+                    z = xz / x
+            elif (yy > zz):
+                # m[1,1] is the largest diagonal term
+                if (yy < epsilon):
+                    x = z = 0.7071
+                    y = 0
+                else:
+                    y = math.sqrt(yy)
+                    x = xy / y
+                    z = yz / y
+            else:
+                # m[2,2] is the largest diagonal term so base result on this
+                if (zz < epsilon):
+                    x = y = 0.7071
+                    z = 0
+                else:
+                    z = math.sqrt(zz)
+                    x = xz / z
+                    y = yz / z
+    else:
+        s = math.sqrt((m[2,1] - m[1,2]) * (m[2,1] - m[1,2])+ (m[0,2] - m[2,0]) * (m[0,2] - m[2,0])+ (m[1,0] - m[0,1]) * (m[1,0] - m[0,1])); # used to normalise
+        if (math.fabs(s) < 0.001):
+            #prevent divide by zero, should not happen if matrix is orthogonal and should be
+            s = 1
+        angle = math.acos((m[0,0] + m[1,1] + m[2,2] - 1) / 2)
+        x = (m[2,1] - m[1,2]) / s
+        y = (m[0,2] - m[2,0]) / s
+        z = (m[1,0] - m[0,1]) / s
+    angleRad = angle
+    axis = cg.Vector(x, y, z)
+    axis = axis * angleRad
+
+    return axis
+
+
+class _Matrix(object):
+    # Minimal m[i, j] access over nested lists, as used by the previous implementation
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getitem__(self, index):
+        return self.rows[index[0]][index[1]]
+
+
+def _random_rotations(n, seed=0):
+    # Uniformly distributed rotation matrices from random unit quaternions
+    rng = np.random.default_rng(seed)
+    q = rng.normal(size=(n, 4))
+    w, x, y, z = (q / np.linalg.norm(q, axis=1)[:, None]).T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=1),
+        np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=1),
+        np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=1),
+    ], axis=1)
+
+
+def _axis_angles_to_matrices(r):
+    # Rodrigues' formula, used to check the round trip
+    angle = np.linalg.norm(r, axis=1)
+    k = r / np.where(angle > 0, angle, 1.0)[:, None]
+    K = np.zeros((len(r), 3, 3))
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -k[:, 2], k[:, 1], -k[:, 0]
+    K = K - K.transpose(0, 2, 1)
+    s, c = np.sin(angle)[:, None, None], np.cos(angle)[:, None, None]
+    return np.eye(3) + s * K + (1 - c) * K @ K
+
+
+def bench_axis_angle(n=1000000):
+    """
+    Compares the previous scalar matrix_to_axis_angle against matrices_to_axis_angles on n random rotations,
+    plus rotations close to 0 and 180 degrees
+    """
+    matrices = _random_rotations(n)
+    near = []
+    for axis in ([1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 0], [1, 2, 3]):
+        for angle in (math.pi, math.pi - 1e-6, math.pi - 1e-3, 1e-3, 1e-6):
+            near.append(np.array(cg.Rotation.from_axis_and_angle(axis, angle).matrix)[:3, :3])
+    near = np.array(near)
+
+    wrapped = [_Matrix(m) for m in matrices.tolist()]
+    t_old, old = _timeit(lambda: np.array([list(_matrix_to_axis_angle_euclideanspace(m)) for m in wrapped]))
+    t_new, new = _timeit(utils.matrices_to_axis_angles, matrices)
+    print("%d rotations: scalar %.2f s, batch %.3f s (%.0fx)" % (n, t_old, t_new, t_old / t_new))
+
+    old_near = np.array([list(_matrix_to_axis_angle_euclideanspace(_Matrix(m))) for m in near.tolist()])
+    new_near = utils.matrices_to_axis_angles(near)
+    for name, result, result_near in (("scalar", old, old_near), ("batch", new, new_near)):
+        error = np.abs(_axis_angles_to_matrices(result) - matrices).max()
+        error_near = np.abs(_axis_angles_to_matrices(result_near) - near).max()
+        print("%8s max round-trip error: random %.1e, near 0/180 deg %.1e" % (name, error, error_near))
+
+
+def bench_forward_kinematics(n=10000, robot="UR5e"):
+    """
+    Compares chaining utils.dh_matrix transformations against ur_kinematics.forward_kinematics
+    """
+    joints = ur_kinematics.sample_joint_space(n, seed=0)
+    d, a, alpha = ur_kinematics.get_dh_parameters(robot)
+
+    def scalar():
+        return [utils.concatenate_matrices([utils.dh_matrix(d[i], q[i], a[i], alpha[i]) for i in range(6)])
+                for q in joints.tolist()]
+
+    t_old, old = _timeit(scalar)
+    t_new, new = _timeit(ur_kinematics.forward_kinematics, joints, robot)
+    assert np.allclose(np.array([m.matrix for m in old]), new)
+    print("%d configurations: scalar %.3f s, batch %.4f s (%.0fx)" % (n, t_old, t_new, t_old / t_new))
+
+
+def bench_emulator(time_scales=(1, 10, 50), duration=1.0, n_programs=50):
+    """
+    Real-time packet throughput of RealtimeReader and the script hand-over latency (send on 30002 until the
+    program state on 30003 reports the program playing) against the local controller emulator
+    """
+    print("%7s %14s %14s %9s %16s" % ("scale", "sent [1/s]", "read [1/s]", "skipped", "hand-over [ms]"))
+    for scale in time_scales:
+        with ur_emulator.UREmulator(time_scale=scale) as robot, \
+                simple_comm.RealtimeReader("127.0.0.1") as rt, simple_comm.URConnection("127.0.0.1") as ur:
+            sent = robot.packets
+            time.sleep(duration)
+            read, sent = rt.packets, robot.packets - sent
+            latencies = []
+            for _ in range(n_programs):
+                start = time.perf_counter()
+                ur.send(simple_comm.concatenate_script(simple_ur_script.sleep(0.01 * scale)))
+                simple_comm._wait_for(lambda: rt.latest()["program_state"] == simple_comm.PROGRAM_PLAYING, 1.0, 0.0001)
+                latencies.append(time.perf_counter() - start)
+                simple_comm._wait_for(lambda: rt.latest()["program_state"] == simple_comm.PROGRAM_STOPPED, 1.0, 0.0001)
+        print("%7g %14.0f %14.0f %9d %16.2f" % (scale, sent / duration, read / duration, rt.skipped,
+                                                1000 * np.median(latencies)))
+
+
+def bench_cycle_time(sizes=(1000, 10000, 100000)):
+    """
+    Cycle time estimates of spiral drawing paths with 1 mm blends, from the frames and from the generated script.
+    The script rounds poses to 0.1 mm, on dense paths that adds corners the robot has to slow down for.
+    """
+    print("%10s %12s %12s %14s %14s %8s %8s" % ("segments", "frames [s]", "script [s]", "from frames", "from script",
+                                                "slow", "blend"))
+    for n in sizes:
+        t = np.linspace(0, 20 * math.pi, n + 1)
+        points = np.column_stack((200 + 100 * np.cos(t) * (1 + t / 100), 100 * np.sin(t), np.zeros_like(t)))
+        t_frames, report = _timeit(cycle_time.estimate_path_time, points, 1.0, 0.25, 1.0)
+        script = simple_ur_script.move_l_many(points, 1.0, 0.25, 1.0)
+        t_script, script_report = _timeit(cycle_time.estimate_script_time, script)
+        print("%10d %12.4f %12.4f %12.1f s %12.1f s %8d %8d" % (
+            n, t_frames, t_script, report["total_time"], script_report["total_time"],
+            report["slow"].sum(), report["blend_limited"].sum()))
+
+
+def _calculate_blend_radius_loop(way_planes, radius):
+    # Previous implementation of utils.calculate_blend_radius, kept for comparison
+    radii = []
+    for i, frame in enumerate(way_planes[:-1]):
+        dist = frame.point.distance_to_point(way_planes[i + 1].point)
+        if abs(radius) > dist / 2:
+            radius = dist / 2
+        radii.append(radius)
+    radii.append(0.0)
+    return radii
+
+
+def bench_blend_radius(n_frames=100000, n_points=1000000, radius=2.0):
+    """
+    Compares the previous loop against utils.calculate_blend_radius on a drawing path whose point spacing varies,
+    then times the vectorized version on n_points points
+    """
+    t = np.linspace(0, 400 * math.pi, n_frames)
+    points = np.column_stack((200 * np.cos(t), 200 * np.sin(t) * np.cos(3 * t), np.zeros_like(t)))
+    frames = [cg.Frame(point, [1, 0, 0], [0, 1, 0]) for point in points.tolist()]
+    t_old, old = _timeit(_calculate_blend_radius_loop, frames, radius)
+    t_new, new = _timeit(utils.calculate_blend_radius, frames, radius)
+    t_array, array = _timeit(utils.calculate_blend_radius, points, radius)
+    assert np.array_equal(new, array)
+    print("%d frames: loop %.3f s, vectorized %.3f s from frames, %.4f s from points (%.0fx)" % (
+        n_frames, t_old, t_new, t_array, t_old / t_array))
+    print("mean blend radius: loop %.3f mm, vectorized %.3f mm" % (np.mean(old), np.mean(new)))
+
+    t = np.linspace(0, 4000 * math.pi, n_points)
+    points = np.column_stack((200 * np.cos(t), 200 * np.sin(t) * np.cos(3 * t), np.zeros_like(t)))
+    t_plain, _ = _timeit(utils.calculate_blend_radius, points, radius)
+    t_limited, _ = _timeit(utils.calculate_blend_radius, points, radius, 0.1, math.radians(60))
+    print("%d points: %.3f s, with max_deviation and max_angle %.3f s" % (n_points, t_plain, t_limited))
+
+
+def bench_simplify_path(n=1000000, tolerance=0.1, spacing=2.0, blend_radius=1.0):
+    """
+    Simplifies and resamples a dense spiral drawing path, with the estimated cycle time before and after
+    """
+    t = np.linspace(0, 400 * math.pi, n)
+    points = np.column_stack((200 * np.cos(t) * (1 + t / 2000), 200 * np.sin(t), 5 * np.sin(50 * t)))
+    before = cycle_time.estimate_path_time(points, 1.0, 0.1, utils.calculate_blend_radius(points, blend_radius))
+    for resample in (None, spacing):
+        elapsed, (simplified, report) = _timeit(path_simplify.simplify_path, points, tolerance, spacing=resample,
+                                                blend_radius=blend_radius)
+        after = cycle_time.estimate_path_time(simplified, 1.0, 0.1,
+                                              utils.calculate_blend_radius(simplified, blend_radius))
+        print("spacing %s: %.2f s" % (resample, elapsed))
+        path_simplify.print_report(report)
+        print("estimated cycle time %.0f s -> %.0f s" % (before["total_time"], after["total_time"]))
+
+
+BENCHMARKS = {
+    "move_l_many": bench_move_l_many,
+    "concatenate_script": bench_concatenate_script,
+    "pose_cache": bench_pose_cache,
+    "axis_angle": bench_axis_angle,
+    "forward_kinematics": bench_forward_kinematics,
+    "emulator": bench_emulator,
+    "cycle_time": bench_cycle_time,
+    "blend_radius": bench_blend_radius,
+    "simplify_path": bench_simplify_path,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print("--- %s" % name)
+        BENCHMARKS[name]()
@@ -0,0 +1,282 @@
+"""
+This module estimates how long the robot takes to run a program before it is sent:
+    1) Per-segment times of linear moves with trapezoidal velocity profiles, vectorized over the whole path
+    2) Speeds through blends: a waypoint without blend radius stops the robot, a blend limits the speed
+       to what the acceleration allows on the arc that joins the two segments
+    3) Segments where the commanded velocity is never reached, and the blend radius that would reach it
+    4) Whole scripts with movel, movej, sleep and set_tcp as generated by simple_ur_script
+
+Accelerations and velocities are clamped with MAX_ACCEL and MAX_VELOCITY like in simple_ur_script.
+Path lengths are measured through the waypoints, the shortcut taken inside blends is ignored.
+"""
+
+import math
+
+import numpy as np
+
+import utils
+import ur_kinematics
+import ur_emulator
+from simple_ur_script import MAX_ACCEL, MAX_VELOCITY
+
+
+def _clamp(values, limit, n):
+    # Same clamp as simple_ur_script: absolute value, at most limit, one value per segment
+    values = np.abs(np.broadcast_to(np.asarray(values, dtype=float), (n,)))
+    return np.minimum(values, limit)
+
+
+def path_lengths(points, rotations=None):
+    """
+    Length of every segment of a linear path. A segment is as long as its translation in m or its rotation
+    in rad, whichever is larger, since the controller limits the tool speed and the rotation speed with vel.
+
+    Args:
+        points: (N,3) array of waypoints in mm
+        rotations: (N,3,3) array of rotation matrices, None if the orientation does not change
+
+    Returns:
+        lengths: (N-1,) array
+    """
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1) / 1000
+    if rotations is not None and len(rotations) > 1:
+        # rotation angle from the trace of R_i^T R_i+1
+        trace = np.einsum("nij,nij->n", rotations[:-1], rotations[1:])
+        lengths = np.maximum(lengths, np.arccos(np.clip((trace - 1) / 2, -1.0, 1.0)))
+    return lengths
+
+
+def trapezoid_times(lengths, vel, accel, entry=0.0, exit=0.0):
+    """
+    Time of trapezoidal velocity profiles, vectorized. The entry and exit speeds must be reachable
+    within the segment (see estimate_segments).
+
+    Args:
+        lengths: (N,) array of segment lengths
+        vel: (N,) array of commanded speeds
+        accel: (N,) array of accelerations
+        entry: (N,) array of speeds at the start of the segments
+        exit: (N,) array of speeds at the end of the segments
+
+    Returns:
+        times: (N,) array in seconds
+        peaks: (N,) array of the highest speed reached in every segment
+    """
+    vel = np.maximum(vel, 1e-9)
+    accel = np.maximum(accel, 1e-9)
+    # highest speed of a triangular profile that accelerates from entry and decelerates to exit
+    peaks = np.sqrt(accel * lengths + (entry ** 2 + exit ** 2) / 2)
+    cruise = lengths - (2 * vel ** 2 - entry ** 2 - exit ** 2) / (2 * accel)
+    times = np.where(peaks >= vel,
+                     (2 * vel - entry - exit) / accel + np.maximum(cruise, 0.0) / vel,
+                     (2 * peaks - entry - exit) / accel)
+    return times, np.minimum(peaks, vel)
+
+
+def estimate_segments(lengths, angles, accel, vel, blend_radii=None, translations=None):
+    """
+    Blend-aware timing of a sequence of linear moves that starts and ends at rest.
+
+    The speed at a waypoint is zero without blend radius. With a blend radius r the tool follows an arc
+    tangent to both segments, r away from the waypoint, and may pass it at sqrt(accel * arc radius).
+    A forward and a backward pass (running minima over the cumulative 2 * accel * length) then limit
+    every waypoint speed to what can be reached from the previous waypoint and stopped from at the next one.
+
+    Args:
+        lengths: (N-1,) array of segment lengths in m (or rad, see path_lengths)
+        angles: (N,) array of direction changes at the waypoints (see utils.corner_angles)
+        accel: (N-1,) array of tool accelerations in m/s^2, one per segment
+        vel: (N-1,) array of tool speeds in m/s, one per segment
+        blend_radii: None or (N,) array of blend radii in m at the waypoints
+        translations: (N-1,) array of segment translations in m, the overlap check for blends uses these
+            (lengths if None)
+
+    Returns:
+        report: dictionary with
+            "times": (N-1,) segment times in s, "total_time": float,
+            "waypoint_speeds": (N,) speeds at the waypoints, "peak_speeds": (N-1,) highest speed per segment,
+            "slow": (N-1,) bool, segments that never reach vel,
+            "blend_limited": (N-1,) bool, slow segments held back by a blend (or a missing one),
+            "required_radii": (N,) blend radii in m that let the waypoints be passed at full speed
+    """
+    lengths = np.asarray(lengths, dtype=float)
+    n = len(lengths)
+    accel = np.asarray(accel, dtype=float)
+    vel = np.asarray(vel, dtype=float)
+    if translations is None:
+        translations = lengths
+
+    # speed limit (squared) at the inner waypoints from their blends
+    caps = np.zeros(n + 1)
+    radii = np.zeros(n + 1)
+    if blend_radii is not None and n > 1:
+        # the controller shrinks blends that would overlap to half the shorter segment
+        radii[1:-1] = np.minimum(np.asarray(blend_radii, dtype=float)[1:-1],
+                                 np.minimum(translations[:-1], translations[1:]) / 2)
+    inner_vel = np.minimum(vel[:-1], vel[1:])
+    inner_accel = np.minimum(accel[:-1], accel[1:])
+    half = np.tan(np.minimum(np.asarray(angles, dtype=float)[1:-1], math.pi * (1 - 1e-9)) / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corner = np.where(half > 0, inner_accel * radii[1:-1] / half, np.inf)
+    caps[1:-1] = np.where(radii[1:-1] > 0, np.minimum(inner_vel ** 2, corner), 0.0)
+
+    # forward and backward reachability, s_k <= s_j + 2 a (distance from j to k)
+    budget = np.concatenate(([0.0], np.cumsum(2 * accel * lengths)))
+    speeds2 = np.minimum(budget + np.minimum.accumulate(caps - budget),
+                         np.minimum.accumulate((caps + budget)[::-1])[::-1] - budget)
+    speeds = np.sqrt(np.maximum(speeds2, 0.0))
+
+    times, peaks = trapezoid_times(lengths, vel, accel, speeds[:-1], speeds[1:])
+    slow = peaks < vel * (1 - 1e-9)
+    # blended waypoints slower than the adjacent segments, ignoring the stops at start and end
+    held = np.concatenate(([False], caps[1:-1] < inner_vel ** 2 * (1 - 1e-9), [False]))
+    required = np.zeros(n + 1)
+    required[1:-1] = inner_vel ** 2 * half / np.maximum(inner_accel, 1e-9)
+    return {
+        "segments": n,
+        "times": times,
+        "total_time": float(times.sum()),
+        "waypoint_speeds": speeds,
+        "peak_speeds": peaks,
+        "slow": slow,
+        "blend_limited": slow & (held[:-1] | held[1:]),
+        "required_radii": required,
+    }
+
+
+def estimate_path_time(frames, accel, vel, blend_radii=None):
+    """
+    Estimates the time of a sequence of linear moves as generated by simple_ur_script.move_l_many,
+    starting at rest at the first frame
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,3) array of points or (N,3,3) array of [point, xaxis, yaxis]. Target frames (in mm)
+        accel: tool accel in m/s^2, a single value or one per frame
+        vel: tool speed in m/s, a single value or one per frame
+        blend_radii: None, a single blend radius or a list of blend radii in mm (one per frame)
+
+    Returns:
+        report: dictionary, see estimate_segments. Segment i ends at frame i + 1, blend radii are in mm.
+    """
+    points, rotations = utils.frames_to_arrays(frames)
+    # parameters of the move to frame i + 1 apply to segment i
+    accel = _clamp(accel, MAX_ACCEL, len(points))[1:]
+    vel = _clamp(vel, MAX_VELOCITY, len(points))[1:]
+    radii = None
+    if blend_radii is not None:
+        radii = np.maximum(np.broadcast_to(np.asarray(blend_radii, dtype=float), (len(points),)), 0.0) / 1000
+    report = estimate_segments(path_lengths(points, rotations), utils.corner_angles(points), accel, vel, radii,
+                               path_lengths(points))
+    report["required_radii"] = report["required_radii"] * 1000
+    return report
+
+
+def _joint_time(start, end, accel, vel):
+    # movej: the joint that moves furthest runs the trapezoidal profile
+    distance = np.abs(np.asarray(end) - np.asarray(start)).max(keepdims=True)
+    return float(trapezoid_times(distance, np.array([vel]), np.array([accel]))[0][0])
+
+
+def estimate_script_time(list_ur_commands, joints=None, robot="UR5e"):
+    """
+    Estimates the time of a UR script program. Runs of movel commands are timed with estimate_segments,
+    movej and sleep one by one. Blends into anything else than a movel are timed as stops.
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one string
+        joints: (6,) start joints in radians, e.g. the current joints of the robot. Without them the first move
+            is not counted, since its start is unknown
+        robot: str. Robot model, used to convert between joints and tool poses around movej commands
+
+    Returns:
+        report: dictionary with
+            "times": time of every parsed command in s, "total_time": float, "commands": number of parsed commands,
+            "slow" and "blend_limited": bool per command (see estimate_segments),
+            "unknown": number of moves not counted, "unsupported": list of skipped lines
+    """
+    if not isinstance(list_ur_commands, str):
+        list_ur_commands = "".join(list_ur_commands)
+    commands, unsupported = [], []
+    for line in list_ur_commands.splitlines():
+        command = ur_emulator.parse_command(line)
+        if command is not None:
+            commands.append(command)
+        elif line.strip() and not line.strip().startswith("def ") and line.strip() != "end":
+            unsupported.append(line.strip())
+
+    times = np.zeros(len(commands))
+    slow = np.zeros(len(commands), dtype=bool)
+    blend_limited = np.zeros(len(commands), dtype=bool)
+    tcp = np.eye(4)
+    joints = None if joints is None else np.asarray(joints, dtype=float)
+    pose = None if joints is None else ur_kinematics.forward_kinematics(joints, robot, tcp=tcp)
+    unknown = 0
+
+    i = 0
+    while i < len(commands):
+        kind = commands[i][0]
+        if kind == "movel":
+            end = i
+            while end < len(commands) and commands[end][0] == "movel":
+                end += 1
+            run = commands[i:end]
+            targets = ur_emulator.poses_to_matrices([command[1] for command in run])
+            if pose is None:
+                # the robot is somewhere unknown before the first target
+                unknown += 1
+                waypoints = targets
+                first = 1
+            else:
+                waypoints = np.concatenate((pose[None], targets))
+                first = 0
+            parameters = np.array([command[2:] for command in run])[first:]
+            # blend radius at every waypoint, the one of the move that ends there
+            radii = np.array([0.0] * (1 - first) + [command[4] for command in run])
+            points, rotations = waypoints[:, :3, 3], waypoints[:, :3, :3]
+            report = estimate_segments(path_lengths(points, rotations), utils.corner_angles(points),
+                                       np.minimum(parameters[:, 0], MAX_ACCEL), np.minimum(parameters[:, 1], MAX_VELOCITY),
+                                       radii, path_lengths(points))
+            times[i + first:end] = report["times"]
+            slow[i + first:end] = report["slow"]
+            blend_limited[i + first:end] = report["blend_limited"]
+            pose = targets[-1]
+            if joints is not None:
+                solutions = ur_kinematics.inverse_kinematics(pose, robot, tcp=tcp)
+                joints = ur_kinematics.closest_configuration(solutions, joints)
+            i = end
+            continue
+        command = commands[i]
+        if kind == "movej":
+            if joints is None:
+                unknown += 1
+            else:
+                times[i] = _joint_time(joints, command[1], command[2], command[3])
+            joints = np.array(command[1])
+            pose = ur_kinematics.forward_kinematics(joints, robot, tcp=tcp)
+        elif kind == "sleep":
+            times[i] = command[1]
+        elif kind == "set_tcp":
+            tcp = ur_emulator.poses_to_matrices(command[1])[0]
+            pose = None if joints is None else ur_kinematics.forward_kinematics(joints, robot, tcp=tcp)
+        i += 1
+
+    return {
+        "commands": len(commands),
+        "times": times,
+        "total_time": float(times.sum()),
+        "slow": slow,
+        "blend_limited": blend_limited,
+        "unknown": unknown,
+        "unsupported": unsupported,
+    }
+
+
+def print_report(report):
+    count = report.get("segments", report.get("commands"))
+    print("%d %s: %.2f s, %d never reach the commanded velocity, %d of them held back by the blend radius" % (
+        count, "segments" if "segments" in report else "commands", report["total_time"],
+        int(report["slow"].sum()), int(report["blend_limited"].sum())))
+    if report.get("unknown"):
+        print("  %d moves from an unknown position not counted" % report["unknown"])
+    if report.get("unsupported"):
+        print("  %d unsupported lines skipped" % len(report["unsupported"]))
@@ -0,0 +1,266 @@
+"""
+This module reduces drawing paths before they are turned into UR script, so dense curve divisions
+do not end up as one movel per way plane:
+    1) Merging duplicate and collinear way planes
+    2) Ramer-Douglas-Peucker simplification within a position tolerance in mm and an orientation tolerance
+    3) Resampling to a target spacing, keeping sharp corners
+All steps are vectorized and work on lists of Frames or on arrays, like simple_ur_script.move_l_many.
+
+Usage:
+    frames, report = path_simplify.simplify_path(frames, tolerance=0.1, spacing=5.0)
+    path_simplify.print_report(report)
+    script = simple_ur_script.move_l_many(frames, accel, vel, utils.calculate_blend_radius(frames, 2.5))
+"""
+
+import math
+
+import numpy as np
+import compas.geometry as cg
+
+import utils
+import simple_ur_script
+
+
+def _rotation_angles(a, b):
+    # Angles between pairs of rotation matrices (N,3,3), from the trace of a^T b
+    trace = np.einsum("nij,nij->n", a, b)
+    return np.arccos(np.clip((trace - 1) / 2, -1.0, 1.0))
+
+
+def _slerp(a, b, t):
+    # Rotations a turned towards b by the fractions t, about a fixed axis.
+    # Drawing paths mostly keep their orientation, so only the pairs that differ are evaluated.
+    result = a.copy()
+    turning = np.flatnonzero(_rotation_angles(a, b) > 0)
+    if len(turning):
+        steps = utils.matrices_to_axis_angles(np.swapaxes(a[turning], 1, 2) @ b[turning])
+        result[turning] = a[turning] @ utils.axis_angles_to_matrices(steps * t[turning, None])
+    return result
+
+
+def _select(frames, indices):
+    # The given way planes, in the type they came in
+    if isinstance(frames, (list, tuple)):
+        return [frames[i] for i in indices.tolist()]
+    return np.asarray(frames)[indices]
+
+
+def _from_arrays(frames, points, rotations):
+    # New way planes, in the type of frames
+    if isinstance(frames, (list, tuple)):
+        axes = np.swapaxes(rotations, 1, 2).tolist()
+        return [cg.Frame(p, r[0], r[1]) for p, r in zip(points.tolist(), axes)]
+    if np.ndim(frames) == 2:
+        return points
+    return np.stack((points, rotations[:, :, 0], rotations[:, :, 1]), axis=1)
+
+
+def merge_collinear(points, rotations, angle_tolerance=1e-6):
+    """
+    Finds the way planes that can be left out without changing the path: duplicates of the previous
+    way plane and way planes on a straight line between their neighbours, with unchanged orientation
+
+    Args:
+        points: (N,3) array of way points in mm
+        rotations: (N,3,3) array of rotation matrices
+        angle_tolerance: float. Direction and orientation changes below this angle in radians count as none
+
+    Returns:
+        indices: array of the way planes to keep
+    """
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    same = _rotation_angles(rotations[:-1], rotations[1:]) < angle_tolerance
+    duplicate = np.concatenate(([False], (np.linalg.norm(np.diff(points, axis=0), axis=1) == 0) & same))
+    keep = np.flatnonzero(~duplicate)
+    if len(keep) < 3:
+        return keep
+    points, rotations = points[keep], rotations[keep]
+    same = _rotation_angles(rotations[:-1], rotations[1:]) < angle_tolerance
+    straight = utils.corner_angles(points) < angle_tolerance
+    straight[[0, -1]] = False
+    straight[1:-1] &= same[:-1] & same[1:]
+    return keep[~straight]
+
+
+def rdp(points, rotations=None, tolerance=0.1, angle_tolerance=None, chunk_size=1024):
+    """
+    Ramer-Douglas-Peucker simplification, splitting all open intervals of the path at once per round.
+    A way plane is kept when it is further than tolerance from the straight line between the kept way planes
+    around it, or when its orientation differs more than angle_tolerance from the rotation interpolated there.
+
+    Long paths that wind around (spirals, hatching) only lose about one turn per split, so the path is first
+    cut every chunk_size way planes. That keeps the number of rounds small and adds at most one way plane per cut.
+
+    Args:
+        points: (N,3) array of way points in mm
+        rotations: (N,3,3) array of rotation matrices, only needed with angle_tolerance
+        tolerance: float. Position tolerance in mm
+        angle_tolerance: float. Orientation tolerance in radians, None to ignore the orientation
+        chunk_size: Integer. Way planes between forced cuts, None to run plain RDP
+
+    Returns:
+        indices: array of the way planes to keep
+    """
+    n = len(points)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    if chunk_size:
+        keep[::chunk_size] = True
+    if n < 3:
+        return np.flatnonzero(keep)
+    tolerance = max(tolerance, 1e-12)
+    # way planes whose interval is not settled yet
+    open_ = ~keep
+    while open_.any():
+        kept = np.flatnonzero(keep)
+        candidates = np.flatnonzero(open_)
+        interval = np.searchsorted(kept, candidates) - 1
+        start, end = kept[interval], kept[interval + 1]
+
+        # distance to the chord, and position along it for the orientation
+        a, chord = points[start], points[end] - points[start]
+        length2 = np.einsum("ij,ij->i", chord, chord)
+        t = np.einsum("ij,ij->i", points[candidates] - a, chord) / np.where(length2 > 0, length2, 1.0)
+        t = np.clip(t, 0.0, 1.0)
+        error = np.linalg.norm(points[candidates] - a - chord * t[:, None], axis=1) / tolerance
+        if angle_tolerance is not None:
+            interpolated = _slerp(rotations[start], rotations[end], t)
+            error = np.maximum(error, _rotation_angles(interpolated, rotations[candidates]) / max(angle_tolerance, 1e-12))
+
+        # worst way plane of every interval, candidates are sorted so intervals are contiguous
+        first = np.flatnonzero(np.concatenate(([True], interval[1:] != interval[:-1])))
+        worst = np.maximum.reduceat(error, first)
+        group = np.repeat(np.arange(len(first)), np.diff(np.concatenate((first, [len(error)]))))
+        split = worst > 1.0
+        # settled intervals drop out, the others are split at their worst way plane
+        open_[candidates[~split[group]]] = False
+        at_worst = np.flatnonzero((error == worst[group]) & split[group])
+        at_worst = at_worst[np.unique(group[at_worst], return_index=True)[1]]
+        keep[candidates[at_worst]] = True
+        open_[candidates[at_worst]] = False
+    return np.flatnonzero(keep)
+
+
+def resample(points, rotations, spacing, corner_angle=math.radians(30)):
+    """
+    Resamples a path at equal spacing along its length. The path is cut at corners sharper than corner_angle,
+    which are kept exactly, and every piece in between gets the fewest equal steps not longer than spacing.
+
+    Args:
+        points: (N,3) array of way points in mm
+        rotations: (N,3,3) array of rotation matrices
+        spacing: float. Target distance between way planes in mm
+        corner_angle: float. Direction changes above this angle in radians are kept as corners
+
+    Returns:
+        points: (M,3) array
+        rotations: (M,3,3) array
+    """
+    points, rotations, _ = _resample(points, rotations, spacing, corner_angle)
+    return points, rotations
+
+
+def _resample(points, rotations, spacing, corner_angle):
+    # resample, also returning the index of the way plane closest to every sample along the path
+    if len(points) < 2:
+        return points, rotations, np.arange(len(points))
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    distance = np.concatenate(([0.0], np.cumsum(lengths)))
+    corners = np.flatnonzero(utils.corner_angles(points) > corner_angle)
+    ends = np.unique(np.concatenate(([0], corners, [len(points) - 1])))
+    piece_start, piece_length = distance[ends[:-1]], np.diff(distance[ends])
+    steps = np.maximum(np.ceil(piece_length / spacing - 1e-9), 1).astype(int)
+
+    # distances of all samples: every piece from its start, then the last way point
+    piece = np.repeat(np.arange(len(steps)), steps)
+    step = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+    samples = np.concatenate((piece_start[piece] + piece_length[piece] * step / steps[piece], [distance[-1]]))
+
+    segment = np.clip(np.searchsorted(distance, samples, side="right") - 1, 0, len(lengths) - 1)
+    fraction = np.clip((samples - distance[segment]) / np.where(lengths > 0, lengths, 1.0)[segment], 0.0, 1.0)
+    new_points = points[segment] + (points[segment + 1] - points[segment]) * fraction[:, None]
+    new_rotations = _slerp(rotations[segment], rotations[segment + 1], fraction)
+    return new_points, new_rotations, segment + (fraction > 0.5)
+
+
+def program_bytes(frames, accel, vel, blend_radii=None):
+    """
+    Size of the movel lines simple_ur_script.move_l_many generates for the frames, counted without formatting them
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,3) array of points or (N,3,3) array of [point, xaxis, yaxis]
+        accel: tool accel in m/s^2
+        vel: tool speed in m/s
+        blend_radii: None, a single blend radius or a list of blend radii in mm (one per frame)
+
+    Returns:
+        n: Integer. Number of bytes
+    """
+    poses = simple_ur_script.pose_array(frames)
+    accel = min(abs(accel), simple_ur_script.MAX_ACCEL)
+    vel = min(abs(vel), simple_ur_script.MAX_VELOCITY)
+    fixed = len("movel(p[" + "," * 5 + "], a = %.2f, v = %.2f)\n" % (accel, vel))
+    numbers = poses
+    if blend_radii is not None:
+        fixed += len(", r = ")
+        radii = np.broadcast_to(np.asarray(blend_radii, dtype=float), (len(poses),))
+        numbers = np.column_stack((poses, np.where(radii > 0, radii, 0.0) / 1000))
+    # "%.4f": sign, integer digits, point and 4 decimals
+    rounded = np.abs(np.round(numbers, 4))
+    digits = np.where(rounded < 1, 1, np.floor(np.log10(np.maximum(rounded, 1))) + 1)
+    return int(len(poses) * fixed + np.signbit(numbers).sum() + (digits + 5).sum())
+
+
+def simplify_path(frames, tolerance=0.1, angle_tolerance=math.radians(1), spacing=None,
+                  corner_angle=math.radians(30), accel=1.0, vel=0.1, blend_radius=None):
+    """
+    Runs the whole stage: merge_collinear, rdp and, if spacing is given, resample
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,3) array of points or (N,3,3) array of [point, xaxis, yaxis] (in mm)
+        tolerance: float. Position tolerance in mm
+        angle_tolerance: float. Orientation tolerance in radians, None to ignore the orientation
+        spacing: float. Target spacing in mm, None to keep the simplified way planes
+        corner_angle: float. Corners kept when resampling, in radians
+        accel, vel, blend_radius: movel parameters, only used to count the program bytes in the report.
+            blend_radius is None, a single blend radius or a list of blend radii in mm (one per input frame),
+            the simplified frames keep the radius of the input way plane they come from (or are closest to
+            along the path when resampled)
+
+    Returns:
+        frames: simplified frames, a list of Frames or an array like the input
+        report: dictionary with the number of way planes and program bytes before and after
+    """
+    points, rotations = utils.frames_to_arrays(frames)
+    indices = merge_collinear(points, rotations)
+    indices = indices[rdp(points[indices], rotations[indices], tolerance, angle_tolerance)]
+    if spacing is None:
+        result = _select(frames, indices)
+        sources = indices
+    else:
+        new_points, new_rotations, closest = _resample(points[indices], rotations[indices], spacing, corner_angle)
+        result = _from_arrays(frames, new_points, new_rotations)
+        sources = indices[closest]
+
+    blend_radius_after = blend_radius
+    if np.ndim(blend_radius) > 0:
+        blend_radius_after = np.broadcast_to(np.asarray(blend_radius, dtype=float), (len(points),))[sources]
+    report = {
+        "points_before": len(points),
+        "points_after": len(result),
+        "bytes_before": program_bytes(frames, accel, vel, blend_radius),
+        "bytes_after": program_bytes(result, accel, vel, blend_radius_after),
+    }
+    return result, report
+
+
+def print_report(report):
+    print("%d -> %d way planes (%.1f%% saved), %d -> %d program bytes (%.1f%% saved)" % (
+        report["points_before"], report["points_after"],
+        100.0 * (1 - report["points_after"] / max(report["points_before"], 1)),
+        report["bytes_before"], report["bytes_after"],
+        100.0 * (1 - report["bytes_after"] / max(report["bytes_before"], 1))))
@@ -1,68 +1,456 @@
 import socket
 import math
+import time
+import threading
+import traceback
 from struct import *
 
+import numpy as np
+
+import simple_ur_script
+
+class ScriptBuilder(object):
+    """
+    Assembles UR script commands into one program in linear time. Commands are collected in a list
+    and indented and wrapped in "def my_script(): ... end" in a single pass, either into one string
+    (build) or streamed in chunks to a file or socket (stream_to).
+
+    Args:
+        commands: A list (or any iterable) of formatted UR Script strings, or one string
+        name: string. Name of the generated function
+    """
+
+    def __init__(self, commands=None, name="my_script"):
+        self.name = name
+        self._commands = []
+        if commands is not None:
+            self.extend(commands)
+
+    def __len__(self):
+        return len(self._commands)
+
+    def add(self, command):
+        """
+        Appends one UR script string (may contain several lines)
+        """
+        self._commands.append(command)
+
+    def extend(self, commands):
+        """
+        Appends a string or an iterable of UR script strings
+        """
+        if isinstance(commands, str):
+            self._commands.append(commands)
+        else:
+            self._commands.extend(commands)
+
+    def _header(self):
+        return "\ndef %s():\n\t" % self.name
+
+    def _footer(self):
+        return "\nend\n\n%s()\n" % self.name
+
+    def build(self):
+        """
+        Returns:
+            ur_script: The concatenated script
+        """
+        body = "".join(self._commands).replace("\n", "\n\t")
+        return self._header() + body + self._footer()
+
+    def chunks(self, chunk_size=1 << 16):
+        """
+        Yields the encoded script in pieces of roughly chunk_size bytes,
+        without building the whole program in memory
+
+        Args:
+            chunk_size: Integer. Target size of each piece in bytes
+        """
+        pending = [self._header()]
+        size = 0
+        for command in self._commands:
+            pending.append(command.replace("\n", "\n\t"))
+            size += len(command)
+            if size >= chunk_size:
+                yield "".join(pending).encode("utf-8")
+                pending = []
+                size = 0
+        pending.append(self._footer())
+        yield "".join(pending).encode("utf-8")
+
+    def stream_to(self, target, chunk_size=1 << 16):
+        """
+        Streams the script to a socket (sendall) or a binary file (write)
+
+        Args:
+            target: socket or file opened in binary mode
+            chunk_size: Integer. Target size of each piece in bytes
+
+        Returns:
+            n: Integer. Number of bytes written
+        """
+        write = target.sendall if hasattr(target, "sendall") else target.write
+        n = 0
+        for chunk in self.chunks(chunk_size):
+            write(chunk)
+            n += len(chunk)
+        return n
+
+
 def concatenate_script(list_ur_commands):
     """
     Internal function that concatenates generated UR script into one large script file. Usually used to combine
     scripts generated by the GrasshopperPython components
 
     Args:
-        list_ur_commands: A list of formatted UR Script strings
+        list_ur_commands: A list of formatted UR Script strings, or one string
 
     Returns:
         ur_script: The concatenated script
     """
 
-    ur_script = "\ndef my_script():\n"
-    #ur_script += '\tpopup("running my_script")\n'
+    return ScriptBuilder(list_ur_commands).build()
 
-    combined_script = ""
-    for ur_cmd in list_ur_commands:
-        combined_script += ur_cmd
+class URConnection(object):
+    """
+    Persistent socket connection to the secondary interface of a UR robot. The socket is kept open
+    between scripts and reopened with exponential backoff when the connection drops.
 
-    #format combined script
-    lines =  combined_script.split("\n")
-    for l in lines:
-        ur_script += "\t" + l + "\n"
+    Can be used as a context manager:
+        with URConnection("192.168.10.10") as ur:
+            ur.send(script)
 
-    ur_script += 'end\n'
-    ur_script += '\nmy_script()\n'
-    return ur_script
+    Args:
+        robot_ip: string. IP address of the robot
+        port: Integer. Port of the script interface, 30002 (secondary) by default
+        timeout: float. Connect timeout in seconds
+        retries: Integer. Number of connection attempts before giving up
+        backoff: float. Wait before the first retry in seconds, doubled after every failed attempt
+    """
 
-def send_script(script_to_send,robot_ip):
+    PORT = 30002
+    MAX_SIZE = 2 << 18
+
+    def __init__(self, robot_ip, port=PORT, timeout=2.0, retries=3, backoff=0.2):
+        self.host = robot_ip
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.socket = None
+        # statistics
+        self.scripts_sent = 0
+        self.bytes_sent = 0
+        self.connect_time = 0.0
+        # running totals of the time spent in sendall, the connection stays open for the whole session.
+        # The secondary interface does not acknowledge scripts, so this is not a round trip to the controller.
+        self.last_sendall_time = None
+        self.total_sendall_time = 0.0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def is_connected(self):
+        return self.socket is not None
+
+    def connect(self):
+        """
+        Opens the socket if it is not open yet, retrying with exponential backoff
+
+        Raises:
+            OSError: if no connection could be made after all retries
+        """
+        if self.socket is not None:
+            return
+        delay = self.backoff
+        for attempt in range(self.retries):
+            start = time.perf_counter()
+            try:
+                self.socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.connect_time = time.perf_counter() - start
+                return
+            except OSError:
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+
+    def close(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            finally:
+                self.socket = None
+
+    def _drain(self):
+        # The secondary interface keeps streaming robot state to every client.
+        # Discard it so the receive buffer never fills up and stalls the connection.
+        self.socket.setblocking(False)
+        try:
+            while True:
+                if not self.socket.recv(4096):
+                    raise ConnectionResetError("connection closed by robot")
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self.socket.settimeout(self.timeout)
+
+    def send(self, script_to_send):
+        """
+        Sends a script over the open connection, reconnecting once if the socket was dropped
+
+        Args:
+            script_to_send: string or bytes. Script to send
+
+        Returns:
+            n: Integer. Number of bytes sent
+        """
+        data = script_to_send.encode("utf-8") if isinstance(script_to_send, str) else script_to_send
+        if len(data) > self.MAX_SIZE:
+            raise Exception("Program too long, use send_script_streamed")
+
+        start = time.perf_counter()
+        for attempt in range(2):
+            self.connect()
+            try:
+                self._drain()
+                self.socket.sendall(data)
+                break
+            except OSError:
+                self.close()
+                if attempt == 1:
+                    raise
+        self.last_sendall_time = time.perf_counter() - start
+        self.total_sendall_time += self.last_sendall_time
+        self.scripts_sent += 1
+        self.bytes_sent += len(data)
+        return len(data)
+
+    def stats(self):
+        """
+        Returns:
+            stats: dictionary with number of scripts and bytes sent and the time spent handing them to the socket
+                (sendall, including reconnects) in seconds
+        """
+        n = self.scripts_sent
+        return {
+            "scripts_sent": n,
+            "bytes_sent": self.bytes_sent,
+            "connect_time": self.connect_time,
+            "last_sendall_time": self.last_sendall_time,
+            "mean_sendall_time": self.total_sendall_time / n if n else None,
+        }
+
+
+# Pool of open connections, one per robot
+_connections = {}
+
+def get_connection(robot_ip, port=URConnection.PORT):
     """
-    Opens a socket to the Robot and sends a script
+    Returns the pooled connection to a robot, creating it on first use
 
     Args:
-        script_to_send: Script to send to socket
-        robot_id: Integer. ID of robot
+        robot_ip: string. IP address of the robot
+        port: Integer. Port of the script interface
 
+    Returns:
+        connection: URConnection
     """
+    key = (robot_ip, port)
+    if key not in _connections:
+        _connections[key] = URConnection(robot_ip, port)
+    return _connections[key]
 
-    '''Function that opens a socket connection to the robot'''
-    PORT = 30002
-    HOST = robot_ip
+def close_connections():
+    """
+    Closes all pooled connections
+    """
+    for connection in _connections.values():
+        connection.close()
+    _connections.clear()
 
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(2)
-    try:
-        s.connect((HOST, PORT))
-    except:
-        print ("Cannot connect to ",HOST,PORT)
+def serve_data(data, port, host="", timeout=30.0):
+    """
+    Waits for the robot to connect to this computer and sends it a block of binary data,
+    e.g. the packed poses read by simple_ur_script.move_l_stream. Blocks until the data is sent.
 
-    s.settimeout(None)
-    max_size= 2<<18
-    n=len(script_to_send)
-    if n>max_size:
-        raise Exception("Program too long")
+    Args:
+        data: bytes. Data to send
+        port: Integer. Port to listen on
+        host: string. Interface to listen on, all interfaces by default
+        timeout: float. Time to wait for the robot to connect in seconds
+
+    Returns:
+        n: Integer. Number of bytes sent
+    """
+    with socket.create_server((host, port)) as server:
+        server.settimeout(timeout)
+        connection, _ = server.accept()
+        with connection:
+            connection.sendall(data)
+            # let the controller read everything before the socket closes
+            connection.shutdown(socket.SHUT_WR)
+            connection.settimeout(timeout)
+            try:
+                while connection.recv(4096):
+                    pass
+            except OSError:
+                pass
+    return len(data)
 
+def send_script(script_to_send,robot_ip):
+    """
+    Sends a script to the Robot over a pooled, persistent socket connection
+
+    Args:
+        script_to_send: Script to send to socket
+        robot_ip: string. IP address of the robot
+
+    """
+
+    connection = get_connection(robot_ip)
     try:
-        s.send(script_to_send.encode('utf-8'))
+        connection.send(script_to_send)
         print("script sent")
-    except Exception as e:
+    except OSError as e:
         print("failed to send:", e)
-    s.close()
+
+# ----- Real-time interface packet layouts -----
+
+# Fields of the real-time packet as (name, number of doubles), in order.
+# The packet starts with its length as a big-endian int32 (message_size).
+_RT_FIELDS_V1 = [
+    ("time", 1), ("q_target", 6), ("qd_target", 6), ("qdd_target", 6), ("i_target", 6), ("m_target", 6),
+    ("q_actual", 6), ("qd_actual", 6), ("i_actual", 6), ("tool_accelerometer", 3), ("unused", 15),
+    ("tcp_force", 6), ("tool_vector", 6), ("tcp_speed", 6), ("digital_inputs", 1), ("motor_temperatures", 6),
+    ("controller_timer", 1), ("test_value", 1), ("robot_mode", 1), ("joint_modes", 6),
+]
+_RT_FIELDS_V3 = [
+    ("time", 1), ("q_target", 6), ("qd_target", 6), ("qdd_target", 6), ("i_target", 6), ("m_target", 6),
+    ("q_actual", 6), ("qd_actual", 6), ("i_actual", 6), ("i_control", 6), ("tool_vector_actual", 6),
+    ("tcp_speed_actual", 6), ("tcp_force", 6), ("tool_vector_target", 6), ("tcp_speed_target", 6),
+    ("digital_inputs", 1), ("motor_temperatures", 6), ("controller_timer", 1), ("test_value", 1),
+    ("robot_mode", 1), ("joint_modes", 6), ("safety_mode", 1), ("unused_1", 6), ("tool_accelerometer", 3),
+    ("unused_2", 6), ("speed_scaling", 1), ("linear_momentum_norm", 1), ("unused_3", 1), ("unused_4", 1),
+    ("v_main", 1), ("v_robot", 1), ("i_robot", 1), ("v_actual", 6),
+]
+_RT_FIELDS_V32 = _RT_FIELDS_V3 + [("digital_outputs", 1), ("program_state", 1)]
+_RT_FIELDS_V35 = _RT_FIELDS_V32 + [("elbow_position", 3), ("elbow_velocity", 3)]
+_RT_FIELDS_V5 = _RT_FIELDS_V35 + [("safety_status", 1)]
+
+class RTLayout(object):
+    """
+    Layout of a real-time interface packet for one controller firmware.
+    Precompiles a struct.Struct and a NumPy structured dtype describing the full packet.
+
+    Args:
+        name: string. Firmware versions the layout applies to
+        fields: list of (name, count) tuples
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = [("message_size", 1)] + fields
+        self.struct = Struct("!i" + "".join("%dd" % count for _, count in fields))
+        self.length = self.struct.size
+        self.dtype = np.dtype(
+            [("message_size", ">i4")] + [(n, ">f8") if c == 1 else (n, ">f8", c) for n, c in fields]
+        )
+
+    def __repr__(self):
+        return "RTLayout(%s, %d bytes)" % (self.name, self.length)
+
+    def decode(self, data, offset=0):
+        """
+        Decodes one packet with a single unpack_from call
+
+        Args:
+            data: bytes, bytearray or memoryview containing the packet
+            offset: Integer. Start of the packet in data
+
+        Returns:
+            packet: dictionary of field name to float or tuple of floats
+        """
+        values = self.struct.unpack_from(memoryview(data), offset)
+        packet = {}
+        i = 0
+        for name, count in self.fields:
+            packet[name] = values[i] if count == 1 else values[i:i + count]
+            i += count
+        return packet
+
+RT_LAYOUTS = [
+    RTLayout("1.8", _RT_FIELDS_V1),
+    RTLayout("3.0-3.1", _RT_FIELDS_V3),
+    RTLayout("3.2-3.4", _RT_FIELDS_V32),
+    RTLayout("3.5-3.9", _RT_FIELDS_V35),
+    RTLayout("3.10+/5.x", _RT_FIELDS_V5),
+]
+
+def get_rt_layout(length):
+    """
+    Selects the packet layout from the packet length. Newer firmware only appends fields,
+    so the longest known layout that fits in the packet is used.
+
+    Args:
+        length: Integer. Packet length in bytes (message_size)
+
+    Returns:
+        layout: RTLayout
+    """
+    layout = None
+    for candidate in RT_LAYOUTS:
+        if candidate.length <= length:
+            layout = candidate
+    if layout is None:
+        raise ValueError("Unknown real-time packet length %d" % length)
+    return layout
+
+def decode_rt_packet(data, offset=0):
+    """
+    Decodes one real-time interface packet
+
+    Args:
+        data: bytes, bytearray or memoryview containing the packet
+        offset: Integer. Start of the packet in data
+
+    Returns:
+        packet: dictionary of field name to float or tuple of floats
+    """
+    length = int.from_bytes(data[offset:offset + 4], "big")
+    if offset + length > len(data):
+        raise ValueError("Incomplete real-time packet (%d of %d bytes)" % (len(data) - offset, length))
+    return get_rt_layout(length).decode(data, offset)
+
+def decode_rt_log(data):
+    """
+    Decodes a captured byte log of consecutive real-time packets in one vectorized call.
+    All packets in the log must have the same length.
+
+    Args:
+        data: bytes, bytearray, memoryview or mmap with the captured stream
+
+    Returns:
+        packets: structured NumPy array (native byte order), one row per packet
+    """
+    length = int.from_bytes(data[:4], "big")
+    if length <= 0 or len(data) % length:
+        raise ValueError("Log is not a whole number of %d byte packets" % length)
+    layout = get_rt_layout(length)
+    n = len(data) // length
+    sizes = np.ndarray((n,), dtype=">i4", buffer=data, strides=(length,))
+    if np.any(sizes != length):
+        raise ValueError("Log contains packets of different lengths")
+    dtype = np.dtype({"names": layout.dtype.names, "formats": [layout.dtype.fields[f][0] for f in layout.dtype.names],
+                      "offsets": [layout.dtype.fields[f][1] for f in layout.dtype.names], "itemsize": length})
+    packets = np.frombuffer(data, dtype=dtype, count=n)
+    return packets.astype(layout.dtype.newbyteorder("="))
 
 def listen_to_robot(robot_ip):
     PORT = 30003
@@ -96,7 +484,13 @@ def read(HOST, PORT):
         traceback.print_exc()
         print("Cannot connect to ",HOST,PORT)
     s.settimeout(None)
-    data = s.recv(1024)
+    # Read one complete packet: 4 byte length header, then the rest
+    data = b""
+    while len(data) < 4 or len(data) < int.from_bytes(data[:4], "big"):
+        chunk = s.recv(4096)
+        if not chunk:
+            break
+        data += chunk
     s.close()
     return data
 
@@ -114,25 +508,329 @@ def get_messages(bytes, chunks_info):
     """
 
 
-    # get messages
-    q_target = bytes[12:60]
-    q_actual = bytes[252:300]
-    tcp_force = bytes[540:588]
-    tool_vector = bytes[588:636]
-    controller_time = bytes[740:748]
-
-    # format type: int,
-    fmt_double6 = "!dddddd"
-    fmt_double1 = "!d"
-
-    #Unpack selected data
-    target_joints = unpack(fmt_double6,q_target)
-    chunks_info["target_joints"]= (math.degrees(j) for j in target_joints)
-    actual_joints = unpack(fmt_double6,q_actual)
-    chunks_info["actual_joints"]= (math.degrees(j) for j in actual_joints)
-    forces = unpack(fmt_double6,tcp_force)
-    chunks_info["forces"]= forces
-    pose = unpack(fmt_double6,tool_vector)
-    chunks_info["pose"]= pose
-    time = unpack(fmt_double1,controller_time)
-    chunks_info["time"]= time
+    packet = decode_rt_packet(bytes)
+
+    chunks_info["target_joints"] = [math.degrees(j) for j in packet["q_target"]]
+    chunks_info["actual_joints"] = [math.degrees(j) for j in packet["q_actual"]]
+    chunks_info["forces"] = packet["tcp_force"]
+    # bytes 588:636, the tool vector in 1.x firmware and the target tool vector from 3.0 on
+    chunks_info["pose"] = packet.get("tool_vector_target", packet.get("tool_vector"))
+    chunks_info["time"] = (packet["controller_timer"],)
+
+
+# ----- Streaming real-time interface (port 30003) -----
+
+# Byte offsets of the monitored fields in a real-time packet (same as get_messages)
+RT_FIELDS_DTYPE = np.dtype({
+    "names": ["time", "q_target", "q_actual", "tcp_force", "tool_vector"],
+    "formats": [">f8", (">f8", 6), (">f8", 6), (">f8", 6), (">f8", 6)],
+    "offsets": [740, 12, 252, 540, 588],
+    "itemsize": 748,
+})
+# Firmware 3.2 and later also report the program state
+RT_FIELDS_PROGRAM_DTYPE = np.dtype({
+    "names": RT_FIELDS_DTYPE.names + ("program_state",),
+    "formats": [RT_FIELDS_DTYPE.fields[n][0] for n in RT_FIELDS_DTYPE.names] + [">f8"],
+    "offsets": [740, 12, 252, 540, 588, 1052],
+    "itemsize": 1060,
+})
+# Same fields in native byte order, used for the ring buffer.
+# program_state is NaN for firmware that does not report it.
+RT_SAMPLE_DTYPE = np.dtype([
+    ("time", "f8"),
+    ("q_target", "f8", 6),
+    ("q_actual", "f8", 6),
+    ("tcp_force", "f8", 6),
+    ("tool_vector", "f8", 6),
+    ("program_state", "f8"),
+])
+# Program states reported by the controller
+PROGRAM_STOPPED = 1
+PROGRAM_PLAYING = 2
+
+class RealtimeReader(object):
+    """
+    Background reader for the real-time interface of a UR robot. Keeps the socket open,
+    reassembles complete length-prefixed packets and writes the monitored fields into a
+    preallocated ring buffer, so no arrays are allocated per packet.
+
+    Usage:
+        with RealtimeReader("192.168.10.10") as rt:
+            sample = rt.latest()
+            joints = rt.history(n=125)["q_actual"]
+
+    Args:
+        robot_ip: string. IP address of the robot
+        port: Integer. Real-time interface port
+        size: Integer. Number of samples kept in the ring buffer
+        timeout: float. Socket timeout in seconds
+    """
+
+    PORT = 30003
+    MAX_PACKET_SIZE = 4096
+
+    def __init__(self, robot_ip, port=PORT, size=4096, timeout=1.0):
+        self.host = robot_ip
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.socket = None
+        self.packets = 0
+        self.skipped = 0
+        self.error = None
+
+        self._buffer = np.zeros(size, dtype=RT_SAMPLE_DTYPE)
+        self._buffer["program_state"] = np.nan
+        self._buffer_base = self._buffer[list(RT_FIELDS_DTYPE.names)]
+        self._packet = bytearray(self.MAX_PACKET_SIZE)
+        self._packet_view = memoryview(self._packet)
+        self._fields = np.ndarray((), dtype=RT_FIELDS_DTYPE, buffer=self._packet)
+        self._fields_program = np.ndarray((), dtype=RT_FIELDS_PROGRAM_DTYPE, buffer=self._packet)
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Connects to the robot and starts the reader thread
+        """
+        if self._thread is not None:
+            return
+        self.socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="RealtimeReader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the reader thread and closes the socket
+        """
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def _recv_into(self, start, end):
+        view = self._packet_view
+        while start < end:
+            try:
+                n = self.socket.recv_into(view[start:end])
+            except socket.timeout:
+                # keep waiting for the rest of the packet unless we are stopping
+                if not self._running.is_set():
+                    raise
+                continue
+            if n == 0:
+                raise ConnectionResetError("connection closed by robot")
+            start += n
+
+    def _run(self):
+        try:
+            while self._running.is_set():
+                try:
+                    self._recv_into(0, 4)
+                except socket.timeout:
+                    break
+                length = int.from_bytes(self._packet[:4], "big")
+                if length <= 4:
+                    raise ValueError("invalid packet length %d" % length)
+                if length > self.MAX_PACKET_SIZE:
+                    # Unknown layout. Read and discard the packet to stay in sync.
+                    remaining = length - 4
+                    while remaining > 0:
+                        chunk = min(remaining, self.MAX_PACKET_SIZE - 4)
+                        self._recv_into(4, 4 + chunk)
+                        remaining -= chunk
+                    self.skipped += 1
+                    continue
+                self._recv_into(4, length)
+                if length < RT_FIELDS_DTYPE.itemsize:
+                    self.skipped += 1
+                    continue
+                with self._lock:
+                    if length >= RT_FIELDS_PROGRAM_DTYPE.itemsize:
+                        self._buffer[self.packets % self.size] = self._fields_program
+                    else:
+                        self._buffer_base[self.packets % self.size] = self._fields
+                    self.packets += 1
+        except Exception as e:
+            self.error = e
+            self._running.clear()
+
+    @property
+    def is_running(self):
+        return self._running.is_set()
+
+    def latest(self):
+        """
+        Returns:
+            sample: copy of the most recent sample (fields: time, q_target, q_actual, tcp_force, tool_vector,
+                program_state) or None if nothing was received yet
+        """
+        with self._lock:
+            if self.packets == 0:
+                return None
+            return self._buffer[(self.packets - 1) % self.size].copy()
+
+    def history(self, n=None, duration=None):
+        """
+        Returns the most recent samples in chronological order
+
+        Args:
+            n: Integer. Number of samples, all buffered samples if None
+            duration: float. Only return samples within this many seconds of the latest one
+
+        Returns:
+            samples: structured array with RT_SAMPLE_DTYPE
+        """
+        with self._lock:
+            count = min(self.packets, self.size)
+            if n is not None:
+                count = min(count, n)
+            end = self.packets % self.size
+            indices = np.arange(end - count, end) % self.size
+            samples = self._buffer[indices]
+        if duration is not None and len(samples):
+            samples = samples[samples["time"] >= samples["time"][-1] - duration]
+        return samples
+
+
+# ----- Streamed execution of long programs -----
+
+def _is_safe_boundary(line):
+    # The robot is at rest after these commands, so a new program can take over there
+    line = line.strip()
+    if line.startswith("movel("):
+        return ", r = " not in line or line.endswith("r = 0.0000)")
+    return line.startswith(("movej(", "set_digital_out(", "sleep("))
+
+def split_script(list_ur_commands, max_size=URConnection.MAX_SIZE, name="my_script"):
+    """
+    Splits a long list of UR script commands into sub-programs that fit in the controller limit.
+    Programs are only cut after non-blended moves, set_digital_out or sleep, and the active set_tcp
+    is repeated at the start of every following sub-program. Each sub-program replaces the previous one
+    on the controller, so the robot stops between them, use send_script_streamed where possible.
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one string
+        max_size: Integer. Maximum size of one generated program in bytes
+        name: string. Name of the generated function
+
+    Returns:
+        chunks: list of lists of UR script lines, one list per sub-program
+    """
+    if not isinstance(list_ur_commands, str):
+        list_ur_commands = "".join(list_ur_commands)
+    overhead = len(ScriptBuilder(name=name).build().encode("utf-8"))
+
+    chunks = []
+    current = []
+    sizes = []
+    size = overhead     # size of the program for current
+    safe = 0            # number of lines in current up to the last safe boundary
+    prefix = 0          # number of repeated setup lines at the start of current
+    tcp = None          # last set_tcp command
+    tcp_at_safe = None  # set_tcp active at the last safe boundary
+
+    for line in list_ur_commands.splitlines(True):
+        n = len(line.encode("utf-8")) + 1  # + indentation
+        if size + n > max_size:
+            if safe <= prefix:
+                raise ValueError("No safe point to split the program within %d bytes" % max_size)
+            chunks.append(current[:safe])
+            head = [tcp_at_safe] if tcp_at_safe else []
+            # only the lines after the last safe boundary move on, every line is moved at most once
+            current = head + current[safe:]
+            sizes = [len(l.encode("utf-8")) + 1 for l in head] + sizes[safe:]
+            size = overhead + sum(sizes)
+            safe = prefix = len(head)
+            if size + n > max_size:
+                raise ValueError("No safe point to split the program within %d bytes" % max_size)
+        current.append(line)
+        sizes.append(n)
+        size += n
+        if line.lstrip().startswith("set_tcp("):
+            tcp = line if line.endswith("\n") else line + "\n"
+        if _is_safe_boundary(line):
+            safe = len(current)
+            tcp_at_safe = tcp
+    if len(current) > prefix:
+        chunks.append(current)
+    return chunks
+
+def _wait_for(condition, timeout, poll_interval):
+    start = time.perf_counter()
+    while not condition():
+        if timeout is not None and time.perf_counter() - start > timeout:
+            return False
+        time.sleep(poll_interval)
+    return True
+
+def send_script_streamed(list_ur_commands, robot_ip, host, port=30010, script_port=URConnection.PORT,
+                         timeout=30.0, chunk_size=1 << 16, callback=None):
+    """
+    Runs a program of any length without the size limit of the controller. A small program
+    (simple_ur_script.command_stream) is sent on the script interface, connects back to this computer and
+    reads the commands from a socket, packed with simple_ur_script.pack_commands (40 bytes per command).
+
+    The stream is sent ahead of the robot as far as the socket buffers allow, so the controller always has
+    the next command when it plans a blend and the robot does not stop between chunks of the stream.
+
+    Only movel, movej, set_tcp, sleep and set_digital_out lines can be streamed (ValueError otherwise).
+    Programs with other statements can be cut with split_script and sent one sub-program at a time,
+    but a new program replaces the running one, so the robot stops between them.
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one string
+        robot_ip: string. IP address of the robot
+        host: string. IP address of this computer as seen from the robot
+        port: Integer. Port the commands are served on, on all interfaces of this computer
+        script_port: Integer. Port of the script interface
+        timeout: float. Time to wait for the robot to connect in seconds
+        chunk_size: Integer. Number of bytes handed to the socket at once
+        callback: function called with (bytes sent, total bytes) after every chunk, e.g. to show progress
+
+    Returns:
+        stats: dictionary with the number of commands and bytes streamed, the time until the robot connected
+            and the time until it closed the stream after the last command, in seconds
+    """
+    data = simple_ur_script.pack_commands(list_ur_commands)
+    program = ScriptBuilder(simple_ur_script.command_stream(host, port)).build()
+
+    start = time.perf_counter()
+    with socket.create_server(("", port)) as server:
+        server.settimeout(timeout)
+        get_connection(robot_ip, script_port).send(program)
+        connection, _ = server.accept()
+        connect_time = time.perf_counter() - start
+        with connection:
+            # the robot reads as it goes, sends block while the buffers are full
+            connection.settimeout(None)
+            view = memoryview(data)
+            for offset in range(0, len(data), chunk_size):
+                connection.sendall(view[offset:offset + chunk_size])
+                if callback is not None:
+                    callback(min(offset + chunk_size, len(data)), len(data))
+            # the controller closes the socket after the end record
+            connection.shutdown(socket.SHUT_WR)
+            try:
+                while connection.recv(4096):
+                    pass
+            except OSError:
+                pass
+    return {
+        "commands": len(data) // (simple_ur_script.COMMAND_RECORD_SIZE * 4) - 1,
+        "bytes_sent": len(data),
+        "connect_time": connect_time,
+        "run_time": time.perf_counter() - start,
+    }
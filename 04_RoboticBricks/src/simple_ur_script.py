@@ -3,13 +3,82 @@ This module wraps standard UR Script functions.
 Main change is that plane information substitutes for pose data.
 """
 
+import re
+from collections import OrderedDict
+
 import utils
 import compas.geometry as cg
+import numpy as np
 
 # Some Constants
 MAX_ACCEL = 3
 MAX_VELOCITY = 4
 
+
+class PoseCache(object):
+    """
+    Bounded LRU cache of frame -> UR pose. Pick-and-place programs revisit the same frames over and over,
+    so repeated targets cost a dictionary lookup instead of a transformation and axis-angle conversion.
+
+    Args:
+        maxsize: int. Maximum number of cached frames
+        decimals: int. Frame point (mm) and axes are rounded to this many decimals to build the key
+    """
+
+    def __init__(self, maxsize=4096, decimals=9):
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._poses = OrderedDict()
+
+    def __len__(self):
+        return len(self._poses)
+
+    def key(self, frame):
+        d = self.decimals
+        return tuple(round(v, d) for v in (*frame.point, *frame.xaxis, *frame.yaxis))
+
+    def get(self, frame):
+        """
+        Returns:
+            pose: tuple (x, y, z, rx, ry, rz) in m and axis-angle
+        """
+        _key = self.key(frame)
+        _pose = self._poses.get(_key)
+        if _pose is not None:
+            self.hits += 1
+            self._poses.move_to_end(_key)
+            return _pose
+
+        self.misses += 1
+        _matrix = cg.Transformation.from_frame_to_frame(cg.Frame.worldXY(), frame)
+        _axis_angle = utils.matrix_to_axis_angle(_matrix)
+        _pose = (
+            frame.point.x / 1000,
+            frame.point.y / 1000,
+            frame.point.z / 1000,
+            _axis_angle[0],
+            _axis_angle[1],
+            _axis_angle[2],
+        )
+        self._poses[_key] = _pose
+        if len(self._poses) > self.maxsize:
+            self._poses.popitem(last=False)
+        return _pose
+
+    def clear(self):
+        self._poses.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._poses), "maxsize": self.maxsize}
+
+
+# Shared by move_l, move_l_blend and set_tcp_by_plane
+POSE_CACHE = PoseCache()
+
 def move_l(plane_to, accel, vel):
     """
     Function that returns UR script for linear movement in tool-space.
@@ -27,19 +96,10 @@ def move_l(plane_to, accel, vel):
     accel = MAX_ACCEL if (abs(accel) > MAX_ACCEL) else abs(accel)
     vel = MAX_VELOCITY if (abs(vel) > MAX_VELOCITY) else abs(vel)
 
-    _matrix = cg.Transformation.from_frame_to_frame(cg.Frame.worldXY(), plane_to)
-    _axis_angle = utils.matrix_to_axis_angle(_matrix)
     # Create pose data
-    _pose = [
-        plane_to.point.x / 1000,
-        plane_to.point.y / 1000,
-        plane_to.point.z / 1000,
-        _axis_angle[0],
-        _axis_angle[1],
-        _axis_angle[2],
-    ]
+    _pose = POSE_CACHE.get(plane_to)
     _pose_fmt = "p[" + ("%.4f," * 6)[:-1] + "]"
-    _pose_fmt = _pose_fmt % tuple(_pose)
+    _pose_fmt = _pose_fmt % _pose
     # Format UR script
     script = "movel(%s, a = %.2f, v = %.2f)\n" % (_pose_fmt, accel, vel)
     return script
@@ -65,24 +125,325 @@ def move_l_blend(plane_to, accel, vel, blend_radius=0):
     blend_radius = max(0, blend_radius)
     blend_radius = blend_radius / 1000
 
-    _matrix = cg.Transformation.from_frame_to_frame(cg.Frame.worldXY(), plane_to)
-    _axis_angle = utils.matrix_to_axis_angle(_matrix)
     # Create pose data
-    _pose = [
-        plane_to.point.x / 1000,
-        plane_to.point.y / 1000,
-        plane_to.point.z / 1000,
-        _axis_angle[0],
-        _axis_angle[1],
-        _axis_angle[2],
-    ]
+    _pose = POSE_CACHE.get(plane_to)
     _pose_fmt = "p[" + ("%.4f," * 6)[:-1] + "]"
-    _pose_fmt = _pose_fmt % tuple(_pose)
+    _pose_fmt = _pose_fmt % _pose
     # Format UR script
     script = "movel(%s, a = %.2f, v = %.2f, r = %.4f)\n" % (_pose_fmt, accel, vel, blend_radius)
     return script
 
 
+def pose_array(frames):
+    """
+    Function that converts frames to UR poses in one vectorized pass.
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,3) array of points or (N,3,3) array of [point, xaxis, yaxis]. Target frames (in UR base coordinate system)
+
+    Returns:
+        poses: (N,6) array of poses [x, y, z, rx, ry, rz] in m and axis-angle
+    """
+    _points, _rotations = utils.frames_to_arrays(frames)
+    _axis_angles = utils.matrices_to_axis_angles(_rotations)
+    return np.concatenate((_points / 1000, _axis_angles), axis=1)
+
+
+def move_l_many(frames, accel, vel, blend_radii=None):
+    """
+    Function that returns UR script for a sequence of linear movements in tool-space.
+    All poses are computed in one vectorized pass, output is identical to calling
+    move_l (or move_l_blend when blend radii are given) for every frame.
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,3) array of points or (N,3,3) array of [point, xaxis, yaxis]. Target frames (in UR base coordinate system)
+        accel: tool accel in m/s^2
+        vel: tool speed in m/s
+        blend_radii: None, a single blend radius or a list of blend radii in mm (one per frame)
+
+    Returns:
+        script: UR script
+    """
+
+    # Check acceleration and velocity are non-negative and below a set limit
+    accel = MAX_ACCEL if (abs(accel) > MAX_ACCEL) else abs(accel)
+    vel = MAX_VELOCITY if (abs(vel) > MAX_VELOCITY) else abs(vel)
+
+    # Create pose data
+    _poses = pose_array(frames).tolist()
+    _pose_fmt = "p[" + ("%.4f," * 6)[:-1] + "]"
+
+    # Format UR script
+    if blend_radii is None:
+        _move_fmt = "movel(" + _pose_fmt + ", a = %.2f, v = %.2f)\n"
+        return "".join([_move_fmt % (*_pose, accel, vel) for _pose in _poses])
+
+    # Check blend radius is positive
+    _radii = _blend_radii_array(blend_radii, len(_poses)).tolist()
+    _move_fmt = "movel(" + _pose_fmt + ", a = %.2f, v = %.2f, r = %.4f)\n"
+    return "".join([_move_fmt % (*_pose, accel, vel, _r) for _pose, _r in zip(_poses, _radii)])
+
+
+def _blend_radii_array(blend_radii, n):
+    # Blend radii in m, negative values clamped to zero like move_l_blend
+    _radii = np.broadcast_to(np.asarray(blend_radii, dtype=float), (n,))
+    return np.where(_radii > 0, _radii, 0.0) / 1000
+
+
+def _strip_zeros(text):
+    # Remove trailing zeros of the numbers in a URScript list literal: 0.1200 -> 0.12, 1.0000 -> 1
+    text = re.sub(r"(\.\d*?[1-9])0+(?=[,\]])", r"\1", text)
+    return re.sub(r"\.0+(?=[,\]])", "", text)
+
+
+def move_l_list(frames, accel, vel, blend_radii=None, name="poses"):
+    """
+    Function that returns compact UR script for a sequence of linear movements. The poses are stored
+    in one URScript list literal and executed by a small loop, about half the size of one movel line per pose.
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,3) array of points or (N,3,3) array of [point, xaxis, yaxis]. Target frames (in UR base coordinate system)
+        accel: tool accel in m/s^2
+        vel: tool speed in m/s
+        blend_radii: None, a single blend radius or a list of blend radii in mm (one per frame)
+        name: str. Name of the pose list variable in the script
+
+    Returns:
+        script: UR script
+    """
+
+    # Check acceleration and velocity are non-negative and below a set limit
+    accel = MAX_ACCEL if (abs(accel) > MAX_ACCEL) else abs(accel)
+    vel = MAX_VELOCITY if (abs(vel) > MAX_VELOCITY) else abs(vel)
+
+    _poses = pose_array(frames)
+    _n = len(_poses)
+    if _n == 0:
+        return ""
+    _pose_fmt = "p[" + ("%.4f," * 6)[:-1] + "]"
+    _poses_text = ",".join([_pose_fmt % tuple(_pose) for _pose in _poses.tolist()])
+
+    script = "%s = [%s]\n" % (name, _strip_zeros(_poses_text))
+    if blend_radii is None:
+        _move = "movel(%s[%s_i], a = %.2f, v = %.2f)" % (name, name, accel, vel)
+    else:
+        _radii_text = ",".join(["%.4f" % _r for _r in _blend_radii_array(blend_radii, _n).tolist()])
+        script += "%s_r = %s\n" % (name, _strip_zeros("[" + _radii_text + "]"))
+        _move = "movel(%s[%s_i], a = %.2f, v = %.2f, r = %s_r[%s_i])" % (name, name, accel, vel, name, name)
+    script += "%s_i = 0\n" % name
+    script += "while (%s_i < %d):\n" % (name, _n)
+    script += "  %s\n" % _move
+    script += "  %s_i = %s_i + 1\n" % (name, name)
+    script += "end\n"
+    return script
+
+
+def pack_poses(frames, blend_radii=None):
+    """
+    Function that packs poses into the binary format read by move_l_stream:
+    big-endian float32 [x, y, z, rx, ry, rz, r] per frame (28 bytes instead of ~90 for a movel line)
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,3) array of points or (N,3,3) array of [point, xaxis, yaxis]. Target frames (in UR base coordinate system)
+        blend_radii: None, a single blend radius or a list of blend radii in mm (one per frame)
+
+    Returns:
+        data: bytes
+    """
+    _poses = pose_array(frames)
+    _radii = _blend_radii_array(0 if blend_radii is None else blend_radii, len(_poses))
+    return np.column_stack((_poses, _radii)).astype(">f4").tobytes()
+
+
+def move_l_stream(host, port, count, accel, vel, socket_name="poses"):
+    """
+    Function that returns UR script for a sequence of linear movements whose poses are read from a socket
+    on the controller, e.g. served with simple_comm.serve_data(pack_poses(frames), port).
+
+    Args:
+        host: str. IP address of the computer serving the poses
+        port: int. Port of the pose server
+        count: int. Number of poses to read
+        accel: tool accel in m/s^2
+        vel: tool speed in m/s
+        socket_name: str. Name of the socket on the controller
+
+    Returns:
+        script: UR script
+    """
+
+    # Check acceleration and velocity are non-negative and below a set limit
+    accel = MAX_ACCEL if (abs(accel) > MAX_ACCEL) else abs(accel)
+    vel = MAX_VELOCITY if (abs(vel) > MAX_VELOCITY) else abs(vel)
+
+    script = 'socket_open("%s", %d, "%s")\n' % (host, port, socket_name)
+    script += "%s_i = 0\n" % socket_name
+    script += "while (%s_i < %d):\n" % (socket_name, count)
+    script += '  %s_v = socket_read_binary_float(7, "%s")\n' % (socket_name, socket_name)
+    script += "  if (%s_v[0] < 7):\n" % socket_name
+    script += '    popup("pose stream ended early", "Error")\n'
+    script += "    halt\n"
+    script += "  end\n"
+    script += "  movel(p[{0}_v[1], {0}_v[2], {0}_v[3], {0}_v[4], {0}_v[5], {0}_v[6]], a = %.2f, v = %.2f, r = {0}_v[7])\n".format(socket_name) % (accel, vel)
+    script += "  %s_i = %s_i + 1\n" % (socket_name, socket_name)
+    script += "end\n"
+    script += 'socket_close("%s")\n' % socket_name
+    return script
+
+
+# Commands of a command stream, see pack_commands and command_stream
+COMMAND_OPCODES = {"movel": 1, "movej": 2, "set_tcp": 3, "sleep": 4, "set_digital_out": 5}
+COMMAND_END = 0
+# opcode, 6 targets, a, v, r
+COMMAND_RECORD_SIZE = 10
+
+_CALL = re.compile(r"^(movel|movej|set_tcp|sleep|set_digital_out)\((.*)\)$")
+_LIST = re.compile(r"p?\[([^\]]*)\]")
+_KEYWORD = re.compile(r"\b([avr])\s*=\s*([-+0-9.eE]+)")
+
+
+def parse_command(line):
+    """
+    Parses one line of UR script as generated by this module
+
+    Args:
+        line: string. One statement
+
+    Returns:
+        command: tuple ("movel", pose, a, v, r), ("movej", joints, a, v, r), ("set_tcp", pose), ("sleep", t)
+            or ("set_digital_out", id, signal), None if the statement is not supported
+    """
+    match = _CALL.match(line.strip())
+    if match is None:
+        return None
+    name, arguments = match.groups()
+    try:
+        if name in ("movel", "movej", "set_tcp"):
+            values = _LIST.match(arguments.strip())
+            target = [float(value) for value in values.group(1).split(",")]
+            if len(target) != 6:
+                return None
+            if name == "set_tcp":
+                return (name, target)
+            keywords = {key: float(value) for key, value in _KEYWORD.findall(arguments[values.end():])}
+            return (name, target, keywords.get("a", 1.2 if name == "movel" else 1.4),
+                    keywords.get("v", 0.25 if name == "movel" else 1.05), keywords.get("r", 0.0))
+        if name == "sleep":
+            return (name, float(arguments))
+        io, signal = [argument.strip() for argument in arguments.split(",")]
+        return (name, int(io), signal == "True")
+    except (AttributeError, ValueError):
+        return None
+
+
+def pack_commands(list_ur_commands):
+    """
+    Function that packs UR script commands into the binary format read by command_stream:
+    big-endian float32 [opcode, 6 targets, a, v, r] per command, followed by an end record
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings (movel, movej, set_tcp, sleep
+            and set_digital_out as generated by this module), or one string
+
+    Returns:
+        data: bytes
+    """
+    if not isinstance(list_ur_commands, str):
+        list_ur_commands = "".join(list_ur_commands)
+    _records = []
+    for _line in list_ur_commands.splitlines():
+        if not _line.strip():
+            continue
+        _command = parse_command(_line)
+        if _command is None:
+            raise ValueError("Cannot stream %r, only %s are supported" % (_line.strip(), ", ".join(COMMAND_OPCODES)))
+        _record = [0.0] * COMMAND_RECORD_SIZE
+        _record[0] = COMMAND_OPCODES[_command[0]]
+        if _command[0] in ("movel", "movej"):
+            _record[1:7] = _command[1]
+            _record[7:10] = _command[2:5]
+        elif _command[0] == "set_tcp":
+            _record[1:7] = _command[1]
+        elif _command[0] == "sleep":
+            _record[1] = _command[1]
+        else:
+            _record[1:3] = [_command[1], float(_command[2])]
+        _records.append(_record)
+    _records.append([COMMAND_END] + [0.0] * (COMMAND_RECORD_SIZE - 1))
+    return np.array(_records, dtype=">f4").tobytes()
+
+
+def unpack_commands(data):
+    """
+    Function that reads records packed by pack_commands back into commands as returned by parse_command
+
+    Args:
+        data: bytes. Whole records
+
+    Returns:
+        commands: list of commands, None for the end record
+    """
+    _names = {_opcode: _name for _name, _opcode in COMMAND_OPCODES.items()}
+    _commands = []
+    for _record in np.frombuffer(data, dtype=">f4").reshape(-1, COMMAND_RECORD_SIZE).astype(float).tolist():
+        _name = _names.get(int(_record[0]))
+        if _name in ("movel", "movej"):
+            _commands.append((_name, _record[1:7], _record[7], _record[8], _record[9]))
+        elif _name == "set_tcp":
+            _commands.append((_name, _record[1:7]))
+        elif _name == "sleep":
+            _commands.append((_name, _record[1]))
+        elif _name == "set_digital_out":
+            _commands.append((_name, int(round(_record[1])), _record[2] > 0.5))
+        else:
+            _commands.append(None)
+    return _commands
+
+
+def command_stream(host, port, socket_name="commands"):
+    """
+    Function that returns UR script that runs commands read from a socket on the controller, e.g. served with
+    simple_comm.serve_data(pack_commands(list_ur_commands), port). The program stays small however long the
+    stream is, and moves blend into the next command as soon as it has arrived.
+
+    Args:
+        host: str. IP address of the computer serving the commands
+        port: int. Port of the command server
+        socket_name: str. Name of the socket on the controller
+
+    Returns:
+        script: UR script
+    """
+    _v = "%s_v" % socket_name
+    _target = ", ".join("%s[%d]" % (_v, i) for i in range(2, 8))
+    _motion = "a = {0}[8], v = {0}[9], r = {0}[10]".format(_v)
+
+    script = 'socket_open("%s", %d, "%s")\n' % (host, port, socket_name)
+    script += "%s_run = True\n" % socket_name
+    script += "while (%s_run):\n" % socket_name
+    script += '  %s = socket_read_binary_float(%d, "%s")\n' % (_v, COMMAND_RECORD_SIZE, socket_name)
+    script += "  if (%s[0] < %d):\n" % (_v, COMMAND_RECORD_SIZE)
+    script += '    popup("command stream ended early", "Error")\n'
+    script += "    halt\n"
+    script += "  end\n"
+    script += "  if (%s[1] == %d):\n" % (_v, COMMAND_OPCODES["movel"])
+    script += "    movel(p[%s], %s)\n" % (_target, _motion)
+    script += "  elif (%s[1] == %d):\n" % (_v, COMMAND_OPCODES["movej"])
+    script += "    movej([%s], %s)\n" % (_target, _motion)
+    script += "  elif (%s[1] == %d):\n" % (_v, COMMAND_OPCODES["set_tcp"])
+    script += "    set_tcp(p[%s])\n" % _target
+    script += "  elif (%s[1] == %d):\n" % (_v, COMMAND_OPCODES["sleep"])
+    script += "    sleep(%s[2])\n" % _v
+    script += "  elif (%s[1] == %d):\n" % (_v, COMMAND_OPCODES["set_digital_out"])
+    script += "    set_digital_out(floor(%s[2] + 0.5), %s[3] > 0.5)\n" % (_v, _v)
+    script += "  else:\n"
+    script += "    %s_run = False\n" % socket_name
+    script += "  end\n"
+    script += "end\n"
+    script += 'socket_close("%s")\n' % socket_name
+    return script
+
+
 def move_j(joints, accel, vel):
     """
     Function that returns UR script for linear movement in joint space.
@@ -103,6 +464,34 @@ def move_j(joints, accel, vel):
     return script
 
 
+def move_j_many(joints, accel, vel, blend_radii=None):
+    """
+    Function that returns UR script for a sequence of movements in joint space, e.g. a path
+    precomputed with ur_kinematics.joint_path. Joints are written with 4 decimals (move_j uses 2),
+    which keeps precomputed paths accurate to well below a millimetre.
+
+    Args:
+        joints: (N,6) array or list of joint angles in radians
+        accel: joint accel in rad/s^2
+        vel: joint speed in rad/s
+        blend_radii: None, a single blend radius or a list of blend radii in mm (one per configuration)
+
+    Returns:
+        script: UR script
+    """
+
+    _joints = np.asarray(joints, dtype=float).reshape(-1, 6).tolist()
+    _j_fmt = "[" + ("%.4f," * 6)[:-1] + "]"
+
+    if blend_radii is None:
+        _move_fmt = "movej(" + _j_fmt + ", a = %.2f, v = %.2f)\n"
+        return "".join([_move_fmt % (*_j, accel, vel) for _j in _joints])
+
+    _radii = _blend_radii_array(blend_radii, len(_joints)).tolist()
+    _move_fmt = "movej(" + _j_fmt + ", a = %.2f, v = %.2f, r = %.4f)\n"
+    return "".join([_move_fmt % (*_j, accel, vel, _r) for _j, _r in zip(_joints, _radii)])
+
+
 def set_tcp_by_plane(x_offset, y_offset, z_offset, ref_plane=cg.Frame.worldXY()):
     """
     Function that returns UR script for setting tool center point.
@@ -118,8 +507,7 @@ def set_tcp_by_plane(x_offset, y_offset, z_offset, ref_plane=cg.Frame.worldXY())
     """
 
     if ref_plane != cg.Frame.worldXY():
-        _matrix = cg.Transformation.from_frame_to_frame(cg.Frame.worldXY(), ref_plane)
-        _axis_angle = utils.matrix_to_axis_angle(_matrix)
+        _axis_angle = POSE_CACHE.get(ref_plane)[3:]
     else:
         _axis_angle = [0, 0, 0]
     # Create pose data
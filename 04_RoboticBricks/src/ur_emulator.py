@@ -0,0 +1,598 @@
+"""
+This module contains a local emulator of the UR controller socket interfaces, for testing and benchmarking
+simple_comm without a robot or URSim:
+    1) Port 30002 accepts URScript as sent by simple_comm (movel, movej, set_tcp, sleep and set_digital_out
+       as generated by simple_ur_script)
+    2) Motion is integrated at the controller rate with trapezoidal velocity profiles
+    3) Port 30003 broadcasts real-time packets in the layout of the selected firmware
+    4) Programs generated with simple_ur_script.command_stream connect back to their host and run the
+       streamed commands as they arrive
+
+Run from this folder, e.g.:
+    python ur_emulator.py
+    python ur_emulator.py --frequency 125 --length 1060
+
+Simplifications: blended moves run through their waypoints as one continuous move without rounding the corners,
+statements other than the commands above (variables, loops, popup, other sockets) are skipped,
+and the actual joints always follow the target joints exactly.
+"""
+
+import re
+import math
+import socket
+import asyncio
+import threading
+
+import numpy as np
+
+import utils
+import ur_kinematics
+from simple_comm import RT_LAYOUTS, PROGRAM_STOPPED, PROGRAM_PLAYING, get_rt_layout
+from simple_ur_script import COMMAND_RECORD_SIZE, parse_command, unpack_commands
+
+HOME = [0.0, -math.pi / 2, math.pi / 2, -math.pi / 2, -math.pi / 2, 0.0]
+# Modes reported while the robot is powered on and running
+ROBOT_MODE_RUNNING = 7
+JOINT_MODE_RUNNING = 253
+SAFETY_MODE_NORMAL = 1
+SAFETY_MODE_PROTECTIVE_STOP = 3
+
+_SOCKET_OPEN = re.compile(r'^socket_open\("([^"]*)",\s*(\d+),\s*"(\w+)"\)$')
+
+
+# ----- Parsing -----
+
+def find_command_stream(lines):
+    """
+    Finds the command stream of a program generated with simple_ur_script.command_stream
+
+    Args:
+        lines: list of script lines
+
+    Returns:
+        stream: (host, port) the controller reads the commands from, None if the program is not a command stream
+    """
+    for line in lines:
+        match = _SOCKET_OPEN.match(line.strip())
+        if match is None:
+            continue
+        host, port, name = match.groups()
+        read = 'socket_read_binary_float(%d, "%s")' % (COMMAND_RECORD_SIZE, name)
+        if any(other.strip().endswith(read) for other in lines):
+            return host, int(port)
+    return None
+
+
+class ScriptReader(object):
+    """
+    Collects the programs in a stream of script text. Like the controller, a "def name(): ... end" block
+    is run when its closing end arrives and lines sent outside a block are run one by one.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._name = None
+        self._lines = None
+
+    def feed(self, text):
+        """
+        Args:
+            text: string. Received script text, may end in the middle of a line
+
+        Returns:
+            programs: list of complete programs, each a list of lines
+        """
+        lines = (self._buffer + text).split("\n")
+        self._buffer = lines.pop()
+        programs = []
+        for line in lines:
+            line = line.rstrip()
+            if self._lines is not None:
+                if line == "end":
+                    programs.append(self._lines)
+                    self._lines = None
+                else:
+                    self._lines.append(line)
+            elif line.startswith("def ") and line.endswith(":"):
+                self._name = line[4:line.find("(")].strip()
+                self._lines = []
+            elif line.strip() and line.strip() != "%s()" % self._name:
+                programs.append([line])
+        return programs
+
+
+# ----- Motion -----
+
+def trapezoid(length, vel, accel, dt):
+    """
+    Distance travelled along a path at every control period of a trapezoidal velocity profile
+    (triangular when the path is too short to reach vel)
+
+    Args:
+        length: float. Path length
+        vel: float. Maximum velocity
+        accel: float. Acceleration and deceleration
+        dt: float. Control period in seconds
+
+    Returns:
+        s: (N,) array of distances, the last one is length
+    """
+    if length <= 0:
+        return np.zeros(0)
+    vel, accel = max(vel, 1e-6), max(accel, 1e-6)
+    t_acc = vel / accel
+    if accel * t_acc ** 2 > length:
+        t_acc = math.sqrt(length / accel)
+        vel = accel * t_acc
+    t_flat = (length - accel * t_acc ** 2) / vel
+    total = 2 * t_acc + t_flat
+    t = np.minimum(np.arange(1, math.ceil(total / dt - 1e-9) + 1) * dt, total)
+    return np.where(t < t_acc, 0.5 * accel * t ** 2,
+                    np.where(t < t_acc + t_flat, 0.5 * accel * t_acc ** 2 + vel * (t - t_acc),
+                             length - 0.5 * accel * (total - t) ** 2))
+
+
+def poses_to_matrices(poses):
+    """
+    Args:
+        poses: (N,6) array of UR poses [x, y, z, rx, ry, rz] in m
+
+    Returns:
+        matrices: (N,4,4) array of transformations in mm
+    """
+    poses = np.asarray(poses, dtype=float).reshape(-1, 6)
+    matrices = np.zeros((len(poses), 4, 4))
+    matrices[:, :3, :3] = utils.axis_angles_to_matrices(poses[:, 3:])
+    matrices[:, :3, 3] = poses[:, :3] * 1000
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def matrices_to_poses(matrices):
+    """
+    Args:
+        matrices: (N,4,4) array of transformations in mm
+
+    Returns:
+        poses: (N,6) array of UR poses [x, y, z, rx, ry, rz] in m
+    """
+    return np.column_stack((matrices[:, :3, 3] / 1000, utils.matrices_to_axis_angles(matrices)))
+
+
+def interpolate_joints(waypoints, vel, accel, dt):
+    """
+    Joint targets of a movej (or blended movej's) at every control period. All joints start and stop together,
+    the joint that moves furthest runs the trapezoidal profile.
+
+    Args:
+        waypoints: (K+1,6) array of joint angles, starting at the current joints
+        vel: float. Joint speed in rad/s
+        accel: float. Joint acceleration in rad/s^2
+        dt: float. Control period in seconds
+
+    Returns:
+        joints: (N,6) array
+    """
+    lengths = np.abs(np.diff(waypoints, axis=0)).max(axis=1)
+    distance = np.concatenate(([0.0], np.cumsum(lengths)))
+    s = trapezoid(distance[-1], vel, accel, dt)
+    return np.column_stack([np.interp(s, distance, waypoints[:, i]) for i in range(6)])
+
+
+def interpolate_poses(waypoints, vel, accel, dt):
+    """
+    Tool poses of a movel (or blended movel's) at every control period. Positions move along straight lines
+    and orientations rotate about a fixed axis per segment. A segment is as long as its translation in m
+    or its rotation in rad, whichever is larger, so vel also limits the rotation speed in rad/s.
+
+    Args:
+        waypoints: (K+1,4,4) array of tool transformations in mm, starting at the current pose
+        vel: float. Tool speed in m/s
+        accel: float. Tool acceleration in m/s^2
+        dt: float. Control period in seconds
+
+    Returns:
+        poses: (N,4,4) array
+    """
+    rotations = waypoints[:, :3, :3]
+    steps = utils.matrices_to_axis_angles(np.swapaxes(rotations[:-1], 1, 2) @ rotations[1:])
+    translations = np.diff(waypoints[:, :3, 3], axis=0)
+    lengths = np.maximum(np.linalg.norm(translations, axis=1) / 1000, np.linalg.norm(steps, axis=1))
+    distance = np.concatenate(([0.0], np.cumsum(lengths)))
+    s = trapezoid(distance[-1], vel, accel, dt)
+
+    segment = np.clip(np.searchsorted(distance, s, side="right") - 1, 0, len(lengths) - 1)
+    fraction = (s - distance[segment]) / np.where(lengths > 0, lengths, 1.0)[segment]
+    fraction = np.clip(fraction, 0.0, 1.0)
+    poses = np.zeros((len(s), 4, 4))
+    poses[:, :3, :3] = rotations[segment] @ utils.axis_angles_to_matrices(steps[segment] * fraction[:, None])
+    poses[:, :3, 3] = waypoints[segment, :3, 3] + translations[segment] * fraction[:, None]
+    poses[:, 3, 3] = 1.0
+    return poses
+
+
+def group_moves(commands):
+    """
+    Splits a program into blocks: runs of blended moves of the same type (a move with r > 0 continues
+    into the next one) and single other commands
+
+    Args:
+        commands: iterable of parsed commands. None stands for a command that has not arrived yet
+
+    Yields:
+        block: list of commands, or None while the next block is not complete
+    """
+    block = []
+    for command in commands:
+        if command is None:
+            yield None
+            continue
+        blending = block and block[-1][0] in ("movel", "movej") and block[-1][4] > 0
+        if block and not (blending and command[0] == block[-1][0]):
+            yield block
+            block = []
+        block.append(command)
+    if block:
+        yield block
+
+
+# ----- Controller -----
+
+class UREmulator(object):
+    """
+    Emulated UR controller. Serves the script interface and the real-time interface with asyncio,
+    either in a background thread (start/stop, or as a context manager) or in the current thread (run).
+
+    Usage:
+        with UREmulator() as robot:
+            simple_comm.send_script(script, "127.0.0.1")
+
+    Args:
+        host: string. Interface to listen on
+        script_port: Integer. Port of the script interface
+        realtime_port: Integer. Port of the real-time interface
+        robot: str. Robot model, see ur_kinematics.UR_DH
+        frequency: float. Controller rate in Hz, 500 for e-Series and 125 for CB3 robots
+        packet_length: Integer. Length of the real-time packets in bytes, selects the firmware layout
+        joints: (6,) start joints in radians
+        time_scale: float. Emulated seconds per wall clock second, > 1 runs faster than real time
+    """
+
+    def __init__(self, host="127.0.0.1", script_port=30002, realtime_port=30003, robot="UR5e", frequency=500.0,
+                 packet_length=RT_LAYOUTS[-1].length, joints=HOME, time_scale=1.0):
+        self.host = host
+        self.script_port = script_port
+        self.realtime_port = realtime_port
+        self.robot = robot
+        self.frequency = float(frequency)
+        self.dt = 1.0 / self.frequency
+        self.time_scale = float(time_scale)
+        self.layout = get_rt_layout(packet_length)
+        if self.layout.length != packet_length:
+            raise ValueError("Unknown real-time packet length %d" % packet_length)
+
+        # controller state
+        self.time = 0.0
+        self.joints = np.array(joints, dtype=float)
+        self.tcp = np.zeros(6)
+        self.digital_outputs = 0
+        self.program_state = PROGRAM_STOPPED
+        self.fault = None
+        self._program = None
+        self._index = 0
+        # statistics
+        self.programs = 0
+        self.packets = 0
+        self.unsupported = []
+
+        self._state = np.zeros((), dtype=self.layout.dtype)
+        self._state["message_size"] = self.layout.length
+        self._clients = set()
+        self._connections = set()
+        self._loop = None
+        self._stopping = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.pose = self.tool_poses(self.joints[None])[0]
+        self._set_motion(self.joints[None])
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    # --- motion and programs ---
+
+    def tool_poses(self, joints):
+        """
+        Args:
+            joints: (N,6) array of joint angles
+
+        Returns:
+            poses: (N,6) array of TCP poses [x, y, z, rx, ry, rz] in m, as reported in the tool vector
+        """
+        return matrices_to_poses(ur_kinematics.forward_kinematics(joints, self.robot, tcp=poses_to_matrices(self.tcp)[0]))
+
+    def _set_motion(self, joints):
+        # Precompute the reported values of a whole move at once
+        previous = np.vstack((self.joints, joints[:-1]))
+        self._joints = joints
+        self._joint_speeds = (joints - previous) / self.dt
+        self._poses = self.tool_poses(joints)
+        self._tcp_speeds = (self._poses - np.vstack((self.pose, self._poses[:-1]))) / self.dt
+
+    def _execute(self, commands):
+        # Generator running a program, yields once per control period
+        for block in group_moves(commands):
+            if block is None:
+                # waiting for the next command
+                yield
+                continue
+            kind = block[0][0]
+            if kind == "movej":
+                waypoints = np.vstack([self.joints] + [command[1] for command in block])
+                joints = interpolate_joints(waypoints, min(c[3] for c in block), min(c[2] for c in block), self.dt)
+            elif kind == "movel":
+                waypoints = np.concatenate((poses_to_matrices(self.pose), poses_to_matrices([c[1] for c in block])))
+                poses = interpolate_poses(waypoints, min(c[3] for c in block), min(c[2] for c in block), self.dt)
+                try:
+                    joints = ur_kinematics.joint_path(poses, self.robot, self.joints, tcp=poses_to_matrices(self.tcp)[0])
+                except ValueError as e:
+                    # protective stop, reported in the safety mode until the next program
+                    self.fault = "movel %s: %s" % (block[-1][1], e)
+                    return
+            else:
+                command = block[0]
+                if kind == "set_tcp":
+                    self.tcp = np.array(command[1])
+                    self.pose = self.tool_poses(self.joints[None])[0]
+                    self._set_motion(self.joints[None])
+                elif kind == "set_digital_out":
+                    mask = 1 << command[1]
+                    self.digital_outputs = self.digital_outputs | mask if command[2] else self.digital_outputs & ~mask
+                elif kind == "sleep":
+                    self._set_motion(self.joints[None])
+                    for _ in range(int(round(command[1] * self.frequency))):
+                        yield
+                continue
+            if len(joints) == 0:
+                continue
+            self._set_motion(joints)
+            for i in range(len(joints)):
+                self._index = i
+                self.joints = joints[i]
+                self.pose = self._poses[i]
+                yield
+            self._set_motion(self.joints[None])
+
+    def _read_stream(self, host, port):
+        # Generator of the commands of a command stream as they arrive, None while waiting for data.
+        # Like the controller the program ends when the connection fails or closes before the end record.
+        record_size = COMMAND_RECORD_SIZE * 4
+        data = b""
+        try:
+            connection = socket.create_connection((host, port), timeout=2.0)
+        except OSError:
+            return
+        try:
+            connection.setblocking(False)
+            while True:
+                try:
+                    received = connection.recv(1 << 16)
+                except BlockingIOError:
+                    received = None
+                except OSError:
+                    return
+                if received == b"":
+                    return
+                data += received or b""
+                end = len(data) - len(data) % record_size
+                if end == 0:
+                    yield None
+                    continue
+                for command in unpack_commands(data[:end]):
+                    if command is None:
+                        return
+                    yield command
+                data = data[end:]
+        finally:
+            connection.close()
+
+    def load(self, lines):
+        """
+        Replaces the running program, like a script sent to the controller
+
+        Args:
+            lines: list of script lines
+        """
+        stream = find_command_stream(lines)
+        if stream is not None:
+            commands = self._read_stream(*stream)
+        else:
+            commands = []
+            for line in lines:
+                command = parse_command(line)
+                if command is None:
+                    if line.strip():
+                        self.unsupported.append(line.strip())
+                else:
+                    commands.append(command)
+        if self._program is not None:
+            self._program.close()
+        self._set_motion(self.joints[None])
+        self.fault = None
+        self._program = self._execute(commands)
+        self.program_state = PROGRAM_PLAYING
+        self.programs += 1
+
+    def step(self):
+        """
+        Advances the controller by one control period
+
+        Returns:
+            packet: bytes. Real-time packet of the new state
+        """
+        self.time += self.dt
+        self._index = 0
+        if self._program is not None:
+            try:
+                next(self._program)
+            except StopIteration:
+                self._program = None
+                self.program_state = PROGRAM_STOPPED
+                self._set_motion(self.joints[None])
+        self.packets += 1
+        return self.packet()
+
+    def packet(self):
+        """
+        Returns:
+            packet: bytes. Real-time packet of the current state
+        """
+        i = self._index
+        state = self._state
+        fields = self.layout.dtype.names
+        state["time"] = state["controller_timer"] = self.time
+        for name in ("q_target", "q_actual"):
+            state[name] = self._joints[i]
+        for name in ("qd_target", "qd_actual"):
+            state[name] = self._joint_speeds[i]
+        for name in ("tool_vector", "tool_vector_actual", "tool_vector_target"):
+            if name in fields:
+                state[name] = self._poses[i]
+        for name in ("tcp_speed", "tcp_speed_actual", "tcp_speed_target"):
+            if name in fields:
+                state[name] = self._tcp_speeds[i]
+        state["robot_mode"] = ROBOT_MODE_RUNNING
+        state["joint_modes"] = JOINT_MODE_RUNNING
+        if "safety_mode" in fields:
+            state["safety_mode"] = SAFETY_MODE_NORMAL if self.fault is None else SAFETY_MODE_PROTECTIVE_STOP
+            state["speed_scaling"] = 1.0
+        if "program_state" in fields:
+            state["digital_outputs"] = self.digital_outputs
+            state["program_state"] = self.program_state
+        return state.tobytes()
+
+    # --- sockets ---
+
+    async def _handle_script(self, reader, writer):
+        script = ScriptReader()
+        connection = (asyncio.current_task(), writer)
+        self._connections.add(connection)
+        try:
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                for lines in script.feed(data.decode("utf-8", "replace")):
+                    self.load(lines)
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def _handle_realtime(self, reader, writer):
+        self._clients.add(writer)
+        connection = (asyncio.current_task(), writer)
+        self._connections.add(connection)
+        try:
+            # clients only listen, wait until they disconnect
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            self._connections.discard(connection)
+            writer.close()
+
+    def _broadcast(self, packet):
+        for writer in list(self._clients):
+            if writer.is_closing():
+                self._clients.discard(writer)
+            elif writer.transport.get_write_buffer_size() > 1 << 20:
+                # the client stopped reading, drop it like the controller does
+                self._clients.discard(writer)
+                writer.close()
+            else:
+                writer.write(packet)
+
+    async def serve(self):
+        """
+        Serves both interfaces and runs the controller until stop is called
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        script_server = await asyncio.start_server(self._handle_script, self.host, self.script_port)
+        realtime_server = await asyncio.start_server(self._handle_realtime, self.host, self.realtime_port)
+        self._ready.set()
+        period = self.dt / self.time_scale
+        start = self._loop.time()
+        ticks = 0
+        try:
+            while not self._stopping.is_set():
+                # catch up on all periods that are due, so the packet rate holds when the loop is late
+                due = int((self._loop.time() - start) / period)
+                while ticks < due:
+                    self._broadcast(self.step())
+                    ticks += 1
+                await asyncio.sleep(max(0.0, start + (ticks + 1) * period - self._loop.time()))
+        finally:
+            for server in (script_server, realtime_server):
+                server.close()
+            # closing the sockets ends the connection handlers
+            connections = list(self._connections)
+            for _, writer in connections:
+                writer.close()
+            await asyncio.gather(*[task for task, _ in connections], return_exceptions=True)
+
+    def run(self):
+        """
+        Runs the emulator in the current thread until interrupted
+        """
+        asyncio.run(self.serve())
+
+    def start(self, timeout=5.0):
+        """
+        Starts the emulator in a background thread and waits until it accepts connections
+        """
+        if self._thread is not None:
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self.run, name="UREmulator", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise OSError("Emulator did not start")
+
+    def stop(self):
+        """
+        Stops the background thread and closes all connections
+        """
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join()
+        self._thread = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Emulated UR controller")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--robot", default="UR5e")
+    parser.add_argument("--frequency", type=float, default=500.0)
+    parser.add_argument("--length", type=int, default=RT_LAYOUTS[-1].length, help="real-time packet length")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    args = parser.parse_args()
+    emulator = UREmulator(args.host, robot=args.robot, frequency=args.frequency, packet_length=args.length,
+                          time_scale=args.time_scale)
+    print("emulating %s at %g Hz, %s, script port %d, real-time port %d" % (
+        args.robot, args.frequency, emulator.layout, emulator.script_port, emulator.realtime_port))
+    try:
+        emulator.run()
+    except KeyboardInterrupt:
+        pass
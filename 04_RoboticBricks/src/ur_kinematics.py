@@ -0,0 +1,348 @@
+"""
+This module contains vectorized kinematics for Universal Robots arms:
+    1) Denavit Hartenberg parameters of the UR CB3 and e-Series robots
+    2) Forward kinematics for arrays of joint configurations
+    3) Analytic inverse kinematics (all 8 configurations) and joint space paths
+    4) Joint space sampling
+All lengths are in mm and all angles in radians.
+"""
+
+import math
+
+import numpy as np
+import compas.geometry as cg
+
+import utils
+
+# Denavit Hartenberg parameters published by Universal Robots (d and a in mm)
+_ALPHA = [math.pi / 2, 0, 0, math.pi / 2, -math.pi / 2, 0]
+UR_DH = {
+    "UR3": {"d": [151.9, 0, 0, 112.35, 85.35, 81.9], "a": [0, -243.65, -213.25, 0, 0, 0], "alpha": _ALPHA},
+    "UR5": {"d": [89.159, 0, 0, 109.15, 94.65, 82.3], "a": [0, -425.0, -392.25, 0, 0, 0], "alpha": _ALPHA},
+    "UR10": {"d": [127.3, 0, 0, 163.941, 115.7, 92.2], "a": [0, -612.0, -572.3, 0, 0, 0], "alpha": _ALPHA},
+    "UR3e": {"d": [151.85, 0, 0, 131.05, 85.35, 92.1], "a": [0, -243.55, -213.2, 0, 0, 0], "alpha": _ALPHA},
+    "UR5e": {"d": [162.5, 0, 0, 133.3, 99.7, 99.6], "a": [0, -425.0, -392.2, 0, 0, 0], "alpha": _ALPHA},
+    "UR10e": {"d": [180.7, 0, 0, 174.15, 119.85, 116.55], "a": [0, -612.7, -571.55, 0, 0, 0], "alpha": _ALPHA},
+    "UR16e": {"d": [180.7, 0, 0, 174.15, 119.85, 116.55], "a": [0, -478.4, -360.0, 0, 0, 0], "alpha": _ALPHA},
+}
+
+# Joint limits of all UR arms in radians
+JOINT_LIMITS = np.array([[-2 * math.pi, 2 * math.pi]] * 6)
+
+
+def get_dh_parameters(robot):
+    """
+    Returns the Denavit Hartenberg parameters of a robot
+
+    Args:
+        robot: str. Robot model, e.g. "UR5e", or a dictionary with "d", "a" and "alpha" lists
+
+    Returns:
+        d, a, alpha: (6,) arrays
+    """
+    params = UR_DH[robot] if isinstance(robot, str) else robot
+    return (np.asarray(params["d"], dtype=float), np.asarray(params["a"], dtype=float),
+            np.asarray(params["alpha"], dtype=float))
+
+
+def _as_matrix(transform):
+    # Accept a Frame, a Transformation or a 4x4 array
+    if isinstance(transform, cg.Frame):
+        transform = cg.Transformation.from_frame(transform)
+    if hasattr(transform, "matrix"):
+        transform = transform.matrix
+    return np.asarray(transform, dtype=float)
+
+
+def forward_kinematics(joints, robot="UR5e", tcp=None, base=None, all_links=False):
+    """
+    Computes the flange (or TCP) pose for an array of joint configurations
+
+    Args:
+        joints: (N,6) or (6,) array of joint angles in radians
+        robot: str. Robot model, e.g. "UR5e", or a dictionary with "d", "a" and "alpha" lists
+        tcp: Frame, Transformation or 4x4 array. Tool center point relative to the flange
+        base: Frame, Transformation or 4x4 array. Robot base in world coordinates
+        all_links: bool. Also return the frames of all six links
+
+    Returns:
+        poses: (N,4,4) array of flange/TCP transformations (or (N,6,4,4) if all_links is True)
+    """
+    joints = np.asarray(joints, dtype=float)
+    single = joints.ndim == 1
+    joints = np.atleast_2d(joints)
+
+    d, a, alpha = get_dh_parameters(robot)
+    links = utils.dh_matrices(d, joints, a, alpha)  # (N,6,4,4)
+
+    poses = np.empty_like(links) if all_links else None
+    pose = links[:, 0]
+    if all_links:
+        poses[:, 0] = pose
+    for i in range(1, 6):
+        pose = pose @ links[:, i]
+        if all_links:
+            poses[:, i] = pose
+    if all_links:
+        pose = poses
+    if tcp is not None:
+        pose = pose @ _as_matrix(tcp)
+    if base is not None:
+        pose = _as_matrix(base) @ pose
+
+    return pose[0] if single else pose
+
+
+def frames_to_matrices(frames):
+    """
+    Converts frames to 4x4 transformation matrices
+
+    Args:
+        frames: list of compas.geometry.Frame, (N,4,4) array, or (N,3,3) array of [point, xaxis, yaxis]
+
+    Returns:
+        matrices: (N,4,4) array
+    """
+    if not (len(frames) and isinstance(frames[0], cg.Frame)):
+        frames = np.asarray(frames, dtype=float)
+        if frames.ndim == 3 and frames.shape[1:] == (4, 4):
+            return frames
+    points, rotations = utils.frames_to_arrays(frames)
+    matrices = np.zeros((len(points), 4, 4))
+    matrices[:, :3, :3] = rotations
+    matrices[:, :3, 3] = points
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def _invert(m):
+    # Inverse of rigid transformations (...,4,4)
+    inverse = np.zeros_like(m)
+    rotation_t = np.swapaxes(m[..., :3, :3], -1, -2)
+    inverse[..., :3, :3] = rotation_t
+    inverse[..., :3, 3] = -(rotation_t @ m[..., :3, 3:])[..., 0]
+    inverse[..., 3, 3] = 1.0
+    return inverse
+
+
+def _wrap(angles):
+    # Wrap to (-pi, pi]
+    return -((-angles + math.pi) % (2 * math.pi) - math.pi)
+
+
+def inverse_kinematics(poses, robot="UR5e", tcp=None, base=None):
+    """
+    Closed-form inverse kinematics of the UR arm for an array of target poses.
+    Every pose has up to 8 solutions: shoulder left/right x wrist up/down x elbow up/down.
+    When the wrist is singular (joint 5 at 0 or pi), joint 6 is undefined and set to 0.
+
+    Args:
+        poses: (N,4,4) array or list of Frames (flange/TCP targets in mm), or a single 4x4 pose
+        robot: str. Robot model, e.g. "UR5e", or a dictionary with "d", "a" and "alpha" lists
+        tcp: Frame, Transformation or 4x4 array. Tool center point relative to the flange
+        base: Frame, Transformation or 4x4 array. Robot base in world coordinates
+
+    Returns:
+        solutions: (N,8,6) array of joint angles in (-pi, pi], NaN where a configuration is unreachable
+    """
+    single = False
+    if isinstance(poses, cg.Frame):
+        poses, single = [poses], True
+    elif not (len(poses) and isinstance(poses[0], cg.Frame)) and np.ndim(poses) == 2:
+        poses, single = np.asarray(poses, dtype=float)[None], True
+    poses = frames_to_matrices(poses)
+    if base is not None:
+        poses = _invert(_as_matrix(base)) @ poses
+    if tcp is not None:
+        poses = poses @ _invert(_as_matrix(tcp))
+
+    d, a, alpha = get_dh_parameters(robot)
+    n = len(poses)
+    # branch signs for the 8 solutions
+    s1 = np.repeat([1.0, -1.0], 4)
+    s5 = np.tile(np.repeat([1.0, -1.0], 2), 2)
+    s3 = np.tile([1.0, -1.0], 4)
+    T06 = np.repeat(poses[:, None], 8, axis=1)  # (N,8,4,4)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # theta1 from the wrist 2 position
+        p05 = (T06 @ np.array([0.0, 0.0, -d[5], 1.0]))[..., :3]
+        psi = np.arctan2(p05[..., 1], p05[..., 0])
+        phi = np.arccos(d[3] / np.hypot(p05[..., 0], p05[..., 1]))
+        theta1 = psi + s1 * phi + math.pi / 2
+
+        # theta5 from the flange position
+        p06 = T06[..., :3, 3]
+        c5 = (p06[..., 0] * np.sin(theta1) - p06[..., 1] * np.cos(theta1) - d[3]) / d[5]
+        theta5 = s5 * np.arccos(np.clip(c5, -1.0, 1.0))
+        valid = ~np.isnan(phi) & (np.abs(c5) <= 1.0 + 1e-9)
+
+        # theta6 from the orientation, undefined when the wrist is singular
+        T16 = _invert(_invert(utils.dh_matrices(d[0], theta1, a[0], alpha[0])) @ T06)
+        s5_sin = np.sin(theta5)
+        theta6 = np.arctan2(-T16[..., 1, 2] / s5_sin, T16[..., 0, 2] / s5_sin)
+        theta6 = np.where(np.abs(s5_sin) < 1e-9, 0.0, theta6)
+
+        # theta3 and theta2 from the planar two link problem
+        T01 = utils.dh_matrices(d[0], theta1, a[0], alpha[0])
+        T45 = utils.dh_matrices(d[4], theta5, a[4], alpha[4])
+        T56 = utils.dh_matrices(d[5], theta6, a[5], alpha[5])
+        T14 = _invert(T01) @ T06 @ _invert(T45 @ T56)
+        p13 = (T14 @ np.array([0.0, -d[3], 0.0, 1.0]))[..., :3]
+        r13 = np.linalg.norm(p13, axis=-1)
+        c3 = (r13 ** 2 - a[1] ** 2 - a[2] ** 2) / (2 * a[1] * a[2])
+        valid &= np.abs(c3) <= 1.0 + 1e-9
+        theta3 = s3 * np.arccos(np.clip(c3, -1.0, 1.0))
+        theta2 = -np.arctan2(p13[..., 1], -p13[..., 0]) + np.arcsin(a[2] * np.sin(theta3) / r13)
+
+        # theta4 from the remaining rotation
+        T12 = utils.dh_matrices(d[1], theta2, a[1], alpha[1])
+        T23 = utils.dh_matrices(d[2], theta3, a[2], alpha[2])
+        T34 = _invert(T23) @ _invert(T12) @ T14
+        theta4 = np.arctan2(T34[..., 1, 0], T34[..., 0, 0])
+
+    solutions = _wrap(np.stack([theta1, theta2, theta3, theta4, theta5, theta6], axis=-1))
+    solutions[~valid] = np.nan
+    return solutions[0] if single else solutions
+
+
+def closest_configuration(solutions, reference, limits=JOINT_LIMITS):
+    """
+    Picks the solution closest to a reference configuration. Every joint is shifted by multiples
+    of 2 pi to the equivalent angle closest to the reference that lies within the joint limits.
+
+    Args:
+        solutions: (8,6) array of joint angles, NaN rows are ignored
+        reference: (6,) array of joint angles, e.g. the previous waypoint
+        limits: (6,2) array of [min, max] joint angles in radians
+
+    Returns:
+        joints: (6,) array, or None if no solution is valid
+    """
+    limits = np.asarray(limits, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    shifted = reference + _wrap(solutions - reference)
+    # move back inside the joint limits where the closest equivalent angle is outside
+    shifted = np.where(shifted > limits[:, 1], shifted - 2 * math.pi, shifted)
+    shifted = np.where(shifted < limits[:, 0], shifted + 2 * math.pi, shifted)
+    distance = np.abs(shifted - reference).max(axis=1)
+    distance = np.where(np.isnan(distance), np.inf, distance)
+    best = np.argmin(distance)
+    if not np.isfinite(distance[best]):
+        return None
+    return shifted[best]
+
+
+def joint_path(frames, robot="UR5e", q0=None, tcp=None, base=None, limits=JOINT_LIMITS, max_step=math.pi / 2):
+    """
+    Computes a joint space path through a list of Cartesian targets, always staying on the branch
+    closest to the previous waypoint. Steps where a joint turns more than max_step between consecutive
+    targets are configuration flips (e.g. passing a wrist singularity), they raise before the robot moves.
+
+    Args:
+        frames: list of compas.geometry.Frame or (N,4,4) array of targets (in mm)
+        robot: str. Robot model
+        q0: (6,) array. Start configuration in radians, e.g. the current joints. Zeros if None,
+            then the step to the first target is not checked
+        tcp: Frame, Transformation or 4x4 array. Tool center point relative to the flange
+        base: Frame, Transformation or 4x4 array. Robot base in world coordinates
+        limits: (6,2) array of [min, max] joint angles in radians
+        max_step: float. Largest joint rotation in radians between consecutive targets, None to not check
+
+    Returns:
+        joints: (N,6) array of joint angles in radians
+
+    Raises:
+        ValueError: if a target is unreachable or a step exceeds max_step
+    """
+    solutions = inverse_kinematics(frames, robot, tcp, base)
+    joints = np.empty((len(solutions), 6))
+    start = np.zeros(6) if q0 is None else np.asarray(q0, dtype=float)
+    previous = start
+    for i, candidates in enumerate(solutions):
+        best = closest_configuration(candidates, previous, limits)
+        if best is None:
+            raise ValueError("Target %d is not reachable" % i)
+        joints[i] = previous = best
+
+    if max_step is not None and len(joints):
+        steps = np.abs(np.diff(np.vstack((start, joints)), axis=0)).max(axis=1)
+        if q0 is None:
+            steps[0] = 0.0
+        flips = np.flatnonzero(steps > max_step)
+        if len(flips):
+            raise ValueError("Configuration flip before target %s, joint step of %.1f deg (max_step %.1f deg)" % (
+                ", ".join(str(i) for i in flips[:10].tolist()) + (", ..." if len(flips) > 10 else ""),
+                math.degrees(steps[flips].max()), math.degrees(max_step)))
+    return joints
+
+
+def sample_joint_space(n, limits=JOINT_LIMITS, seed=None):
+    """
+    Uniformly samples joint configurations within joint limits
+
+    Args:
+        n: int. Number of samples
+        limits: (6,2) array of [min, max] joint angles in radians
+        seed: int. Seed for reproducible samples
+
+    Returns:
+        joints: (n,6) array of joint angles in radians
+    """
+    limits = np.asarray(limits, dtype=float)
+    rng = np.random.default_rng(seed)
+    return rng.uniform(limits[:, 0], limits[:, 1], size=(n, 6))
+
+
+def sample_workspace(n, robot="UR5e", tcp=None, limits=JOINT_LIMITS, seed=None):
+    """
+    Samples reachable TCP positions, e.g. to precompute a workspace check
+
+    Args:
+        n: int. Number of samples
+        robot: str. Robot model
+        tcp: Frame, Transformation or 4x4 array. Tool center point relative to the flange
+        limits: (6,2) array of [min, max] joint angles in radians
+        seed: int. Seed for reproducible samples
+
+    Returns:
+        points: (n,3) array of TCP positions in mm
+        joints: (n,6) array of the sampled joint angles
+    """
+    joints = sample_joint_space(n, limits, seed)
+    return forward_kinematics(joints, robot, tcp)[:, :3, 3], joints
+
+
+def reach(robot="UR5e"):
+    """
+    Returns the maximum distance between the shoulder axis and the wrist centre, a quick upper bound
+    for checking whether targets can be reachable at all
+
+    Args:
+        robot: str. Robot model
+
+    Returns:
+        reach: float. in mm
+    """
+    d, a, alpha = get_dh_parameters(robot)
+    return abs(a[1]) + abs(a[2])
+
+
+def in_reach(points, robot="UR5e", margin=0.0):
+    """
+    Vectorized check of wrist centre points against the reach of the arm
+
+    Args:
+        points: (N,3) array of wrist centre positions in the robot base frame in mm
+        robot: str. Robot model
+        margin: float. Safety margin in mm
+
+    Returns:
+        mask: (N,) boolean array, True for points that may be reachable
+    """
+    d, a, alpha = get_dh_parameters(robot)
+    points = np.asarray(points, dtype=float)
+    shoulder = np.array([0.0, 0.0, d[0]])
+    # The wrist centre is offset sideways by d4 from the plane of the upper and lower arm
+    planar = np.sqrt(np.maximum(np.sum((points - shoulder) ** 2, axis=1) - d[3] ** 2, 0.0))
+    return planar <= reach(robot) - margin
@@ -6,20 +6,72 @@ This module contains utility functions:
 
 import compas.geometry as cg
 import math
+import numpy as np
 
 # ----- Coordinate System conversions -----
-def calculate_blend_radius(way_planes, radius):
-    radii = []
-    for i,frame in enumerate(way_planes[:-1]):
-        dist = frame.point.distance_to_point(way_planes[i+1].point)
-        if abs(radius)>dist/2:
-            radius = dist/2
-        else:
-            radius = radius
-        radii.append(radius)
-    radii.append(0.0) #last point should be zero
+def calculate_blend_radius(way_planes, radius, max_deviation=None, max_angle=None):
+    """
+    Function that calculates the blend radius of every way plane in one vectorized pass.
+    Every blend is limited to half of the segments before and after its way plane, so neighbouring blends
+    never overlap, and a short segment only shrinks the blends at its own ends. The last way plane is not blended.
+
+    Args:
+        way_planes: A list of compas.geometry Frame objects, an (N,3) array of points or an (N,3,3) array of
+            [point, xaxis, yaxis] rows (in mm)
+        radius: float or list of floats. Blend radius in mm, or one per way plane
+        max_deviation: float. Largest distance in mm the blend may cut a corner by. Shrinks the blends at
+            sharp corners and keeps blends on densely divided curves within the tolerance of the curve
+        max_angle: float. Corners turning by more than this angle in radians are not blended
+
+    Returns:
+        radii: (N,) array of blend radii in mm
+    """
+    if len(way_planes) and isinstance(way_planes[0], cg.Frame):
+        points = np.array([list(frame.point) for frame in way_planes], dtype=float)
+    else:
+        points = np.asarray(way_planes, dtype=float)
+        points = points[:, 0] if points.ndim == 3 else points.reshape(-1, 3)
+    n = len(points)
+    radii = np.maximum(np.broadcast_to(np.asarray(radius, dtype=float), (n,)), 0.0)
+    if n < 2:
+        return np.zeros(n)
+
+    half_segments = np.linalg.norm(np.diff(points, axis=0), axis=1) / 2
+    radii = np.minimum(radii, np.concatenate((half_segments, [0.0])))
+    radii[1:] = np.minimum(radii[1:], half_segments)
+
+    if max_deviation is not None or max_angle is not None:
+        angles = corner_angles(points)
+        if max_deviation is not None:
+            # a blend of radius r cuts a corner turning by angle by r * tan(angle / 4)
+            with np.errstate(divide="ignore"):
+                radii = np.minimum(radii, np.where(angles > 0, max_deviation / np.tan(angles / 4), np.inf))
+        if max_angle is not None:
+            radii = np.where(angles > max_angle, 0.0, radii)
     return radii
-        
+
+
+def corner_angles(points):
+    """
+    Function that calculates the direction change at every way point of a path,
+    0 at the ends and next to segments without length
+
+    Args:
+        points: (N,3) array of way points
+
+    Returns:
+        angles: (N,) array in radians, 0 for going straight on, pi for turning back
+    """
+    angles = np.zeros(len(points))
+    if len(points) < 3:
+        return angles
+    directions = np.diff(points, axis=0)
+    norms = np.linalg.norm(directions, axis=1)
+    directions = directions / np.where(norms > 0, norms, 1.0)[:, None]
+    cosines = np.einsum("ij,ij->i", directions[:-1], directions[1:])
+    angles[1:-1] = np.where((norms[:-1] > 0) & (norms[1:] > 0), np.arccos(np.clip(cosines, -1.0, 1.0)), 0.0)
+    return angles
+
 
 def rhino_to_robotbase(ref_plane,robot_base):
     """
@@ -42,79 +94,164 @@ def rhino_to_robotbase(ref_plane,robot_base):
 
 def matrix_to_axis_angle(m):
     """
-    Function that transforms a 4x4 matrix to axis-angle format
-    referenced from Martin Baker's www.euclideanspace.com
-    
+    Function that transforms a 4x4 matrix to axis-angle format.
+    Goes through a unit quaternion (Shepperd's method), which stays accurate near 0 and 180 degrees
+
     Args:
-        m: compas.geometry Transformation object - 4x4 matrix
-    
+        m: compas.geometry Transformation object - 4x4 matrix (or a nested list / array, 3x3 or 4x4)
+
     Returns:
         axis: compas.geometry Vector object - axis-angle notation
     """
-    
-    epsilon = 0.01
-    epsilon2 = 0.01
-    
-    # Access matrix elements using array indexing
-    if (math.fabs(m[0,1] - m[1,0]) < epsilon) & (math.fabs(m[0,2] - m[2,0]) < epsilon) & (math.fabs(m[1,2] - m[2,1]) < epsilon):
-    #singularity found
-    #first check for identity matrix which must have +1 for all terms
-    #in leading diagonal and zero in other terms
-        if (math.fabs(m[0,1] + m[1,0]) < epsilon2) & (math.fabs(m[0,2] + m[2,0]) < epsilon2) & (math.fabs(m[1,2] + m[2,1]) < epsilon2) & (math.fabs(m[0,0] + m[1,1] + m[2,2] - 3) < epsilon2):
-            #this singularity is identity matrix so angle = 0   make zero angle, arbitrary axis
-            angle = 0
-            x = 1
-            y = z = 0
-        else:
-            # otherwise this singularity is angle = 180
-            angle = math.pi;
-            xx = (m[0,0] + 1) / 2
-            yy = (m[1,1] + 1) / 2
-            zz = (m[2,2] + 1) / 2
-            xy = (m[0,1] + m[1,0]) / 4
-            xz = (m[0,2] + m[2,0]) / 4
-            yz = (m[1,2] + m[2,1]) / 4
-            if ((xx > yy) & (xx > zz)):
-                # m[0,0] is the largest diagonal term
-                if (xx < epsilon):
-                    x = 0
-                    y = z = 0.7071
-                else:
-                    x = math.sqrt(xx)
-                    y = xy / x
-                    z = xz / x
-            elif (yy > zz): 
-                # m[1,1] is the largest diagonal term
-                if (yy < epsilon):
-                    x = z = 0.7071
-                    y = 0
-                else: 
-                    y = math.sqrt(yy)
-                    x = xy / y
-                    z = yz / y
-            else: 
-                # m[2,2] is the largest diagonal term so base result on this
-                if (zz < epsilon):
-                    x = y = 0.7071
-                    z = 0
-                else:
-                    z = math.sqrt(zz)
-                    x = xz / z
-                    y = yz / z
+
+    if hasattr(m, "matrix"):
+        m = m.matrix
+    m00, m01, m02 = m[0][0], m[0][1], m[0][2]
+    m10, m11, m12 = m[1][0], m[1][1], m[1][2]
+    m20, m21, m22 = m[2][0], m[2][1], m[2][2]
+
+    # Pick the best conditioned of the four quaternion formulas
+    trace = m00 + m11 + m22
+    if trace >= m00 and trace >= m11 and trace >= m22:
+        s = math.sqrt(1 + trace) * 2
+        w, x, y, z = 0.25 * s, (m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s
+    elif m00 >= m11 and m00 >= m22:
+        s = math.sqrt(1 + m00 - m11 - m22) * 2
+        w, x, y, z = (m21 - m12) / s, 0.25 * s, (m01 + m10) / s, (m02 + m20) / s
+    elif m11 >= m22:
+        s = math.sqrt(1 + m11 - m00 - m22) * 2
+        w, x, y, z = (m02 - m20) / s, (m01 + m10) / s, 0.25 * s, (m12 + m21) / s
     else:
-        s = math.sqrt((m[2,1] - m[1,2]) * (m[2,1] - m[1,2])+ (m[0,2] - m[2,0]) * (m[0,2] - m[2,0])+ (m[1,0] - m[0,1]) * (m[1,0] - m[0,1])); # used to normalise
-        if (math.fabs(s) < 0.001):
-            #prevent divide by zero, should not happen if matrix is orthogonal and should be
-            s = 1
-        angle = math.acos((m[0,0] + m[1,1] + m[2,2] - 1) / 2)
-        x = (m[2,1] - m[1,2]) / s
-        y = (m[0,2] - m[2,0]) / s
-        z = (m[1,0] - m[0,1]) / s
-    angleRad = angle
-    axis = cg.Vector(x, y, z)
-    axis = axis * angleRad
-    
-    return axis
+        s = math.sqrt(1 + m22 - m00 - m11) * 2
+        w, x, y, z = (m10 - m01) / s, (m02 + m20) / s, (m12 + m21) / s, 0.25 * s
+
+    # Normalise and keep the rotation angle in [0, pi]
+    q = math.sqrt(w * w + x * x + y * y + z * z)
+    if w < 0:
+        q = -q
+    w, x, y, z = w / q, x / q, y / q, z / q
+
+    n = math.sqrt(x * x + y * y + z * z)
+    # np.arctan2 rather than math.atan2, so results match matrices_to_axis_angles to the last bit
+    scale = 2 * float(np.arctan2(n, w)) / n if n > 0 else 2.0
+    return cg.Vector(x * scale, y * scale, z * scale)
+
+def frames_to_arrays(frames):
+    """
+    Function that packs frames into contiguous origin and rotation arrays.
+    Axes are unitized and orthogonalized the same way compas.geometry.Frame does it,
+    so the result matches cg.Transformation.from_frame_to_frame(cg.Frame.worldXY(), frame)
+
+    Args:
+        frames: A list of compas.geometry Frame objects, an (N,3) array of points (world XY orientation)
+            or an (N,3,3) array of [point, xaxis, yaxis] rows
+
+    Returns:
+        points: (N,3) array of frame origins
+        rotations: (N,3,3) array of rotation matrices (columns are the x, y and z axes)
+    """
+
+    if len(frames) and isinstance(frames[0], cg.Frame):
+        _data = np.array([[f.point, f.xaxis, f.yaxis, f.zaxis] for f in frames], dtype=float)
+        return _data[:, 0], np.ascontiguousarray(_data[:, 1:].transpose(0, 2, 1))
+
+    _data = np.asarray(frames, dtype=float)
+    if _data.ndim < 3:
+        _data = _data.reshape(-1, 1, 3)
+    points = _data[:, 0]
+    rotations = np.zeros((len(_data), 3, 3))
+    rotations[:, [0, 1, 2], [0, 1, 2]] = 1.0
+    if _data.shape[1] == 1:
+        return points, rotations
+
+    # Same operation order as Frame.xaxis / Frame.yaxis setters
+    x = _unitize(_data[:, 1])
+    z = _unitize(_cross(x, _unitize(_data[:, 2])))
+    y = _cross(z, x)
+    z = _cross(x, y)
+    rotations[:, :, 0] = x
+    rotations[:, :, 1] = y
+    rotations[:, :, 2] = z
+    return points, rotations
+
+def _unitize(v):
+    length = np.sqrt(v[:, 0] ** 2 + v[:, 1] ** 2 + v[:, 2] ** 2)
+    return v / length[:, None]
+
+def _cross(u, v):
+    return np.stack([
+        u[:, 1] * v[:, 2] - u[:, 2] * v[:, 1],
+        u[:, 2] * v[:, 0] - u[:, 0] * v[:, 2],
+        u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0],
+    ], axis=1)
+
+def matrices_to_axis_angles(matrices):
+    """
+    Batch version of matrix_to_axis_angle. Evaluates the same quaternion formulas with NumPy masks
+    instead of branches, so every row matches the scalar function exactly
+
+    Args:
+        matrices: (N,3,3) or (N,4,4) array of rotation/transformation matrices
+
+    Returns:
+        axis_angles: (N,3) array - axis-angle notation
+    """
+
+    m = np.asarray(matrices, dtype=float)[:, :3, :3]
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+
+    # Pick the best conditioned of the four quaternion formulas
+    trace = m00 + m11 + m22
+    case_w = (trace >= m00) & (trace >= m11) & (trace >= m22)
+    case_x = ~case_w & (m00 >= m11) & (m00 >= m22)
+    case_y = ~case_w & ~case_x & (m11 >= m22)
+    case_z = ~case_w & ~case_x & ~case_y
+
+    wxyz = np.empty((len(m), 4))
+    c = case_w
+    s = np.sqrt(1 + trace[c]) * 2
+    wxyz[c] = np.stack([0.25 * s, (m21[c] - m12[c]) / s, (m02[c] - m20[c]) / s, (m10[c] - m01[c]) / s], axis=1)
+    c = case_x
+    s = np.sqrt(1 + m00[c] - m11[c] - m22[c]) * 2
+    wxyz[c] = np.stack([(m21[c] - m12[c]) / s, 0.25 * s, (m01[c] + m10[c]) / s, (m02[c] + m20[c]) / s], axis=1)
+    c = case_y
+    s = np.sqrt(1 + m11[c] - m00[c] - m22[c]) * 2
+    wxyz[c] = np.stack([(m02[c] - m20[c]) / s, (m01[c] + m10[c]) / s, 0.25 * s, (m12[c] + m21[c]) / s], axis=1)
+    c = case_z
+    s = np.sqrt(1 + m22[c] - m00[c] - m11[c]) * 2
+    wxyz[c] = np.stack([(m10[c] - m01[c]) / s, (m02[c] + m20[c]) / s, (m12[c] + m21[c]) / s, 0.25 * s], axis=1)
+
+    # Normalise and keep the rotation angle in [0, pi]
+    w, x, y, z = wxyz.T
+    q = np.sqrt(w * w + x * x + y * y + z * z)
+    q = np.where(w < 0, -q, q)
+    w, x, y, z = w / q, x / q, y / q, z / q
+
+    n = np.sqrt(x * x + y * y + z * z)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(n > 0, 2 * np.arctan2(n, w) / n, 2.0)
+    return np.stack([x * scale, y * scale, z * scale], axis=1)
+
+def axis_angles_to_matrices(r):
+    """
+    Rotation matrices from axis-angle vectors (Rodrigues' formula), the inverse of matrices_to_axis_angles
+
+    Args:
+        r: (N,3) array of axis-angle vectors
+
+    Returns:
+        matrices: (N,3,3) array
+    """
+    r = np.asarray(r, dtype=float).reshape(-1, 3)
+    angle = np.linalg.norm(r, axis=1)
+    k = r / np.where(angle > 0, angle, 1.0)[:, None]
+    K = np.zeros((len(r), 3, 3))
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -k[:, 2], k[:, 1], -k[:, 0]
+    K = K - K.transpose(0, 2, 1)
+    s, c = np.sin(angle)[:, None, None], np.cos(angle)[:, None, None]
+    return np.eye(3) + s * K + (1 - c) * K @ K
 
 def matrix_to_euler(m):
     """
@@ -159,6 +296,39 @@ def dh_matrix(d, theta, a, alpha):
             
     return m
 
+def dh_matrices(d, theta, a, alpha):
+    """
+    Batch version of dh_matrix. Arguments are broadcast against each other
+
+    Arguments:
+        d: Joint distance. in mm
+        theta: joint angle. in radians
+        a: link length. in mm
+        alpha: twist angle. in radians
+
+    Returns:
+        m: (...,4,4) array of Denavit Hartenberg transformation matrices
+    """
+
+    d, theta, a, alpha = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (d, theta, a, alpha)))
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(alpha), np.sin(alpha)
+
+    m = np.zeros(theta.shape + (4, 4))
+    m[..., 0, 0] = ct
+    m[..., 0, 1] = -st * ca
+    m[..., 0, 2] = st * sa
+    m[..., 0, 3] = a * ct
+    m[..., 1, 0] = st
+    m[..., 1, 1] = ct * ca
+    m[..., 1, 2] = -ct * sa
+    m[..., 1, 3] = a * st
+    m[..., 2, 1] = sa
+    m[..., 2, 2] = ca
+    m[..., 2, 3] = d
+    m[..., 3, 3] = 1.0
+    return m
+
 def concatenate_matrices(matrices):
     """
     This function creates a concatenated matrix from a list of matrices
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules import each other by name, like in Grasshopper: put both folders on the path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "src")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,73 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from abb_simulator import SimulatedAbbClient, profile_time, MAX_ACCELERATION, MAX_JERK
+
+
+def instruction(name, float_values=(), string_values=(), feedback_level=0):
+    # The attributes of a compas_rrc instruction the simulator reads
+    return SimpleNamespace(instruction="r_RRC_" + name, float_values=list(float_values),
+                           string_values=list(string_values), feedback_level=feedback_level)
+
+
+def move_to(x, speed=100.0, zone=0.0):
+    return instruction("MoveTo", [x, 0.0, 500.0, 0.0, 0.0, 1.0, 0.0] + [0.0] * 6 + [speed, zone], ["FrameL"])
+
+
+def test_profile_time():
+    assert profile_time(0.0, 100.0, 1000.0) == 0.0
+    # trapezoid: cruise plus the time lost accelerating and decelerating
+    assert profile_time(1000.0, 100.0, 1000.0) == pytest.approx(1000.0 / 100.0 + 100.0 / 1000.0)
+    # triangle: too short to reach the speed
+    assert profile_time(1.0, 100.0, 1000.0) == pytest.approx(2 * math.sqrt(1.0 / 1000.0))
+    assert profile_time(1000.0, 100.0, 1000.0, ramp_time=0.05) == pytest.approx(10.2)
+    # arriving at speed, no acceleration phase
+    assert profile_time(1000.0, 100.0, 1000.0, v_in=100.0, v_out=100.0) == pytest.approx(10.0)
+
+
+def test_stop_to_stop_moves():
+    abb = SimulatedAbbClient()
+    abb.send(instruction("SetAcceleration", [100.0, 100.0]))
+    abb.send(move_to(0.0))
+    abb.send(move_to(1000.0))
+    ramp_time = MAX_ACCELERATION / MAX_JERK
+    assert abb.clock() == pytest.approx(profile_time(1000.0, 100.0, MAX_ACCELERATION, ramp_time=ramp_time))
+    # the first move starts from an unknown position
+    assert abb.unknown_starts == 1
+
+
+def test_zones_blend_moves():
+    times = []
+    for zone in (0.0, 10.0):
+        abb = SimulatedAbbClient()
+        abb.send(move_to(0.0))
+        for x in (500.0, 1000.0):
+            abb.send(move_to(x, zone=zone))
+        times.append(abb.clock())
+    assert times[1] < times[0]
+    # a wait after the move stops the robot in the zone
+    abb = SimulatedAbbClient()
+    abb.send(move_to(0.0))
+    abb.send(move_to(500.0, zone=10.0))
+    abb.send(instruction("WaitTime", [1.0]))
+    abb.send(move_to(1000.0))
+    assert abb.clock() == pytest.approx(times[0] + 1.0)
+
+
+def test_cycles_latency_and_warnings():
+    abb = SimulatedAbbClient(cycle_io=("doGripper", 1.0), latency=0.5, io_time=0.1)
+    abb.send(instruction("SetWorkObject", string_values=["w_pallet0"]))
+    for x in (0.0, 1000.0):
+        abb.send(instruction("SetDigital", [1.0], ["doGripper"]))
+        abb.send(move_to(x))
+        abb.send_and_wait(instruction("WaitTime", [2.0]))
+    cycles = abb.get_cycles()
+    assert len(cycles) == 3
+    assert [cycle["moves"] for cycle in cycles] == [0, 1, 1]
+    assert cycles[1]["io"] == pytest.approx(0.1)
+    assert cycles[1]["total"] == pytest.approx(0.1 + 2.0 + 0.5)
+    assert cycles[2]["wait"] == pytest.approx(2.0)
+    assert abb.time == pytest.approx(sum(cycle["total"] for cycle in cycles))
+    assert abb.warnings == {"Unknown work object w_pallet0, taken as wobj0"}
@@ -0,0 +1,48 @@
+import numpy as np
+from compas.geometry import Frame
+
+from brick_wall import BigBrick, BrickCollection, generate_wall
+from brick_index import BrickIndex, validate_wall, is_valid
+
+
+def bricks_at(points, xaxes=None):
+    if xaxes is None:
+        xaxes = [[1, 0, 0]] * len(points)
+    frames = [Frame(list(p), list(x), [-x[1], x[0], 0]) for p, x in zip(points, xaxes)]
+    return BrickCollection.from_frames(frames, BigBrick)
+
+
+def test_query_matches_brute_force():
+    rng = np.random.default_rng(0)
+    angles = rng.uniform(0, np.pi, 300)
+    bricks = bricks_at(rng.uniform(0, 2000, (300, 3)), np.column_stack((np.cos(angles), np.sin(angles), np.zeros(300))))
+    index = BrickIndex(bricks)
+    box_min = rng.uniform(0, 2000, (50, 3))
+    box_max = box_min + rng.uniform(0, 400, (50, 3))
+    queries, found = index.query(box_min, box_max)
+    expected = np.all((index.aabb_min[None] <= box_max[:, None]) & (index.aabb_max[None] >= box_min[:, None]), axis=2)
+    assert sorted(zip(queries.tolist(), found.tolist())) == [tuple(pair) for pair in np.argwhere(expected).tolist()]
+
+
+def test_generated_wall_is_valid():
+    wall = generate_wall(np.linspace([0, 0, 0], [3000, 0, 0], 10), 5, BigBrick, gap=2.0, z_offset=BigBrick.HEIGHT / 2)
+    report = validate_wall(wall)
+    assert report["bricks"] == len(wall)
+    assert is_valid(report)
+
+
+def test_validate_wall_finds_problems():
+    h = BigBrick.HEIGHT
+    points = [
+        [0, 0, h / 2],              # 0 on the ground
+        [100, 0, h / 2],            # 1 overlaps 0
+        [1000, 0, 3 * h],           # 2 floats
+        [2000, 0, h / 2],           # 3 on the ground, placed after 4
+        [2000, 0, 1.5 * h],         # 4 on 3, blocks its approach
+    ]
+    report = validate_wall(bricks_at(points), order=[0, 1, 2, 4, 3])
+    assert report["overlaps"] == [[0, 1]]
+    assert report["unsupported"] == [2]
+    # 1 is lowered into 0
+    assert report["blocked_approaches"] == [[1, 0], [3, 4]]
+    assert not is_valid(report)
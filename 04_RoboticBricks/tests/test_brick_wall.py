@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from compas.geometry import Frame, Line, Polyline
+
+from brick_wall import Brick, BigBrick, BrickCollection, generate_wall
+
+
+@pytest.mark.parametrize("brick_cls", [Brick, BigBrick])
+def test_pick_frame_is_not_shared(brick_cls):
+    brick = brick_cls(Frame([0, 0, 0], [1, 0, 0], [0, 1, 0]))
+    expected = brick.get_pick_frame()
+    changed = brick.get_pick_frame()
+    changed.point.z += 10
+    changed.xaxis = [0, 1, 0]
+    assert brick.get_pick_frame() == expected
+    assert brick.get_pick_frame() is not brick.get_pick_frame()
+
+
+def test_box_is_not_shared():
+    brick = Brick(Frame([0, 0, 0], [1, 0, 0], [0, 1, 0]))
+    box = brick.draw()
+    box.frame.point.x += 100
+    box.xsize = 1.0
+    assert brick.draw().frame.point.x == 0
+    assert brick.draw().xsize == Brick.LENGTH
+    assert brick.frame.point.x == 0
+
+
+def test_pick_frame_follows_the_brick():
+    brick = BigBrick(Frame([0, 0, 0], [1, 0, 0], [0, 1, 0]))
+    assert brick.get_pick_frame().point.z == -BigBrick.HEIGHT / 2
+    brick.frame.point.z = 100
+    assert brick.get_pick_frame().point.z == 100 - BigBrick.HEIGHT / 2
+    brick.rotate(90)
+    assert np.allclose(list(brick.get_pick_frame().yaxis), [-1, 0, 0])
+
+
+def test_pick_frame_cache():
+    brick = Brick(Frame([0, 0, 0], [1, 0, 0], [0, 1, 0]))
+    brick.get_pick_frame()
+    cache = brick._pick_cache
+    brick.get_pick_frame()
+    assert brick._pick_cache is cache
+    brick.frame.point.x = 10
+    assert brick.get_pick_frame().point.x == 10
+    brick.frame = Frame([0, 0, 50], [1, 0, 0], [0, 1, 0])
+    assert brick.get_pick_frame().point.z == 50 + Brick.HEIGHT / 2
+    brick.height = 20.0
+    assert brick.get_pick_frame().point.z == 60
+
+
+def test_collection_matches_bricks():
+    frames = [Frame([i * 300.0, 0, 0], [1, i, 0], [0, 1, 0]) for i in range(5)]
+    collection = BrickCollection.from_frames(frames, BigBrick)
+    points, xaxes, yaxes = collection.get_pick_frames()
+    for i, frame in enumerate(frames):
+        pick = BigBrick(frame.copy()).get_pick_frame()
+        assert np.allclose(points[i], list(pick.point))
+        assert np.allclose(xaxes[i], list(pick.xaxis))
+        assert np.allclose(yaxes[i], list(pick.yaxis))
+
+
+@pytest.mark.parametrize("bond", ["stack", "running", "flemish"])
+def test_generate_wall_along_a_line(bond):
+    line = Line([0, 0, 0], [2000, 0, 0])
+    wall = generate_wall(line, 3, BigBrick, bond=bond)
+    same = generate_wall(Polyline([[0, 0, 0], [2000, 0, 0]]), 3, BigBrick, bond=bond)
+    assert len(wall) > 0
+    np.testing.assert_allclose(wall.points, same.points)
+    np.testing.assert_allclose(wall.xaxes, same.xaxes)
+    assert set(np.round(wall.points[:, 2], 6)) == {0.0, BigBrick.HEIGHT, 2 * BigBrick.HEIGHT}
@@ -0,0 +1,25 @@
+from compas.geometry import Frame
+
+from build_planner import plan_home_returns, count_home_moves, count_baseline_home_moves
+
+PICK = Frame([-1258.6, -890.3, -107.8], [-1, 0, 0], [0, 1, 0])
+BASE_COLUMN = ((-500.0, -500.0, -1000.0), (500.0, 500.0, 3000.0))
+
+
+def test_transfers_around_the_base_go_home():
+    wobj = Frame([-1000.0, 500.0, 0.0], [1, 0, 0], [0, 1, 0])
+    places = [Frame([x, y, 0.0], [1, 0, 0], [0, 1, 0]) for x in (-200.0, 1800.0) for y in (0.0, 200.0)]
+    plan = plan_home_returns(PICK, places, wobj, [BASE_COLUMN], clearance=100.0)
+    assert plan == [(False, False), (False, False), (True, True), (True, True)]
+    assert count_home_moves(plan) == 5
+
+
+def test_unknown_work_object_always_goes_home():
+    places = [Frame([0.0, 0.0, 0.0], [1, 0, 0], [0, 1, 0])] * 3
+    assert plan_home_returns(PICK, places, None, [BASE_COLUMN]) == [(True, True)] * 3
+
+
+def test_baseline_home_moves():
+    # the original loop goes home before picking, after picking and after placing
+    assert count_baseline_home_moves(4) == 12
+    assert count_home_moves([(True, True)] * 4) == 9
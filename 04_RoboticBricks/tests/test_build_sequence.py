@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from compas.geometry import Frame
+
+from brick_wall import BigBrick
+from build_sequence import get_courses, get_supports, count_precedence_violations, sequence_bricks
+
+
+def running_bond(courses=4, per_course=10):
+    frames = []
+    for course in range(courses):
+        shift = (course % 2) * BigBrick.LENGTH / 2
+        for k in range(per_course):
+            frames.append(Frame([k * BigBrick.LENGTH + shift, 0, course * BigBrick.HEIGHT], [1, 0, 0], [0, 1, 0]))
+    return frames
+
+
+def test_get_courses():
+    np.testing.assert_array_equal(get_courses([10.0, 62.0, 114.0, 10.0], BigBrick.HEIGHT), [0, 1, 2, 0])
+    with pytest.raises(ValueError, match="Brick 1 is not on a course"):
+        get_courses([0.0, 26.0], BigBrick.HEIGHT)
+
+
+def test_supports_of_a_running_bond():
+    supports = get_supports(running_bond(2, 3), BigBrick.LENGTH, BigBrick.WIDTH, BigBrick.HEIGHT)
+    assert [sorted(s.tolist()) for s in supports] == [[], [], [], [0, 1], [1, 2], [2]]
+
+
+def test_valid_order_is_kept():
+    order, report = sequence_bricks(running_bond(), brick_cls=BigBrick)
+    assert order == list(range(40))
+    assert report == {"bricks": 40, "precedence_violations_before": 0, "moved": 0}
+
+
+def test_shuffled_wall_is_placed_course_by_course():
+    frames = running_bond()
+    permutation = np.random.default_rng(0).permutation(len(frames))
+    shuffled = [frames[i] for i in permutation]
+    order, report = sequence_bricks(shuffled, brick_cls=BigBrick)
+    supports = get_supports(shuffled, BigBrick.LENGTH, BigBrick.WIDTH, BigBrick.HEIGHT)
+    assert sorted(order) == list(range(len(frames)))
+    assert count_precedence_violations(order, supports) == 0
+    assert report["precedence_violations_before"] == count_precedence_violations(range(len(frames)), supports) > 0
+    # the bottom course needs no supports and keeps its file order
+    bottom = [i for i in order if shuffled[i].point.z == 0]
+    assert bottom == sorted(bottom)
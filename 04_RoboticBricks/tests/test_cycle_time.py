@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+import pytest
+
+import simple_comm
+import cycle_time
+from ur_emulator import UREmulator, HOME
+
+
+def test_trapezoid_times():
+    times, peaks = cycle_time.trapezoid_times(np.array([1.0, 0.001]), np.array([0.25, 0.25]), np.array([1.2, 1.2]))
+    np.testing.assert_allclose(times, [1.0 / 0.25 + 0.25 / 1.2, 2 * math.sqrt(0.001 / 1.2)])
+    np.testing.assert_allclose(peaks, [0.25, math.sqrt(1.2 * 0.001)])
+
+
+def test_blends_on_a_straight_line_do_not_slow_down():
+    points = np.array([[0, 0, 0], [500, 0, 0], [1000, 0, 0]], dtype=float)
+    stop = cycle_time.estimate_path_time(points, 1.2, 0.25)
+    blended = cycle_time.estimate_path_time(points, 1.2, 0.25, blend_radii=10.0)
+    single = cycle_time.estimate_path_time(points[[0, 2]], 1.2, 0.25)
+    assert stop["total_time"] == pytest.approx(2 * (0.5 / 0.25 + 0.25 / 1.2))
+    assert blended["total_time"] == pytest.approx(single["total_time"])
+    assert not blended["slow"].any()
+
+
+def test_small_blends_limit_the_corner_speed():
+    # a short segment between two 20 degree corners
+    directions = np.radians([0.0, 20.0, 40.0])
+    steps = np.column_stack((np.cos(directions), np.sin(directions), np.zeros(3))) * [[500.0], [40.0], [500.0]]
+    points = np.vstack(([0.0, 0.0, 0.0], np.cumsum(steps, axis=0)))
+    small = cycle_time.estimate_path_time(points, 1.2, 0.25, blend_radii=0.1)
+    np.testing.assert_array_equal(small["blend_limited"], [False, True, False])
+    required = small["required_radii"][1]
+    assert required == pytest.approx(0.25 ** 2 * math.tan(math.radians(10.0)) / 1.2 * 1000)
+    enough = cycle_time.estimate_path_time(points, 1.2, 0.25, blend_radii=required * 1.01)
+    assert not enough["slow"].any()
+    assert enough["total_time"] < small["total_time"]
+
+
+def test_script_time_matches_the_emulator():
+    emulator = UREmulator(frequency=500.0)
+    pose = emulator.tool_poses(np.array([[0.3, -1.2, 1.4, -0.5, 0.8, 0.2]]))[0]
+    lines = [
+        "movej([0.3,-1.2,1.4,-0.5,0.8,0.2], a = 1.40, v = 1.05)",
+        "movel(p[%.4f,%.4f,%.4f,%.4f,%.4f,%.4f], a = 1.20, v = 0.25)" % tuple(pose + [0.1, 0, 0, 0, 0, 0]),
+        "sleep(0.5)",
+        "movel(p[%.4f,%.4f,%.4f,%.4f,%.4f,%.4f], a = 1.20, v = 0.25)" % tuple(pose + [0.1, 0.1, 0, 0, 0, 0]),
+        "popup(\"done\")",
+    ]
+    report = cycle_time.estimate_script_time("\n".join(lines), joints=HOME)
+    assert report["commands"] == 4
+    assert report["unknown"] == 0
+    assert report["unsupported"] == ["popup(\"done\")"]
+
+    emulator.load(lines)
+    steps = 0
+    while emulator.program_state != simple_comm.PROGRAM_STOPPED:
+        emulator.step()
+        steps += 1
+    # the emulator rounds every move up to whole control periods
+    assert steps * emulator.dt == pytest.approx(report["total_time"], abs=4 * emulator.dt)
+
+    unknown = cycle_time.estimate_script_time("\n".join(lines))
+    assert unknown["unknown"] == 1
+    assert unknown["total_time"] == pytest.approx(report["total_time"] - report["times"][0])
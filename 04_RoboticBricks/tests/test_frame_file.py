@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from compas.geometry import Frame
+
+import frame_file
+from frame_file import FrameArray
+
+
+def frames(n=10):
+    return [Frame([i, 2 * i, 3 * i], [1, i, 0], [0, 1, i]) for i in range(n)]
+
+
+def test_round_trip(tmp_path):
+    data = {"wobj": "w_pallet0", "brick_type": "BigBrick", "frames": frames()}
+    filename = tmp_path / "frames.bin"
+    frame_file.dump_frames(data, filename)
+    for mmap in (True, False):
+        loaded = frame_file.load_frames(filename, mmap=mmap)
+        assert loaded["wobj"] == "w_pallet0" and loaded["brick_type"] == "BigBrick"
+        assert list(loaded["frames"]) == data["frames"]
+    assert list(frame_file.iter_frames(filename, chunk_size=3)) == data["frames"]
+
+
+def test_indexing():
+    array = FrameArray.from_frames(frames())
+    assert array[3] == frames()[3]
+    assert array[np.int64(-1)] == frames()[-1]
+    assert list(array[2:5]) == frames()[2:5]
+    assert list(array[[1, 7, 3]]) == [frames()[i] for i in (1, 7, 3)]
+    assert list(array[np.array([0, 9])]) == [frames()[0], frames()[9]]
+    mask = np.arange(10) % 3 == 0
+    assert list(array[mask]) == [frames()[i] for i in (0, 3, 6, 9)]
+    assert len(array[[]]) == 0
+
+
+@pytest.mark.parametrize("index", [1.5, True, [[0, 1]], [0.5]])
+def test_invalid_indices(index):
+    with pytest.raises(IndexError):
+        FrameArray.from_frames(frames())[index]
+
+
+@pytest.mark.parametrize("cut", [1, 72, 100])
+def test_truncated_file(tmp_path, cut):
+    filename = tmp_path / "frames.bin"
+    frame_file.dump_frames({"frames": frames()}, filename)
+    with open(filename, "r+b") as f:
+        f.truncate(filename.stat().st_size - cut)
+    with pytest.raises(EOFError, match="of 10 frames"):
+        list(frame_file.iter_frames(filename, chunk_size=4))
+    for mmap in (True, False):
+        with pytest.raises(EOFError, match="of 10 frames"):
+            frame_file.load_frames(filename, mmap=mmap)
@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+import pytest
+import compas.geometry as cg
+
+import simple_ur_script
+import path_simplify
+
+
+def spiral(n=2000, turns=4.0):
+    t = np.linspace(0, 2 * math.pi * turns, n)
+    return np.column_stack((300 * np.cos(t) * t / t[-1], 300 * np.sin(t) * t / t[-1] - 450, 200 + t))
+
+
+def as_frames(points):
+    return [cg.Frame(p, [1, 0, 0], [0, -1, 0]) for p in points.tolist()]
+
+
+@pytest.mark.parametrize("blend_radii", [None, 0.0, 2.5, -1.0, "list"])
+@pytest.mark.parametrize("kind", ["frames", "points", "arrays"])
+def test_program_bytes_matches_move_l_many(kind, blend_radii):
+    rng = np.random.default_rng(0)
+    points = np.vstack((spiral(300), rng.uniform(-12000, 12000, (50, 3)), np.zeros((2, 3)), [[-0.04, 0.04, -0.00004]]))
+    frames = {
+        "frames": as_frames(points),
+        "points": points,
+        "arrays": np.stack((points, rng.normal(size=(len(points), 3)), rng.normal(size=(len(points), 3))), axis=1),
+    }[kind]
+    if blend_radii == "list":
+        blend_radii = rng.uniform(-5, 50000, len(points))
+    for accel, vel in ((1.2, 0.25), (10, -10), (0.005, 0.004)):
+        expected = len(simple_ur_script.move_l_many(frames, accel, vel, blend_radii).encode("utf-8"))
+        assert path_simplify.program_bytes(frames, accel, vel, blend_radii) == expected
+
+
+def test_simplify_path_stays_within_tolerance():
+    points = spiral()
+    result, report = path_simplify.simplify_path(points, tolerance=0.1)
+    assert report["points_before"] == len(points)
+    assert report["points_after"] == len(result) < len(points) / 2
+    assert report["bytes_after"] == path_simplify.program_bytes(result, 1.0, 0.1)
+    # every input point is within tolerance of the simplified polyline
+    for point in points[::7]:
+        a, b = result[:-1], result[1:]
+        t = np.clip(np.einsum("ij,ij->i", point - a, b - a) / np.einsum("ij,ij->i", b - a, b - a), 0, 1)
+        assert np.linalg.norm(a + (b - a) * t[:, None] - point, axis=1).min() <= 0.1 + 1e-9
+
+
+def test_rdp_matches_recursive_rdp():
+    def recursive(points, start, end, tolerance, keep):
+        a, b = points[start], points[end]
+        chord = b - a
+        inner = points[start + 1:end]
+        if len(inner) == 0:
+            return
+        t = np.clip((inner - a) @ chord / (chord @ chord), 0, 1)
+        distance = np.linalg.norm(a + chord * t[:, None] - inner, axis=1)
+        worst = int(np.argmax(distance))
+        if distance[worst] > tolerance:
+            keep.add(start + 1 + worst)
+            recursive(points, start, start + 1 + worst, tolerance, keep)
+            recursive(points, start + 1 + worst, end, tolerance, keep)
+
+    points = spiral(500) + np.random.default_rng(1).normal(0, 0.05, (500, 3))
+    keep = {0, len(points) - 1}
+    recursive(points, 0, len(points) - 1, 0.2, keep)
+    np.testing.assert_array_equal(path_simplify.rdp(points, tolerance=0.2, chunk_size=None), sorted(keep))
+
+
+def test_merge_collinear():
+    points = np.array([[0, 0, 0], [0, 0, 0], [10, 0, 0], [20, 0, 0], [20, 10, 0], [20, 10, 0]], dtype=float)
+    rotations = np.repeat(np.eye(3)[None], len(points), axis=0)
+    np.testing.assert_array_equal(path_simplify.merge_collinear(points, rotations), [0, 3, 4])
+
+
+@pytest.mark.parametrize("spacing", [None, 5.0])
+def test_simplify_path_with_blend_radius_per_frame(spacing):
+    frames = as_frames(spiral(500))
+    radii = np.linspace(0.5, 3.0, len(frames))
+    result, report = path_simplify.simplify_path(frames, spacing=spacing, blend_radius=radii.tolist())
+    assert report["points_after"] == len(result) > 0
+    assert report["bytes_before"] == len(simple_ur_script.move_l_many(frames, 1.0, 0.1, radii))
+    if spacing is None:
+        kept = [frames.index(frame) for frame in result]
+        assert report["bytes_after"] == len(simple_ur_script.move_l_many(result, 1.0, 0.1, radii[kept]))
+
+
+@pytest.mark.parametrize("empty", [[], np.zeros((0, 3))])
+def test_simplify_path_empty(empty):
+    result, report = path_simplify.simplify_path(empty)
+    assert len(result) == 0
+    assert report == {"points_before": 0, "points_after": 0, "bytes_before": 0, "bytes_after": 0}
+    assert len(path_simplify.rdp(np.zeros((0, 3)))) == 0
+
+
+def test_resample_keeps_corners():
+    points = np.array([[0, 0, 0], [100, 0, 0], [100, 100, 0]], dtype=float)
+    rotations = np.repeat(np.eye(3)[None], 3, axis=0)
+    new_points, new_rotations = path_simplify.resample(points, rotations, 30.0)
+    assert len(new_points) == 9
+    assert any(np.allclose(point, [100, 0, 0]) for point in new_points)
+    assert np.allclose(np.linalg.norm(np.diff(new_points, axis=0), axis=1), 25.0)
@@ -0,0 +1,206 @@
+import numpy as np
+import pytest
+
+import simple_comm
+from ur_emulator import UREmulator
+
+# Byte offsets from the UR real-time interface documentation (Client_Interface_V3.x / 5.x)
+DOCUMENTED_OFFSETS = {
+    "time": 4, "q_target": 12, "qd_target": 60, "qdd_target": 108, "i_target": 156, "m_target": 204,
+    "q_actual": 252, "qd_actual": 300, "i_actual": 348, "tcp_force": 540, "digital_inputs": 684,
+    "motor_temperatures": 692, "controller_timer": 740, "test_value": 748, "robot_mode": 756, "joint_modes": 764,
+}
+DOCUMENTED_OFFSETS_V3 = dict(DOCUMENTED_OFFSETS, **{
+    "i_control": 396, "tool_vector_actual": 444, "tcp_speed_actual": 492, "tool_vector_target": 588,
+    "tcp_speed_target": 636, "safety_mode": 812, "tool_accelerometer": 868, "speed_scaling": 940,
+    "linear_momentum_norm": 948, "v_main": 972, "v_robot": 980, "i_robot": 988, "v_actual": 996,
+})
+LAYOUTS = {
+    "1.8": (812, dict(DOCUMENTED_OFFSETS, tool_accelerometer=396, tool_vector=588, tcp_speed=636)),
+    "3.0-3.1": (1044, DOCUMENTED_OFFSETS_V3),
+    "3.2-3.4": (1060, dict(DOCUMENTED_OFFSETS_V3, digital_outputs=1044, program_state=1052)),
+    "3.5-3.9": (1108, dict(DOCUMENTED_OFFSETS_V3, digital_outputs=1044, program_state=1052,
+                           elbow_position=1060, elbow_velocity=1084)),
+    "3.10+/5.x": (1116, dict(DOCUMENTED_OFFSETS_V3, digital_outputs=1044, program_state=1052,
+                             elbow_position=1060, elbow_velocity=1084, safety_status=1108)),
+}
+
+
+@pytest.mark.parametrize("layout", simple_comm.RT_LAYOUTS, ids=lambda layout: layout.name)
+def test_rt_layout_offsets(layout):
+    length, offsets = LAYOUTS[layout.name]
+    assert layout.length == layout.struct.size == layout.dtype.itemsize == length
+    for name, offset in offsets.items():
+        assert layout.dtype.fields[name][1] == offset, name
+
+
+@pytest.mark.parametrize("layout", simple_comm.RT_LAYOUTS, ids=lambda layout: layout.name)
+def test_decode_rt_packet(layout):
+    packet = np.zeros(1, dtype=layout.dtype)
+    packet["message_size"] = layout.length
+    packet["time"] = 12.5
+    packet["q_actual"] = np.arange(6) / 10
+    packet["tcp_force"] = -np.arange(6)
+    assert simple_comm.get_rt_layout(layout.length) is layout
+    decoded = simple_comm.decode_rt_packet(packet.tobytes())
+    assert decoded["message_size"] == layout.length
+    assert decoded["time"] == 12.5
+    assert decoded["q_actual"] == tuple(np.arange(6) / 10)
+    assert decoded["tcp_force"] == tuple(-np.arange(6.0))
+
+    log = simple_comm.decode_rt_log(np.repeat(packet, 3).tobytes())
+    assert len(log) == 3
+    np.testing.assert_array_equal(log["q_actual"], np.tile(np.arange(6) / 10, (3, 1)))
+
+
+def test_get_rt_layout_takes_longest_fitting_layout():
+    assert simple_comm.get_rt_layout(1200).name == "3.10+/5.x"
+    assert simple_comm.get_rt_layout(1100).name == "3.2-3.4"
+    with pytest.raises(ValueError):
+        simple_comm.get_rt_layout(100)
+
+
+def test_realtime_reader_offsets_match_layouts():
+    layout = simple_comm.get_rt_layout(1060)
+    names = {"time": "controller_timer", "q_target": "q_target", "q_actual": "q_actual", "tcp_force": "tcp_force",
+             "tool_vector": "tool_vector_target", "program_state": "program_state"}
+    for name, field in names.items():
+        assert simple_comm.RT_FIELDS_PROGRAM_DTYPE.fields[name][1] == layout.dtype.fields[field][1], name
+
+
+def test_connection_stays_open_and_reconnects():
+    script = simple_comm.concatenate_script(["sleep(0.01)\n"])
+    with UREmulator(script_port=30112, realtime_port=30113) as emulator, \
+            simple_comm.URConnection("127.0.0.1", port=30112, backoff=0.01) as ur:
+        ur.send(script)
+        connection = ur.socket
+        ur.send(script.encode("utf-8"))
+        assert ur.socket is connection
+        assert simple_comm._wait_for(lambda: emulator.programs == 2, 2.0, 0.01)
+    # the controller restarts, the next send reconnects
+    with UREmulator(script_port=30112, realtime_port=30113) as emulator:
+        ur.send(script)
+        assert simple_comm._wait_for(lambda: emulator.programs == 1, 2.0, 0.01)
+    ur.close()
+    stats = ur.stats()
+    assert stats["scripts_sent"] == 3
+    assert stats["bytes_sent"] == 3 * len(script)
+    assert 0 < stats["mean_sendall_time"] and 0 < stats["last_sendall_time"]
+
+
+def test_connection_errors():
+    ur = simple_comm.URConnection("127.0.0.1", port=30119, retries=2, backoff=0.01)
+    with pytest.raises(OSError):
+        ur.connect()
+    assert not ur.is_connected
+    with pytest.raises(Exception, match="Program too long"):
+        ur.send(b" " * (simple_comm.URConnection.MAX_SIZE + 1))
+
+
+@pytest.mark.parametrize("length", [812, 1044, 1116])
+def test_realtime_reader_ring_buffer(length):
+    with UREmulator(realtime_port=30123, script_port=30122, frequency=125.0, packet_length=length, time_scale=10.0), \
+            simple_comm.RealtimeReader("127.0.0.1", port=30123, size=64) as rt:
+        assert simple_comm._wait_for(lambda: rt.packets > 100, 5.0, 0.01)
+        rt.stop()
+        assert rt.error is None and rt.skipped == 0
+        history = rt.history()
+        assert len(history) == 64
+        np.testing.assert_allclose(np.diff(history["time"]), 1 / 125.0)
+        np.testing.assert_array_equal(rt.history(n=10)["time"], history["time"][-10:])
+        assert len(rt.history(duration=0.04)) == 6
+        assert (np.isnan(history["program_state"]) == (length < 1060)).all()
+
+        latest = rt.latest()
+        np.testing.assert_array_equal(latest["q_actual"], history[-1]["q_actual"])
+        latest["time"] = -1.0
+        assert rt.latest()["time"] == history[-1]["time"]
+
+
+def program(n_moves, tcp_every=None):
+    lines = []
+    for i in range(n_moves):
+        if tcp_every and i % tcp_every == 0:
+            lines.append("set_tcp(p[0,0,%.3f,0,0,0])\n" % (i / 1000))
+        blend = ", r = 0.0010" if i % 3 else ""
+        lines.append("movel(p[%.4f,0.1000,0.2000,0.0000,3.1400,0.0000], a = 1.00, v = 0.10%s)\n" % (i / 1e4, blend))
+    return lines
+
+
+def test_split_script_fits_and_keeps_every_line():
+    lines = program(2000, tcp_every=150)
+    chunks = simple_comm.split_script(lines, max_size=5000)
+    assert len(chunks) > 1
+    moves = []
+    for chunk in chunks:
+        assert len(simple_comm.ScriptBuilder(chunk).build().encode("utf-8")) <= 5000
+        # chunks end after a non-blended move
+        assert ", r = " not in chunk[-1] or chunk is chunks[-1]
+        moves.extend(line for line in chunk if line.startswith("movel"))
+    assert moves == [line for line in lines if line.startswith("movel")]
+
+
+def test_split_script_repeats_active_tcp():
+    lines = program(1000, tcp_every=400)
+    chunks = simple_comm.split_script(lines, max_size=5000)
+    for chunk in chunks[1:]:
+        first_move = next(i for i, line in enumerate(chunk) if line.startswith("movel"))
+        assert any(line.startswith("set_tcp") for line in chunk[:first_move + 1])
+
+
+def test_split_script_raises_without_safe_point():
+    lines = ["movel(p[0,0,0,0,0,0], a = 1.00, v = 0.10, r = 0.0010)\n"] * 1000
+    with pytest.raises(ValueError):
+        simple_comm.split_script(lines, max_size=5000)
+
+
+def test_split_script_single_chunk():
+    lines = program(10)
+    assert simple_comm.split_script(lines) == [lines]
+
+
+def on_line(poses, start, length=0.3):
+    # between the ends of a line along x from start
+    x = poses[:, 0] - start[0]
+    return np.all(np.abs(poses[:, 1:] - start[1:]) < 1e-5, axis=1) & (x > 1e-4) & (x < length - 1e-4)
+
+
+def test_send_script_streamed_does_not_stop_between_chunks():
+    joints = [0.3, -1.2, 1.4, -0.5, 0.8, 0.2]
+    with UREmulator(frequency=125.0, script_port=30132, realtime_port=30133, time_scale=20.0) as emulator, \
+            simple_comm.RealtimeReader("127.0.0.1", port=30133, size=8192) as rt:
+        pose = emulator.tool_poses(np.array([joints]))[0]
+        lines = ["movej([%s], a = 1.4, v = 1.05)\n" % ",".join(map(str, joints))]
+        for k in range(1, 301):
+            target = pose + [0.001 * k, 0, 0, 0, 0, 0]
+            lines.append("movel(p[%s], a = 1.2, v = 0.25, r = %s)\n" % (",".join(map(str, target)), 0.0004 * (k < 300)))
+        lines += ["set_digital_out(2, True)\n", "sleep(0.1)\n"]
+        progress = []
+        stats = simple_comm.send_script_streamed(lines, "127.0.0.1", "127.0.0.1", port=30130, script_port=30132,
+                                                 timeout=2.0, chunk_size=400,
+                                                 callback=lambda sent, total: progress.append((sent, total)))
+        assert simple_comm._wait_for(lambda: emulator.program_state == simple_comm.PROGRAM_STOPPED, 5.0, 0.01)
+        samples = rt.history()
+    simple_comm.close_connections()
+
+    assert stats["commands"] == len(lines)
+    assert stats["bytes_sent"] == (len(lines) + 1) * 40
+    assert len(progress) == len(range(0, stats["bytes_sent"], 400))
+    assert progress[-1] == (stats["bytes_sent"], stats["bytes_sent"])
+    np.testing.assert_allclose(emulator.tool_poses(emulator.joints[None])[0], pose + [0.3, 0, 0, 0, 0, 0], atol=1e-4)
+    assert emulator.fault is None
+    assert emulator.digital_outputs == 1 << 2
+    assert emulator.programs == 1
+
+    # the robot runs the line without stopping, across every chunk of the stream,
+    # in as many control periods as the same program loaded at once
+    offline = UREmulator(frequency=125.0)
+    offline.load(lines)
+    poses = []
+    while offline.program_state != simple_comm.PROGRAM_STOPPED:
+        offline.step()
+        poses.append(offline.pose)
+    streamed = np.flatnonzero(on_line(samples["tool_vector"], pose))
+    assert np.all(np.diff(streamed) == 1)
+    assert np.all(np.diff(samples["tool_vector"][streamed, 0]) > 0)
+    assert len(streamed) == np.sum(on_line(np.array(poses), pose))
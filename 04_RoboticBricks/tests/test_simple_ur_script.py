@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+import compas.geometry as cg
+
+import utils
+import simple_comm
+import simple_ur_script
+
+
+def random_frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-800, 800, (n, 3))
+    axes = rng.normal(size=(n, 2, 3))
+    return [cg.Frame(p, x, y) for p, (x, y) in zip(points.tolist(), axes.tolist())]
+
+
+def reference_pose(frame):
+    # Pose as the per-frame functions computed it before move_l_many
+    axis_angle = utils.matrix_to_axis_angle(cg.Transformation.from_frame_to_frame(cg.Frame.worldXY(), frame))
+    return tuple([frame.point.x / 1000, frame.point.y / 1000, frame.point.z / 1000] + list(axis_angle))
+
+
+def reference_move_l(frame, accel, vel, blend_radius=None):
+    pose = "p[" + ",".join("%.4f" % value for value in reference_pose(frame)) + "]"
+    if blend_radius is None:
+        return "movel(%s, a = %.2f, v = %.2f)\n" % (pose, accel, vel)
+    return "movel(%s, a = %.2f, v = %.2f, r = %.4f)\n" % (pose, accel, vel, max(0, blend_radius) / 1000)
+
+
+def test_move_l_many_matches_move_l():
+    frames = random_frames(500)
+    simple_ur_script.POSE_CACHE.clear()
+    expected = "".join(simple_ur_script.move_l(frame, 1.2, 0.25) for frame in frames)
+    assert simple_ur_script.move_l_many(frames, 1.2, 0.25) == expected
+    assert expected == "".join(reference_move_l(frame, 1.2, 0.25) for frame in frames)
+
+
+@pytest.mark.parametrize("radii", [2.5, "list"])
+def test_move_l_many_matches_move_l_blend(radii):
+    frames = random_frames(200, seed=1)
+    if radii == "list":
+        radii = np.random.default_rng(2).uniform(-1.0, 5.0, len(frames)).tolist()
+    per_frame = np.broadcast_to(radii, (len(frames),)).tolist()
+    simple_ur_script.POSE_CACHE.clear()
+    expected = "".join(simple_ur_script.move_l_blend(f, 1.2, 0.25, r) for f, r in zip(frames, per_frame))
+    assert simple_ur_script.move_l_many(frames, 1.2, 0.25, radii) == expected
+    assert expected == "".join(reference_move_l(f, 1.2, 0.25, r) for f, r in zip(frames, per_frame))
+
+
+def test_move_l_many_clamps_like_move_l():
+    frames = random_frames(5)
+    expected = "".join(simple_ur_script.move_l(frame, -10, 10) for frame in frames)
+    assert simple_ur_script.move_l_many(frames, -10, 10) == expected
+
+
+def test_move_l_many_takes_arrays():
+    frames = random_frames(50, seed=3)
+    array = np.array([[list(f.point), list(f.xaxis), list(f.yaxis)] for f in frames])
+    assert simple_ur_script.move_l_many(array, 1.0, 0.1) == simple_ur_script.move_l_many(frames, 1.0, 0.1)
+    points = array[:, 0]
+    flat = [cg.Frame(p, [1, 0, 0], [0, 1, 0]) for p in points.tolist()]
+    assert simple_ur_script.move_l_many(points, 1.0, 0.1) == simple_ur_script.move_l_many(flat, 1.0, 0.1)
+
+
+def reference_concatenate_script(list_ur_commands):
+    # concatenate_script before ScriptBuilder
+    ur_script = "\ndef my_script():\n"
+    for line in "".join(list_ur_commands).split("\n"):
+        ur_script += "\t" + line + "\n"
+    return ur_script + "end\n" + "\nmy_script()\n"
+
+
+def test_script_builder_matches_concatenation():
+    commands = [simple_ur_script.move_l(frame, 1.0, 0.1) for frame in random_frames(300, seed=4)]
+    commands.insert(10, simple_ur_script.set_digital_out(2, True))
+    expected = reference_concatenate_script(commands)
+    assert simple_comm.concatenate_script(commands) == expected
+    builder = simple_comm.ScriptBuilder(commands)
+    assert builder.build() == expected
+    assert b"".join(builder.chunks(chunk_size=1000)).decode("utf-8") == expected
+
+
+def test_move_l_list_has_the_poses_of_move_l_many():
+    frames = random_frames(20, seed=5)
+    script = simple_ur_script.move_l_list(frames, 1.0, 0.1, 2.0)
+    values = script.split("\n")[0].split(" = ", 1)[1].replace("p[", "").replace("]", "").replace("[", "")
+    poses = np.array(values.split(","), dtype=float).reshape(-1, 6)
+    np.testing.assert_array_equal(poses, np.round(simple_ur_script.pose_array(frames), 4))
+    assert "while (poses_i < 20):" in script
+
+
+def test_pack_poses():
+    frames = random_frames(20, seed=6)
+    data = np.frombuffer(simple_ur_script.pack_poses(frames, 3.0), dtype=">f4").reshape(-1, 7)
+    np.testing.assert_array_equal(data[:, :6], simple_ur_script.pose_array(frames).astype(np.float32))
+    np.testing.assert_array_equal(data[:, 6], np.float32(0.003))
+
+
+def test_pack_commands_round_trip():
+    lines = [simple_ur_script.set_tcp_by_angles(0, 0, 150, 0, 0, 0),
+             simple_ur_script.move_j([0.1, -1.2, 1.3, -0.4, 0.5, 0.6], 1.4, 1.05)]
+    lines += simple_ur_script.move_l_many(random_frames(20, seed=7), 1.2, 0.25, 2.0).splitlines(True)
+    lines += [simple_ur_script.sleep(0.5), simple_ur_script.set_digital_out(3, True), "\n"]
+    commands = simple_ur_script.unpack_commands(simple_ur_script.pack_commands(lines))
+    expected = [simple_ur_script.parse_command(line) for line in lines if line.strip()]
+    assert len(commands) == len(expected) + 1 and commands[-1] is None
+    for command, reference in zip(commands, expected):
+        assert command[0] == reference[0]
+        np.testing.assert_allclose(np.hstack(command[1:]).astype(float), np.hstack(reference[1:]).astype(float),
+                                   rtol=1e-6, atol=1e-6)
+
+
+def test_pack_commands_rejects_other_statements():
+    with pytest.raises(ValueError, match="Cannot stream 'popup"):
+        simple_ur_script.pack_commands([simple_ur_script.popup("hello", "title")])
+
+
+def test_command_stream_reads_whole_records():
+    script = simple_ur_script.command_stream("192.168.10.20", 30010)
+    assert script.startswith('socket_open("192.168.10.20", 30010, "commands")\n')
+    assert 'commands_v = socket_read_binary_float(%d, "commands")' % simple_ur_script.COMMAND_RECORD_SIZE in script
+    assert script.count("\n  end\n") == 2 and script.endswith('end\nsocket_close("commands")\n')
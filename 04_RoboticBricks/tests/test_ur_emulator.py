@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import simple_comm
+import simple_ur_script
+import ur_emulator
+from ur_emulator import UREmulator, parse_command, ScriptReader
+
+JOINTS = [0.3, -1.2, 1.4, -0.5, 0.8, 0.2]
+
+
+def run(emulator, lines, max_steps=100000):
+    emulator.load(lines)
+    for _ in range(max_steps):
+        emulator.step()
+        if emulator.program_state == simple_comm.PROGRAM_STOPPED:
+            return
+    raise AssertionError("program did not finish")
+
+
+def test_parse_command():
+    assert parse_command("movel(p[0.1,0.2,0.3,0,3.14,0], a = 1.20, v = 0.25, r = 0.0020)") == (
+        "movel", [0.1, 0.2, 0.3, 0.0, 3.14, 0.0], 1.2, 0.25, 0.002)
+    assert parse_command("movej([0,1,2,3,4,5])") == ("movej", [0.0, 1.0, 2.0, 3.0, 4.0, 5.0], 1.4, 1.05, 0.0)
+    assert parse_command("set_tcp(p[0,0,0.15,0,0,0])") == ("set_tcp", [0.0, 0.0, 0.15, 0.0, 0.0, 0.0])
+    assert parse_command("sleep(0.5)") == ("sleep", 0.5)
+    assert parse_command("set_digital_out(2, True)") == ("set_digital_out", 2, True)
+    assert parse_command("popup(\"hello\")") is None
+    assert parse_command("movel(p[0,0,0], a = 1.0, v = 0.1)") is None
+
+
+def test_script_reader_runs_complete_programs():
+    reader = ScriptReader()
+    assert reader.feed("\ndef my_script():\n\tmovej([0,0,0,0,0,0])\n\tsle") == []
+    assert reader.feed("ep(1.0)\nend\n\nmy_script()\nset_digital_out(1, True)\n") == [
+        ["\tmovej([0,0,0,0,0,0])", "\tsleep(1.0)"], ["set_digital_out(1, True)"]]
+
+
+def test_trapezoid_reaches_the_end():
+    s = ur_emulator.trapezoid(1.0, 0.25, 1.2, 0.002)
+    assert s[-1] == pytest.approx(1.0)
+    assert np.all(np.diff(s) >= 0)
+    assert np.max(np.diff(s)) <= 0.25 * 0.002 + 1e-12
+    assert len(s) * 0.002 == pytest.approx(1.0 / 0.25 + 0.25 / 1.2, abs=0.004)
+
+
+def test_program_moves_the_robot():
+    emulator = UREmulator(frequency=125.0)
+    pose = emulator.tool_poses(np.array([JOINTS]))[0]
+    run(emulator, ["movej([%s], a = 1.4, v = 1.05)" % ",".join(map(str, JOINTS)),
+                   "set_digital_out(3, True)", "movel(p[%s], a = 1.2, v = 0.25)" % ",".join(map(str, pose))])
+    np.testing.assert_allclose(emulator.joints, JOINTS, atol=1e-6)
+    assert emulator.digital_outputs == 1 << 3
+    assert emulator.programs == 1
+
+    packet = simple_comm.decode_rt_packet(emulator.packet())
+    np.testing.assert_allclose(packet["q_actual"], JOINTS, atol=1e-6)
+    np.testing.assert_allclose(packet["tool_vector_actual"], pose, atol=1e-6)
+    assert packet["program_state"] == simple_comm.PROGRAM_STOPPED
+    assert packet["safety_mode"] == ur_emulator.SAFETY_MODE_NORMAL
+
+
+def test_unreachable_move_is_a_protective_stop():
+    emulator = UREmulator(frequency=125.0)
+    run(emulator, ["movel(p[5.0,0,0.5,0,3.14,0], a = 1.2, v = 0.25)"])
+    assert emulator.fault is not None
+    packet = simple_comm.decode_rt_packet(emulator.packet())
+    assert packet["safety_mode"] == ur_emulator.SAFETY_MODE_PROTECTIVE_STOP
+    run(emulator, ["sleep(0.1)"])
+    assert emulator.fault is None
+
+
+def test_script_and_realtime_sockets():
+    with UREmulator(script_port=30102, realtime_port=30103, time_scale=10.0) as emulator:
+        with simple_comm.RealtimeReader("127.0.0.1", port=30103) as rt, \
+                simple_comm.URConnection("127.0.0.1", port=30102) as ur:
+            ur.send(simple_comm.concatenate_script(["movej([%s])\n" % ",".join(map(str, JOINTS))]))
+            assert simple_comm._wait_for(lambda: emulator.programs == 1, 2.0, 0.01)
+            assert simple_comm._wait_for(lambda: emulator.program_state == simple_comm.PROGRAM_STOPPED, 5.0, 0.01)
+            assert simple_comm._wait_for(lambda: np.allclose(rt.latest()["q_actual"], JOINTS, atol=1e-6), 1.0, 0.01)
+
+
+def test_find_command_stream():
+    program = simple_comm.ScriptBuilder(simple_ur_script.command_stream("10.0.0.5", 30010)).build()
+    assert ur_emulator.find_command_stream(program.splitlines()) == ("10.0.0.5", 30010)
+    assert ur_emulator.find_command_stream(['socket_open("10.0.0.5", 30010, "other")', "movej([0,0,0,0,0,0])"]) is None
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import compas.geometry as cg
+
+import utils
+import ur_kinematics
+
+
+@pytest.mark.parametrize("robot", sorted(ur_kinematics.UR_DH))
+def test_forward_kinematics_matches_dh_chain(robot):
+    joints = ur_kinematics.sample_joint_space(50, seed=0)
+    d, a, alpha = ur_kinematics.get_dh_parameters(robot)
+    expected = []
+    for q in joints:
+        matrix = np.eye(4)
+        for i in range(6):
+            matrix = matrix @ np.array(utils.dh_matrix(d[i], q[i], a[i], alpha[i]))
+        expected.append(matrix)
+    np.testing.assert_allclose(ur_kinematics.forward_kinematics(joints, robot), expected, atol=1e-9)
+
+
+@pytest.mark.parametrize("robot", sorted(ur_kinematics.UR_DH))
+def test_inverse_kinematics_round_trip(robot):
+    joints = ur_kinematics.sample_joint_space(500, seed=1)
+    poses = ur_kinematics.forward_kinematics(joints, robot)
+    solutions = ur_kinematics.inverse_kinematics(poses, robot)
+    assert solutions.shape == (500, 8, 6)
+
+    # every valid solution reaches the pose
+    valid = ~np.isnan(solutions).any(axis=2)
+    assert valid.any(axis=1).all()
+    reached = ur_kinematics.forward_kinematics(solutions[valid], robot)
+    np.testing.assert_allclose(reached, np.repeat(poses[:, None], 8, axis=1)[valid], atol=1e-6)
+
+    # and the sampled configuration is one of them
+    wrapped = np.angle(np.exp(1j * joints))
+    difference = np.abs(np.angle(np.exp(1j * (solutions - wrapped[:, None])))).max(axis=2)
+    assert (np.nanmin(difference, axis=1) < 1e-6).all()
+
+
+def test_inverse_kinematics_with_tcp_and_base():
+    tcp = cg.Frame([0, 0, 150], [1, 0, 0], [0, 1, 0])
+    base = cg.Frame([500, -200, 100], [0, 1, 0], [-1, 0, 0])
+    joints = ur_kinematics.sample_joint_space(50, seed=2)
+    poses = ur_kinematics.forward_kinematics(joints, tcp=tcp, base=base)
+    solutions = ur_kinematics.inverse_kinematics(poses, tcp=tcp, base=base)
+    valid = ~np.isnan(solutions).any(axis=2)
+    reached = ur_kinematics.forward_kinematics(solutions[valid], tcp=tcp, base=base)
+    np.testing.assert_allclose(reached, np.repeat(poses[:, None], 8, axis=1)[valid], atol=1e-6)
+
+
+def test_joint_path_follows_a_continuous_path():
+    q = np.linspace([0.3, -1.2, 1.4, -0.5, 0.8, 0.2], [0.6, -1.0, 1.2, -0.8, 1.0, 0.5], 50)
+    path = ur_kinematics.joint_path(ur_kinematics.forward_kinematics(q), q0=q[0])
+    np.testing.assert_allclose(path, q, atol=1e-6)
+
+
+def test_joint_path_raises_on_large_steps():
+    q = np.array([[0.3, -1.2, 1.4, -0.5, 0.8, 0.2], [0.35, -1.2, 1.4, -0.5, 0.8, 0.2], [2.35, -1.2, 1.4, -0.5, 0.8, 0.2]])
+    poses = ur_kinematics.forward_kinematics(q)
+    with pytest.raises(ValueError, match="Configuration flip before target 2"):
+        ur_kinematics.joint_path(poses, q0=q[0], max_step=1.0)
+    np.testing.assert_allclose(ur_kinematics.joint_path(poses, q0=q[0], max_step=None), q, atol=1e-6)
+    # without q0 the step from the zero configuration is not checked
+    ur_kinematics.joint_path(poses[2:], max_step=1.0)
+
+
+def test_joint_path_raises_on_unreachable_targets():
+    poses = ur_kinematics.forward_kinematics(np.array([[0.3, -1.2, 1.4, -0.5, 0.8, 0.2]] * 2))
+    poses[1, :3, 3] = [5000, 0, 0]
+    with pytest.raises(ValueError, match="Target 1 is not reachable"):
+        ur_kinematics.joint_path(poses)
@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+import pytest
+import compas.geometry as cg
+
+import utils
+
+ANGLES = [0.0, 1e-12, 1e-8, 1e-4, 0.5, math.pi / 2, math.pi - 1e-4, math.pi - 1e-8, math.pi]
+
+
+def rotation(axis, angle):
+    return np.array(cg.Rotation.from_axis_and_angle(axis, angle).matrix)
+
+
+def axes(n=20, seed=0):
+    rng = np.random.default_rng(seed)
+    axes = rng.normal(size=(n, 3))
+    axes = np.vstack((axes, np.eye(3), -np.eye(3)))
+    return axes / np.linalg.norm(axes, axis=1)[:, None]
+
+
+@pytest.mark.parametrize("angle", ANGLES)
+def test_matrix_to_axis_angle_accuracy(angle):
+    for axis in axes():
+        r = np.array(list(utils.matrix_to_axis_angle(rotation(axis.tolist(), angle))))
+        assert abs(np.linalg.norm(r) - angle) < 1e-9
+        if 1e-6 < angle < math.pi - 1e-6:
+            # unique away from 0 and pi, at pi the axis may point either way
+            np.testing.assert_allclose(r, axis * angle, atol=1e-9)
+        np.testing.assert_allclose(utils.axis_angles_to_matrices(r)[0], rotation(axis.tolist(), angle)[:3, :3], atol=1e-12)
+
+
+@pytest.mark.parametrize("angle", ANGLES)
+def test_matrices_to_axis_angles_matches_scalar(angle):
+    matrices = np.array([rotation(axis.tolist(), angle) for axis in axes(seed=1)])
+    batch = utils.matrices_to_axis_angles(matrices)
+    scalar = np.array([list(utils.matrix_to_axis_angle(m)) for m in matrices])
+    np.testing.assert_array_equal(batch, scalar)
+
+
+def test_axis_angle_round_trip():
+    rng = np.random.default_rng(2)
+    r = rng.normal(size=(1000, 3))
+    r *= rng.uniform(0, math.pi, (1000, 1)) / np.linalg.norm(r, axis=1)[:, None]
+    np.testing.assert_allclose(utils.matrices_to_axis_angles(utils.axis_angles_to_matrices(r)), r, atol=1e-12)
+
+
+def test_frames_to_arrays_matches_compas():
+    rng = np.random.default_rng(3)
+    frames = [cg.Frame(p, x, y) for p, x, y in zip(*rng.normal(size=(3, 50, 3)).tolist())]
+    points, rotations = utils.frames_to_arrays(frames)
+    for frame, point, matrix in zip(frames, points, rotations):
+        expected = np.array(cg.Transformation.from_frame_to_frame(cg.Frame.worldXY(), frame).matrix)
+        np.testing.assert_allclose(matrix, expected[:3, :3], atol=1e-12)
+        np.testing.assert_allclose(point, list(frame.point))
+
+
+def test_calculate_blend_radius_is_local():
+    # one short segment only limits the blends on either side of it
+    points = np.array([[0, 0, 0], [100, 0, 0], [100, 100, 0], [101, 100, 0], [101, 200, 0], [201, 200, 0], [201, 300, 0]])
+    radii = utils.calculate_blend_radius(points, 10.0)
+    np.testing.assert_allclose(radii, [10.0, 10.0, 0.5, 0.5, 10.0, 10.0, 0.0])